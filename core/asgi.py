@@ -2,6 +2,11 @@
 ASGI config for core project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with uvicorn so long-lived responses such as
+``/api/portfolio/notifications/stream/`` hold a coroutine rather than a
+worker thread::
+
+    gunicorn core.asgi:application -k uvicorn.workers.UvicornWorker
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.1/howto/deployment/asgi/
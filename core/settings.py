@@ -117,11 +117,13 @@ DATABASES = {
     }
 }
 
+REDIS_URL = config('REDIS_URL', default='redis://127.0.0.1:6379/1')
+
 # Cache configuration
 CACHES = {
     'default': {
         'BACKEND': 'django_redis.cache.RedisCache',
-        'LOCATION': config('REDIS_URL', default='redis://127.0.0.1:6379/1'),
+        'LOCATION': REDIS_URL,
         'OPTIONS': {
             'CLIENT_CLASS': 'django_redis.client.DefaultClient',
             'CONNECTION_POOL_CLASS': 'redis.connection.BlockingConnectionPool',
@@ -156,9 +158,26 @@ AWS_DEFAULT_ACL = 'private'
 AWS_S3_FILE_OVERWRITE = False
 
 # File Storage
+# Django 5.1+ only reads the STORAGES setting (DEFAULT_FILE_STORAGE is gone).
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
 if not DEBUG:
-    DEFAULT_FILE_STORAGE = 'storages.backends.s3boto3.S3Boto3Storage'
-    STATICFILES_STORAGE = 'storages.backends.s3boto3.S3StaticStorage'
+    STORAGES = {
+        'default': {'BACKEND': 'storages.backends.s3boto3.S3Boto3Storage'},
+        'staticfiles': {'BACKEND': 'storages.backends.s3boto3.S3StaticStorage'},
+    }
+
+# Direct-to-S3 uploads (presigned PUT/POST)
+DIRECT_UPLOAD_MAX_SIZE = config('DIRECT_UPLOAD_MAX_SIZE', default=1024 * 1024 * 1024, cast=int)  # 1GB
+DIRECT_UPLOAD_EXPIRATION = 60 * 60  # seconds a presigned upload stays valid
+
+# File downloads: '' streams from Django, 'x-accel-redirect' (nginx) or
+# 'x-sendfile' (Apache/lighttpd) hands the transfer to the front proxy.
+FILE_DOWNLOAD_OFFLOAD = config('FILE_DOWNLOAD_OFFLOAD', default='')
+# nginx `internal` location that maps onto MEDIA_ROOT (or proxies the bucket)
+FILE_DOWNLOAD_ACCEL_PREFIX = config('FILE_DOWNLOAD_ACCEL_PREFIX', default='/protected/')
 
 # Static files (CSS, JavaScript, Images)
 STATIC_URL = 'static/'
@@ -172,6 +191,69 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 FILE_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
 
+# Chunked (resumable) upload settings
+CHUNKED_UPLOAD_DIR = config('CHUNKED_UPLOAD_DIR', default=os.path.join(BASE_DIR, 'tmp', 'uploads'))
+CHUNKED_UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024  # 5MB
+CHUNKED_UPLOAD_MAX_SIZE = config('CHUNKED_UPLOAD_MAX_SIZE', default=1024 * 1024 * 1024, cast=int)  # 1GB
+CHUNKED_UPLOAD_EXPIRATION_HOURS = 24
+
+# Header bytes read to sniff a file's real type during ingestion
+FILE_SNIFF_BYTES = 8 * 1024
+
+# Thumbnail/preview renditions (longest side in pixels, stored as WebP)
+THUMBNAIL_SIZES = [128, 256, 512]
+
+# Background text extraction for search
+TEXT_EXTRACTION_MAX_CHARS = 200_000
+TEXT_EXTRACTION_MAX_BYTES = 50 * 1024 * 1024  # larger files are not extracted
+TEXT_EXTRACTION_TIMEOUT = 120  # seconds, soft time limit of extract_file_text
+
+# Default per-user storage quota in bytes (0 disables it); StorageUsage.quota_bytes overrides it
+STORAGE_QUOTA_BYTES = config('STORAGE_QUOTA_BYTES', default=5 * 1024 * 1024 * 1024, cast=int)  # 5GB
+
+# Trash: files are purged this long after being deleted, in throttled batches
+FILE_TRASH_RETENTION_DAYS = 30
+FILE_PURGE_BATCH_SIZE = 200
+FILE_PURGE_MAX_BATCHES = 50  # per task run
+FILE_PURGE_BATCH_PAUSE = 0.5  # seconds between batches
+FILE_PURGE_WORKERS = 8  # concurrent storage deletes
+
+# Maximum number of files a single /files/bulk/ request may touch
+FILE_BULK_MAX_ITEMS = 1000
+
+# Maximum number of parts in one /files/batch/ upload
+FILE_BATCH_MAX_FILES = 50
+
+# Cached /folders/tree/ responses; invalidated on any folder or file change
+FOLDER_TREE_CACHE_TIMEOUT = 60 * 60
+
+# /notifications/stream/ (Server-Sent Events over Redis pub/sub)
+NOTIFICATION_STREAM_HEARTBEAT = 15  # seconds between keep-alive comments
+NOTIFICATION_STREAM_REPLAY_LIMIT = 50  # missed notifications resent after Last-Event-ID
+NOTIFICATION_STREAM_QUEUE_SIZE = 100  # buffered events per connection before dropping
+NOTIFICATION_STREAM_TICKET_TTL = 30  # seconds a single-use ?ticket= stays redeemable
+
+# Per-user unread notification counters kept in the cache; the timeout bounds any drift
+NOTIFICATION_UNREAD_COUNT_TIMEOUT = 60 * 60 * 24
+NOTIFICATION_MARK_READ_BATCH_SIZE = 1000  # rows per UPDATE in mark_all_read
+
+# Repeats of an unread notification within this many seconds collapse into one row (0 disables)
+NOTIFICATION_COLLAPSE_WINDOW = 24 * 60 * 60
+
+# Read notifications older than this leave the hot table: 'archive' copies them to
+# NotificationArchive first, 'delete' drops them
+NOTIFICATION_RETENTION_DAYS = 90
+NOTIFICATION_RETENTION_MODE = 'archive'
+NOTIFICATION_RETENTION_BATCH_SIZE = 1000
+NOTIFICATION_RETENTION_MAX_BATCHES = 100  # per task run
+
+# Broadcasts: recipients per chunk task, and rows per INSERT within a chunk
+NOTIFICATION_BROADCAST_CHUNK_SIZE = 5000
+NOTIFICATION_BROADCAST_BATCH_SIZE = 1000
+
+# Maximum number of awards in one /rpg/profiles/award/ request
+XP_AWARD_BATCH_MAX = 1000
+
 # Allowed file types
 ALLOWED_FILE_TYPES = {
     'image': ['jpg', 'jpeg', 'png', 'gif'],
@@ -203,6 +285,39 @@ CELERY_TIMEZONE = TIME_ZONE
 CELERY_TASK_TRACK_STARTED = True
 # Max time a task can run before it's killed (30 minutes)
 CELERY_TASK_TIME_LIMIT = 30 * 60  # 30 minutes
+# Text extraction is CPU and memory heavy; it gets its own queue so a burst of
+# uploads cannot starve email and notification tasks on the default workers:
+#   celery -A core worker -Q extraction --concurrency 2 --max-tasks-per-child 50
+CELERY_TASK_ROUTES = {
+    'portfolio.tasks.extract_file_text': {'queue': 'extraction'},
+}
+# Periodic tasks (picked up by django_celery_beat's scheduler)
+CELERY_BEAT_SCHEDULE = {
+    'cleanup-expired-uploads': {
+        'task': 'portfolio.tasks.cleanup_expired_uploads',
+        'schedule': 60 * 60,  # hourly
+    },
+    'purge-trashed-files': {
+        'task': 'portfolio.tasks.cleanup_old_files',
+        'schedule': 60 * 60,  # hourly
+    },
+    'reconcile-storage-usage': {
+        'task': 'portfolio.tasks.reconcile_storage_usage',
+        'schedule': 24 * 60 * 60,  # daily
+    },
+    'send-queued-emails': {
+        'task': 'users.tasks.send_queued_emails',
+        'schedule': 60,  # catches anything a scheduled flush missed
+    },
+    'send-notification-digests': {
+        'task': 'portfolio.tasks.send_notification_digests',
+        'schedule': 24 * 60 * 60,  # daily
+    },
+    'apply-notification-retention': {
+        'task': 'portfolio.tasks.apply_notification_retention',
+        'schedule': 24 * 60 * 60,  # daily
+    },
+}
 
 # Sentry Configuration
 SENTRY_DSN = config('SENTRY_DSN', default='')
@@ -304,6 +419,10 @@ REST_FRAMEWORK = {
     },
 }
 
+# ?count=estimate on cursor-paginated lists counts at most this many rows
+# (PostgreSQL uses the planner estimate instead)
+PAGINATION_COUNT_ESTIMATE_CAP = 10_000
+
 # DRF Spectacular settings
 SPECTACULAR_SETTINGS = {
     'TITLE': 'Portfolio API',
@@ -361,6 +480,19 @@ EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='yourpassword')
 EMAIL_USE_TLS = config('EMAIL_USE_TLS', default=True, cast=bool)
 DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='your@email.com')
 
+# Outgoing email outbox (users.OutgoingEmail), relayed over one SMTP connection per run
+EMAIL_QUEUE_BATCH_SIZE = 100
+EMAIL_QUEUE_MAX_BATCHES = 20  # per task run
+EMAIL_QUEUE_FLUSH_DELAY = 5  # seconds emails are collected before a run is started
+EMAIL_OUTBOX_MAX_ATTEMPTS = 6  # per email, before it is marked failed
+EMAIL_OUTBOX_LEASE = 10 * 60  # seconds a run holds claimed emails before another may retry them
+EMAIL_OUTBOX_RETRY_BASE = 60  # seconds before the first retry; doubles each attempt
+EMAIL_OUTBOX_RETRY_MAX = 6 * 60 * 60
+
+# Daily notification digest for users with email_digest enabled
+NOTIFICATION_DIGEST_MAX_ITEMS = 20  # listed per email; the rest are counted
+NOTIFICATION_DIGEST_BATCH_SIZE = 500  # users per query
+
 # Frontend URL for email verification
 FRONTEND_URL = config('FRONTEND_URL', default='http://localhost:3000')
 
@@ -0,0 +1,58 @@
+import shutil
+import tempfile
+from contextlib import contextmanager
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+
+class TempMediaMixin:
+    """
+    TestCase mixin that points ``MEDIA_ROOT`` at a fresh temporary
+    directory (``self.media_root``) for each test and removes it afterwards.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        overrides = override_settings(MEDIA_ROOT=self.media_root)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+
+class QueryBudgetMixin:
+    """
+    TestCase mixin that pins how many queries an endpoint may run, so N+1
+    regressions fail the build instead of surfacing as slow pages.
+    """
+
+    @contextmanager
+    def assertMaxQueries(self, limit, using=DEFAULT_DB_ALIAS):
+        """Fail if the block runs more than ``limit`` queries."""
+        with CaptureQueriesContext(connections[using]) as context:
+            yield context
+        executed = len(context.captured_queries)
+        if executed > limit:
+            queries = '\n'.join(
+                f'{i}. {query["sql"]}' for i, query in enumerate(context.captured_queries, start=1)
+            )
+            self.fail(f'{executed} queries executed, budget is {limit}\nCaptured queries were:\n{queries}')
+
+    def assertQueryBudget(self, url, limit, method='get', **kwargs):
+        """Request ``url`` with ``self.client`` within ``limit`` queries and return the response."""
+        with self.assertMaxQueries(limit):
+            response = getattr(self.client, method)(url, **kwargs)
+        return response
+
+    def assertConstantQueries(self, url, make_rows, method='get', **kwargs):
+        """
+        Request ``url`` before and after ``make_rows()`` adds more data and
+        fail if the query count grew with it.
+        """
+        with CaptureQueriesContext(connections[DEFAULT_DB_ALIAS]) as before:
+            getattr(self.client, method)(url, **kwargs)
+        make_rows()
+        with self.assertMaxQueries(len(before.captured_queries)):
+            response = getattr(self.client, method)(url, **kwargs)
+        return response
@@ -0,0 +1,98 @@
+import time
+import hashlib
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+VERSION_KEY = 'data_version:{resource}:{user_id}'
+
+
+def _version_key(user_id, resource):
+    return VERSION_KEY.format(resource=resource, user_id=user_id)
+
+
+def bump_version(user_id, *resources):
+    """
+    Mark ``resources`` as changed for ``user_id``; any ETag built on them
+    goes stale. Deferred until the current transaction commits: bumping
+    earlier would let a concurrent GET cache pre-commit rows under the
+    new version and answer 304 with them until the next write.
+    """
+    transaction.on_commit(lambda: _bump(user_id, resources))
+
+
+def _bump(user_id, resources):
+    for resource in resources:
+        key = _version_key(user_id, resource)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Never set or evicted: start from the clock so the new value
+            # cannot collide with one a client saw before the eviction.
+            cache.add(key, time.time_ns(), None)
+
+
+def invalidate_versions(user_ids, *resources):
+    """
+    ``bump_version`` for many users in one round trip, also after commit.
+    Dropped counters are re-seeded from the clock on the next read, so old
+    ETags cannot match.
+    """
+    keys = [_version_key(user_id, resource) for user_id in user_ids for resource in resources]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def get_versions(user_id, resources):
+    """
+    Current version of each resource, or ``None`` if the cache cannot
+    vouch for them (in which case no ETag should be issued).
+    """
+    keys = [_version_key(user_id, resource) for resource in resources]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), None)
+            value = cache.get(key)
+            if value is None:
+                return None
+            versions[key] = value
+    return [versions[key] for key in keys]
+
+
+class VersionedETagMixin:
+    """
+    Answers ``If-None-Match`` on ``list``/``retrieve`` from the per-user
+    version counters of ``etag_resources`` before any query runs, and tags
+    fresh responses with the ETag those versions produce.
+    """
+    etag_resources = ()
+
+    def get_version_etag(self, request):
+        user = request.user
+        if not self.etag_resources or not user.is_authenticated:
+            return None
+        versions = get_versions(user.pk, self.etag_resources)
+        if versions is None:
+            return None
+        parts = [str(user.pk), request.get_full_path(), *map(str, versions)]
+        return quote_etag(hashlib.sha1('|'.join(parts).encode()).hexdigest())
+
+    def _conditional(self, handler, request, *args, **kwargs):
+        etag = self.get_version_etag(request)
+        if etag and etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = handler(request, *args, **kwargs)
+            if etag is None or response.status_code != status.HTTP_200_OK:
+                return response
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self._conditional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._conditional(super().retrieve, request, *args, **kwargs)
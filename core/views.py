@@ -1,11 +1,10 @@
 from django.http import JsonResponse
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework import status
+from rest_framework import permissions, serializers, status
 from django.db import connection
 from django.core.cache import cache
 from django.conf import settings
-from django.core.mail import send_mail
 import redis
 import psutil
 import os
@@ -70,26 +69,27 @@ class HealthCheckView(APIView):
         return Response(health_status)
 
 
+class SendEmailSerializer(serializers.Serializer):
+    subject = serializers.CharField(max_length=255, default="Test Subject")
+    message = serializers.CharField(default="Test message body.")
+    recipient = serializers.EmailField(default=settings.EMAIL_HOST_USER)
+
+    def validate_subject(self, value):
+        # Header injection: Django refuses to build a message with these.
+        if '\n' in value or '\r' in value:
+            raise serializers.ValidationError("Subject must be a single line.")
+        return value
+
+
 class SendEmailView(APIView):
-    permission_classes = []
+    permission_classes = [permissions.IsAdminUser]
 
     def post(self, request):
-        from django.core.mail import send_mail
-        from django.conf import settings
+        from users.mail import queue_email
 
-        data = request.data
-        subject = data.get("subject", "Test Subject")
-        message = data.get("message", "Test message body.")
-        recipient = data.get("recipient", settings.EMAIL_HOST_USER)
+        serializer = SendEmailSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
 
-        try:
-            send_mail(
-                subject=subject,
-                message=message,
-                from_email=settings.EMAIL_HOST_USER,
-                recipient_list=[recipient],
-                fail_silently=False,
-            )
-            return Response({'status': 'Email sent successfully'})
-        except Exception as e:
-            return Response({'error': str(e)}, status=500)
\ No newline at end of file
+        email = queue_email(data['recipient'], data['subject'], data['message'])
+        return Response({'status': 'Email queued', 'id': email.id}, status=status.HTTP_202_ACCEPTED)
\ No newline at end of file
@@ -1,8 +1,8 @@
 from django.contrib import admin
 from .models import *
 
-for model in [m for name, m in globals().items() if isinstance(m, type)]:
+for model in [m for name, m in globals().items() if isinstance(m, type) and hasattr(m, '_meta')]:
     try:
         admin.site.register(model)
     except admin.sites.AlreadyRegistered:
-        pass
\ No newline at end of file
+        pass
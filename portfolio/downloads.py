@@ -0,0 +1,246 @@
+import os
+import re
+import zipfile
+from urllib.parse import quote
+from django.conf import settings
+from django.utils import timezone
+from django.http import (
+    FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+)
+from django.utils.http import content_disposition_header, parse_etags
+from .models import File
+from .storage import get_s3_storage, get_s3_client, s3_key
+
+CHUNK_SIZE = 64 * 1024
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+# Formats that are already compressed; deflating them again only costs CPU.
+STORED_EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif', 'docx', 'pptx', 'xlsx'}
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def file_etag(file):
+    """Strong ETag for a file's content."""
+    if file.blob_id:
+        return f'"{file.blob.sha256}"'
+    return f'"{file.pk}-{int(file.updated_at.timestamp())}-{file.size}"'
+
+
+def download_filename(file):
+    """Name offered to the browser; blob names are hashes, so prefer the title."""
+    ext = os.path.splitext(file.file.name)[1]
+    if file.title.lower().endswith(ext.lower()):
+        return file.title
+    return f'{file.title}{ext}'
+
+
+def parse_range(header, size):
+    """
+    Parse a single ``bytes=`` range into an inclusive ``(start, end)`` pair.
+
+    Returns ``None`` when the header is absent or uses a form we do not
+    serve partially (e.g. multiple ranges), in which case the full body is
+    sent. Raises ``RangeNotSatisfiable`` for ranges outside the file.
+    """
+    if not header:
+        return None
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes.
+        length = int(last)
+        if length == 0:
+            raise RangeNotSatisfiable()
+        return max(0, size - length), size - 1
+
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiable()
+    return start, end
+
+
+def iter_file_range(fh, start, length):
+    """Yield ``length`` bytes of ``fh`` from ``start`` in fixed-size blocks."""
+    try:
+        fh.seek(start)
+        remaining = length
+        while remaining > 0:
+            block = fh.read(min(CHUNK_SIZE, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield block
+    finally:
+        fh.close()
+
+
+def _offload_response(file):
+    """
+    Let the front proxy send the bytes (it handles Range requests itself).
+    Returns ``None`` for X-Sendfile when the storage has no local path
+    (e.g. S3), so the caller streams the file instead.
+    """
+    response = HttpResponse()
+    if settings.FILE_DOWNLOAD_OFFLOAD == 'x-accel-redirect':
+        prefix = settings.FILE_DOWNLOAD_ACCEL_PREFIX.rstrip('/')
+        response['X-Accel-Redirect'] = f'{prefix}/{quote(file.file.name)}'
+        return response
+    try:
+        response['X-Sendfile'] = file.file.path
+    except NotImplementedError:
+        return None
+    return response
+
+
+def _s3_response(storage, file, byte_range):
+    params = {'Bucket': storage.bucket_name, 'Key': s3_key(storage, file.file.name)}
+    if byte_range:
+        params['Range'] = 'bytes=%d-%d' % byte_range
+    body = get_s3_client(storage).get_object(**params)['Body']
+    return StreamingHttpResponse(body.iter_chunks(CHUNK_SIZE))
+
+
+def file_download_response(request, file):
+    """
+    Build a download response for ``file`` honouring ETag/If-None-Match and
+    single byte ranges, offloading to the proxy when configured.
+    """
+    etag = file_etag(file)
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        etags = parse_etags(if_none_match)
+        if '*' in etags or etag in etags:
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+
+    size = file.size or file.file.size
+    content_type = file.content_type or 'application/octet-stream'
+
+    response = _offload_response(file) if settings.FILE_DOWNLOAD_OFFLOAD else None
+    if response is None:
+        range_header = request.headers.get('Range')
+        if_range = request.headers.get('If-Range')
+        if if_range and if_range != etag:
+            range_header = None
+        try:
+            byte_range = parse_range(range_header, size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+        storage = get_s3_storage()
+        if storage is not None:
+            response = _s3_response(storage, file, byte_range)
+        elif byte_range:
+            start, end = byte_range
+            response = StreamingHttpResponse(iter_file_range(file.file.open('rb'), start, end - start + 1))
+        else:
+            response = FileResponse(file.file.open('rb'))
+            response.block_size = CHUNK_SIZE
+
+        if byte_range:
+            start, end = byte_range
+            response.status_code = 206
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response['Content-Length'] = str(end - start + 1)
+        else:
+            response['Content-Length'] = str(size)
+
+    response['Content-Type'] = content_type
+    response['ETag'] = etag
+    response['Accept-Ranges'] = 'bytes'
+    response['Cache-Control'] = 'private, no-cache'
+    response['Content-Disposition'] = content_disposition_header(True, download_filename(file))
+    return response
+
+
+class ZipStreamBuffer:
+    """
+    Write-only sink for ``zipfile``. It has ``tell`` but no ``seek``, so
+    ``zipfile`` writes data descriptors instead of rewinding, and whatever
+    it wrote can be handed on with ``pop``.
+    """
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _safe_name(name):
+    return name.replace('/', '_').replace('\\', '_').strip() or '_'
+
+
+def folder_export_entries(folder):
+    """Yield ``(archive path, File)`` pairs for every file under ``folder``."""
+    paths = {}
+    subtree = folder.get_descendants().order_by('depth').values_list('id', 'parent_id', 'name')
+    for folder_id, parent_id, name in subtree:
+        if folder_id == folder.id:
+            paths[folder_id] = _safe_name(name)
+        else:
+            paths[folder_id] = f'{paths[parent_id]}/{_safe_name(name)}'
+
+    seen = set()
+    files = File.objects.filter(folder_id__in=paths).select_related('blob').order_by('folder_id', 'id')
+    for file in files.iterator(chunk_size=200):
+        base, ext = os.path.splitext(_safe_name(download_filename(file)))
+        arcname = f'{paths[file.folder_id]}/{base}{ext}'
+        counter = 1
+        while arcname in seen:
+            arcname = f'{paths[file.folder_id]}/{base} ({counter}){ext}'
+            counter += 1
+        seen.add(arcname)
+        yield arcname, file
+
+
+def iter_zip(entries):
+    """
+    Stream a ZIP64 archive of ``entries`` one block at a time, so memory use
+    does not depend on the number or size of the files.
+    """
+    sink = ZipStreamBuffer()
+    with zipfile.ZipFile(sink, 'w', allowZip64=True) as archive:
+        for arcname, file in entries:
+            ext = os.path.splitext(arcname)[1][1:].lower()
+            modified = timezone.localtime(file.updated_at).timetuple()[:6]
+            info = zipfile.ZipInfo(arcname, date_time=max(modified, (1980, 1, 1, 0, 0, 0)))
+            info.compress_type = zipfile.ZIP_STORED if ext in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+
+            with file.file.open('rb') as src, archive.open(info, 'w', force_zip64=True) as dest:
+                for chunk in src.chunks(CHUNK_SIZE):
+                    dest.write(chunk)
+                    yield sink.pop()
+            yield sink.pop()
+    yield sink.pop()
+
+
+def folder_export_response(folder):
+    response = StreamingHttpResponse(iter_zip(folder_export_entries(folder)), content_type='application/zip')
+    response['Content-Disposition'] = content_disposition_header(True, f'{_safe_name(folder.name)}.zip')
+    return response
+
@@ -0,0 +1,204 @@
+import asyncio
+import json
+import logging
+import secrets
+from contextlib import asynccontextmanager
+from django.conf import settings
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATION_CHANNEL = 'notifications:{user_id}'
+STREAM_TICKET_KEY = 'notifications:stream_ticket:{ticket}'
+
+
+def notification_channel(user_id):
+    return NOTIFICATION_CHANNEL.format(user_id=user_id)
+
+
+def _publish(user_id, event, data):
+    from django_redis import get_redis_connection
+
+    message = json.dumps({'event': event, 'data': data}, default=str)
+    try:
+        get_redis_connection('default').publish(notification_channel(user_id), message)
+    except Exception:
+        # Live updates are best effort; clients resync on reconnect.
+        logger.warning('Could not publish %s event for user %s', event, user_id, exc_info=True)
+
+
+def publish_notification(notification):
+    """Push a new notification and the resulting unread count once the row is committed."""
+    from .serializers import NotificationSerializer
+
+    data = NotificationSerializer(notification).data
+    user_id = notification.user_id
+
+    def send():
+        _publish(user_id, 'notification', data)
+        publish_unread_count(user_id)
+
+    transaction.on_commit(send)
+
+
+def publish_notifications(notifications):
+    """Push many new notifications in one pipelined round trip; counts are not sent."""
+    from django_redis import get_redis_connection
+    from .serializers import NotificationSerializer
+
+    try:
+        pipe = get_redis_connection('default').pipeline(transaction=False)
+        for notification in notifications:
+            message = json.dumps(
+                {'event': 'notification', 'data': NotificationSerializer(notification).data}, default=str
+            )
+            pipe.publish(notification_channel(notification.user_id), message)
+        pipe.execute()
+    except Exception:
+        logger.warning('Could not publish %d notification events', len(notifications), exc_info=True)
+
+
+def publish_unread_count(user_id, count=None):
+    """Push the user's current unread count to their open streams."""
+    if count is None:
+        from .unread import get_unread_count
+
+        count = get_unread_count(user_id)
+    _publish(user_id, 'unread_count', {'unread_count': count})
+
+
+def format_event(event, data, event_id=None):
+    """Encode one Server-Sent Events frame."""
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data, default=str)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+def issue_stream_ticket(user_id):
+    """
+    Return a short-lived, single-use ticket that opens the user's stream.
+    ``EventSource`` cannot send headers, and a ticket in the query string is
+    harmless once redeemed, unlike a JWT that would end up in access logs.
+    """
+    from django.core.cache import cache
+
+    ticket = secrets.token_urlsafe(32)
+    cache.set(STREAM_TICKET_KEY.format(ticket=ticket), user_id, settings.NOTIFICATION_STREAM_TICKET_TTL)
+    return ticket
+
+
+async def redeem_stream_ticket(ticket):
+    """Return the user id a ticket was issued for, or ``None``; a ticket works once."""
+    from django.core.cache import cache
+
+    key = STREAM_TICKET_KEY.format(ticket=ticket)
+    user_id = await cache.aget(key)
+    # Only the caller whose delete removed the key may use it.
+    if user_id is None or not await cache.adelete(key):
+        return None
+    return user_id
+
+
+def get_async_redis():
+    import redis.asyncio as aioredis
+
+    return aioredis.from_url(settings.REDIS_URL)
+
+
+class NotificationHub:
+    """
+    One Redis pub/sub connection per process and event loop, shared by
+    every open stream. Each stream gets an ``asyncio.Queue``; a single
+    reader task fans messages out to the queues of the channel's
+    listeners, so idle connections cost a queue, not a thread or socket.
+    """
+    reconnect_delay = 1.0
+
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.listeners = {}
+        self.pubsub = None
+        self.reader = None
+
+    @asynccontextmanager
+    async def listen(self, user_id):
+        channel = notification_channel(user_id)
+        queue = asyncio.Queue(maxsize=settings.NOTIFICATION_STREAM_QUEUE_SIZE)
+        queues = self.listeners.setdefault(channel, set())
+        queues.add(queue)
+        try:
+            if len(queues) == 1:
+                await self._subscribe(channel)
+            yield queue
+        finally:
+            queues.discard(queue)
+            if not queues and self.listeners.get(channel) is queues:
+                del self.listeners[channel]
+                await self._unsubscribe(channel)
+
+    async def _subscribe(self, channel):
+        if self.pubsub is None:
+            self.pubsub = get_async_redis().pubsub(ignore_subscribe_messages=True)
+        await self.pubsub.subscribe(channel)
+        if self.reader is None or self.reader.done():
+            self.reader = asyncio.create_task(self._read())
+
+    async def _unsubscribe(self, channel):
+        try:
+            await self.pubsub.unsubscribe(channel)
+        except Exception:
+            logger.warning('Could not unsubscribe from %s', channel, exc_info=True)
+
+    async def _read(self):
+        while self.listeners:
+            try:
+                message = await self.pubsub.get_message(timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.warning('Notification pub/sub connection lost; reconnecting', exc_info=True)
+                await self._reconnect()
+                continue
+            if message and message['type'] == 'message':
+                self._dispatch(message['channel'], message['data'])
+
+    async def _reconnect(self):
+        await asyncio.sleep(self.reconnect_delay)
+        try:
+            await self.pubsub.aclose()
+        except Exception:
+            pass
+        self.pubsub = get_async_redis().pubsub(ignore_subscribe_messages=True)
+        if self.listeners:
+            try:
+                await self.pubsub.subscribe(*self.listeners)
+            except Exception:
+                logger.warning('Could not resubscribe to notification channels', exc_info=True)
+
+    def _dispatch(self, channel, data):
+        if isinstance(channel, bytes):
+            channel = channel.decode()
+        try:
+            message = json.loads(data)
+        except (TypeError, ValueError):
+            return
+        for queue in self.listeners.get(channel, ()):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # A stalled client; it resyncs from Last-Event-ID on reconnect.
+                pass
+
+
+_hub = None
+
+
+def get_hub():
+    """The ``NotificationHub`` for the running event loop."""
+    global _hub
+    if _hub is None or _hub.loop is not asyncio.get_running_loop():
+        _hub = NotificationHub()
+    return _hub
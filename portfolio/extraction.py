@@ -0,0 +1,111 @@
+import re
+import logging
+import zipfile
+import tempfile
+from xml.etree.ElementTree import iterparse
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# (archive member pattern, text element local name) per OOXML format
+OOXML_PARTS = {
+    'docx': (re.compile(r'^word/(document|header\d*|footer\d*)\.xml$'), 't'),
+    'pptx': (re.compile(r'^ppt/slides/slide\d+\.xml$'), 't'),
+    'xlsx': (re.compile(r'^xl/sharedStrings\.xml$'), 't'),
+}
+PARAGRAPH_TAGS = {'p', 'si', 'row'}
+
+
+class TextCollector:
+    """Accumulates text up to ``max_chars`` and reports when it is full."""
+
+    def __init__(self, max_chars):
+        self.max_chars = max_chars
+        self.parts = []
+        self.length = 0
+
+    @property
+    def full(self):
+        return self.length >= self.max_chars
+
+    def add(self, text):
+        if text and not self.full:
+            text = text[:self.max_chars - self.length]
+            self.parts.append(text)
+            self.length += len(text)
+
+    def result(self):
+        return ''.join(self.parts), self.full
+
+
+def _extract_ooxml(path, ext, collector):
+    member_re, text_tag = OOXML_PARTS[ext]
+    with zipfile.ZipFile(path) as archive:
+        members = sorted(
+            (name for name in archive.namelist() if member_re.match(name)),
+            key=lambda name: [int(n) if n.isdigit() else n for n in re.split(r'(\d+)', name)],
+        )
+        for name in members:
+            with archive.open(name) as xml:
+                # iterparse keeps memory flat even for very large sheets.
+                for _, element in iterparse(xml, events=('end',)):
+                    tag = element.tag.rsplit('}', 1)[-1]
+                    if tag == text_tag:
+                        collector.add(element.text)
+                    elif tag in PARAGRAPH_TAGS:
+                        collector.add('\n')
+                    element.clear()
+                    if collector.full:
+                        return
+
+
+def _extract_pdf(path, collector):
+    try:
+        from pypdf import PdfReader  # optional dependency
+    except ImportError:
+        logger.info('pypdf is not installed; skipping PDF text extraction')
+        return
+    for page in PdfReader(path).pages:
+        collector.add(page.extract_text() or '')
+        collector.add('\n')
+        if collector.full:
+            return
+
+
+def _extract_plain(path, collector):
+    with open(path, encoding='utf-8', errors='replace') as fh:
+        while not collector.full:
+            block = fh.read(64 * 1024)
+            if not block:
+                break
+            collector.add(block)
+
+
+def extract_text(path, ext, max_chars):
+    """Pull plain text out of the document at ``path``. Returns ``(text, truncated)``."""
+    collector = TextCollector(max_chars)
+    if ext in OOXML_PARTS:
+        _extract_ooxml(path, ext, collector)
+    elif ext == 'pdf':
+        _extract_pdf(path, collector)
+    elif ext in ('txt', 'csv'):
+        _extract_plain(path, collector)
+    text, truncated = collector.result()
+    return re.sub(r'\n{3,}', '\n\n', text).strip(), truncated
+
+
+def is_extractable(ext):
+    return ext in OOXML_PARTS or ext in ('pdf', 'txt', 'csv')
+
+
+def extract_file(field_file, ext):
+    """
+    Stream ``field_file`` to a local temporary file and extract its text.
+    Runs in the Celery worker process; the task's time limits bound it.
+    """
+    with tempfile.NamedTemporaryFile(suffix=f'.{ext}') as local:
+        with field_file.open('rb') as src:
+            for chunk in src.chunks():
+                local.write(chunk)
+        local.flush()
+        return extract_text(local.name, ext, settings.TEXT_EXTRACTION_MAX_CHARS)
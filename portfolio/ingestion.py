@@ -0,0 +1,80 @@
+import os
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from .models import File
+from .storage import get_s3_storage, get_s3_client, s3_key
+from .utils import get_magic, get_file_category
+
+# Sniffed types that are never accepted, whatever the extension claims.
+BLOCKED_MIME_TYPES = {
+    'application/x-dosexec',
+    'application/x-executable',
+    'application/x-mach-binary',
+    'application/x-sharedlib',
+    'application/x-elf',
+}
+
+
+class IngestionError(Exception):
+    """The file's content is not acceptable; the pipeline stops at ``failed``."""
+
+
+def read_header(file, size=None):
+    """
+    Return the first ``size`` bytes of ``file``'s content. On S3 this is a
+    ranged GET, so only the header crosses the network.
+    """
+    size = size or settings.FILE_SNIFF_BYTES
+    storage = get_s3_storage()
+    if storage is not None:
+        response = get_s3_client(storage).get_object(
+            Bucket=storage.bucket_name,
+            Key=s3_key(storage, file.file.name),
+            Range=f'bytes=0-{size - 1}',
+        )
+        return response['Body'].read()
+
+    with file.file.open('rb') as fh:
+        return fh.read(size)
+
+
+def advance(file_id, source, target, **fields):
+    """
+    Move a file from ``source`` to ``target`` status with a conditional
+    update. Returns ``False`` if another run already moved it on.
+    """
+    return bool(File.objects.filter(pk=file_id, processing_status=source).update(
+        processing_status=target, updated_at=timezone.now(), **fields
+    ))
+
+
+def fail(file_id, error):
+    File.objects.filter(pk=file_id).exclude(
+        Q(processing_status=File.STATUS_READY) | Q(processing_status=File.STATUS_FAILED)
+    ).update(processing_status=File.STATUS_FAILED, processing_error=str(error)[:1000])
+
+
+def sniff(file):
+    """pending -> sniffed: detect the real MIME type from the header bytes."""
+    content_type = get_magic().from_buffer(read_header(file))
+    advance(file.id, File.STATUS_PENDING, File.STATUS_SNIFFED, content_type=content_type)
+
+
+def validate(file):
+    """sniffed -> validated: check the extension and the sniffed type agree with policy."""
+    file.refresh_from_db(fields=['content_type', 'processing_status'])
+    if file.processing_status != File.STATUS_SNIFFED:
+        return
+
+    if file.content_type in BLOCKED_MIME_TYPES:
+        raise IngestionError(f'Content type {file.content_type} is not allowed.')
+
+    category = get_file_category(file.file)
+    if category is None:
+        ext = os.path.splitext(file.file.name)[1][1:].lower()
+        raise IngestionError(f"Unsupported file extension '{ext}'.")
+    if category == 'image' and not file.content_type.startswith('image/'):
+        raise IngestionError(f'Expected an image but found {file.content_type}.')
+
+    advance(file.id, File.STATUS_SNIFFED, File.STATUS_VALIDATED)
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.1 on 2026-10-18 09:25
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0003_alter_file_options_remove_file_category_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filename', models.CharField(max_length=255, verbose_name='filename')),
+                ('title', models.CharField(max_length=255, verbose_name='title')),
+                ('description', models.TextField(blank=True, verbose_name='description')),
+                ('is_public', models.BooleanField(default=False, verbose_name='is public')),
+                ('total_size', models.BigIntegerField(verbose_name='total size')),
+                ('chunk_size', models.PositiveIntegerField(verbose_name='chunk size')),
+                ('received_bytes', models.BigIntegerField(default=0, verbose_name='received bytes')),
+                ('next_chunk', models.PositiveIntegerField(default=0, verbose_name='next chunk')),
+                ('checksum', models.BigIntegerField(default=0, verbose_name='checksum')),
+                ('status', models.CharField(choices=[('active', 'Active'), ('complete', 'Complete')], default='active', max_length=10, verbose_name='status')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='created at')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='updated at')),
+                ('file', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='upload_sessions', to='portfolio.file')),
+                ('folder', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='upload_sessions', to='portfolio.folder')),
+                ('track', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='upload_sessions', to='portfolio.track')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='upload_sessions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'upload session',
+                'verbose_name_plural': 'upload sessions',
+                'indexes': [models.Index(fields=['status', 'updated_at'], name='portfolio_u_status_7aae99_idx')],
+            },
+        ),
+    ]
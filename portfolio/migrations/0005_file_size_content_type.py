@@ -0,0 +1,38 @@
+# Generated by Django 5.2.1 on 2026-10-18 09:27
+
+import mimetypes
+
+from django.db import migrations, models
+
+
+def backfill_size(apps, schema_editor):
+    File = apps.get_model('portfolio', 'File')
+    for file in File.objects.filter(size=0).iterator():
+        try:
+            file.size = file.file.size
+        except Exception:
+            # Missing objects keep size 0 rather than blocking the migration.
+            continue
+        file.content_type = mimetypes.guess_type(file.file.name)[0] or ''
+        file.save(update_fields=['size', 'content_type'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0004_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='file',
+            name='content_type',
+            field=models.CharField(blank=True, max_length=100, verbose_name='content type'),
+        ),
+        migrations.AddField(
+            model_name='file',
+            name='size',
+            field=models.BigIntegerField(default=0, verbose_name='size'),
+        ),
+        migrations.RunPython(backfill_size, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.1 on 2026-10-18 09:29
+
+import django.db.models.deletion
+import portfolio.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0005_file_size_content_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True, verbose_name='SHA-256')),
+                ('file', models.FileField(upload_to=portfolio.models.blob_upload_to, verbose_name='file')),
+                ('size', models.BigIntegerField(verbose_name='size')),
+                ('ref_count', models.PositiveIntegerField(default=0, verbose_name='reference count')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='created at')),
+            ],
+            options={
+                'verbose_name': 'blob',
+                'verbose_name_plural': 'blobs',
+            },
+        ),
+        migrations.AddField(
+            model_name='file',
+            name='blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='files', to='portfolio.blob'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.1 on 2026-10-18 09:32
+
+import django.db.models.deletion
+import portfolio.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0006_blob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='blob',
+            name='file',
+            field=models.FileField(max_length=255, upload_to=portfolio.models.blob_upload_to, verbose_name='file'),
+        ),
+        migrations.AlterField(
+            model_name='file',
+            name='file',
+            field=models.FileField(max_length=255, upload_to='portfolio_files/', verbose_name='file'),
+        ),
+        migrations.CreateModel(
+            name='Rendition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('size', models.PositiveIntegerField(verbose_name='size')),
+                ('file', models.FileField(max_length=255, upload_to=portfolio.models.rendition_upload_to, verbose_name='file')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='created at')),
+                ('blob', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='renditions', to='portfolio.blob')),
+            ],
+            options={
+                'verbose_name': 'rendition',
+                'verbose_name_plural': 'renditions',
+                'unique_together': {('blob', 'size')},
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.1 on 2026-10-18 09:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0007_rendition'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FileText',
+            fields=[
+                ('file', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='text', serialize=False, to='portfolio.file')),
+                ('content', models.TextField(blank=True, verbose_name='content')),
+                ('truncated', models.BooleanField(default=False, verbose_name='truncated')),
+                ('extracted_at', models.DateTimeField(auto_now=True, verbose_name='extracted at')),
+            ],
+            options={
+                'verbose_name': 'file text',
+                'verbose_name_plural': 'file texts',
+            },
+        ),
+    ]
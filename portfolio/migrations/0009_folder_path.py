@@ -0,0 +1,48 @@
+# Generated by Django 5.2.1 on 2026-10-18 09:36
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_paths(apps, schema_editor):
+    Folder = apps.get_model('portfolio', 'Folder')
+    level = list(Folder.objects.filter(parent__isnull=True).values_list('id', flat=True))
+    paths = {}
+    depth = 0
+    while level:
+        for folder_id in level:
+            parent_path = paths.get(folder_id, '/')
+            paths[folder_id] = f'{parent_path}{folder_id}/'
+            Folder.objects.filter(pk=folder_id).update(path=paths[folder_id], depth=depth)
+        children = Folder.objects.filter(parent_id__in=level).values_list('id', 'parent_id')
+        level = []
+        for folder_id, parent_id in children:
+            paths[folder_id] = paths[parent_id]
+            level.append(folder_id)
+        depth += 1
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0008_filetext'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='folder',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='depth'),
+        ),
+        migrations.AddField(
+            model_name='folder',
+            name='path',
+            field=models.CharField(blank=True, editable=False, max_length=1024, verbose_name='path'),
+        ),
+        migrations.RunPython(backfill_paths, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='folder',
+            index=models.Index(fields=['user', 'path'], name='portfolio_folder_path_like', opclasses=['', 'varchar_pattern_ops']),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-18 09:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0009_folder_path'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='folder',
+            index=models.Index(fields=['user', 'created_at'], name='portfolio_f_user_id_b78b7f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'created_at'], name='portfolio_n_user_id_08cce0_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.1 on 2026-10-18 09:46
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_existing_ready(apps, schema_editor):
+    # Files uploaded before the pipeline existed were already processed.
+    File = apps.get_model('portfolio', 'File')
+    File.objects.update(processing_status='ready')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0010_listing_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='file',
+            name='processing_error',
+            field=models.TextField(blank=True, verbose_name='processing error'),
+        ),
+        migrations.AddField(
+            model_name='file',
+            name='processing_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('sniffed', 'Sniffed'), ('validated', 'Validated'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', max_length=20, verbose_name='processing status'),
+        ),
+        migrations.RunPython(mark_existing_ready, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['processing_status', 'updated_at'], name='portfolio_f_process_6073d9_idx'),
+        ),
+    ]
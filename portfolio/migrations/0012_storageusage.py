@@ -0,0 +1,58 @@
+# Generated by Django 5.2.1 on 2026-10-18 09:51
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_usage(apps, schema_editor):
+    import os
+
+    File = apps.get_model('portfolio', 'File')
+    StorageUsage = apps.get_model('portfolio', 'StorageUsage')
+    columns = {
+        ext: f'{category}_bytes'
+        for category, extensions in settings.ALLOWED_FILE_TYPES.items()
+        for ext in extensions
+    }
+    totals = {}
+    for user_id, name, size in File.objects.values_list('user_id', 'file', 'size').iterator():
+        row = totals.setdefault(user_id, {'total_bytes': 0, 'file_count': 0})
+        row['total_bytes'] += size
+        row['file_count'] += 1
+        column = columns.get(os.path.splitext(name)[1][1:].lower(), 'other_bytes')
+        row[column] = row.get(column, 0) + size
+    StorageUsage.objects.bulk_create(
+        [StorageUsage(user_id=user_id, **values) for user_id, values in totals.items()], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0011_file_processing_status'),
+        ('users', '0003_alter_user_email_verification_sent_at_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StorageUsage',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='storage_usage', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('total_bytes', models.BigIntegerField(default=0, verbose_name='total bytes')),
+                ('file_count', models.IntegerField(default=0, verbose_name='file count')),
+                ('image_bytes', models.BigIntegerField(default=0, verbose_name='image bytes')),
+                ('document_bytes', models.BigIntegerField(default=0, verbose_name='document bytes')),
+                ('presentation_bytes', models.BigIntegerField(default=0, verbose_name='presentation bytes')),
+                ('spreadsheet_bytes', models.BigIntegerField(default=0, verbose_name='spreadsheet bytes')),
+                ('other_bytes', models.BigIntegerField(default=0, verbose_name='other bytes')),
+                ('quota_bytes', models.BigIntegerField(blank=True, null=True, verbose_name='quota bytes')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='updated at')),
+            ],
+            options={
+                'verbose_name': 'storage usage',
+                'verbose_name_plural': 'storage usage',
+            },
+        ),
+        migrations.RunPython(backfill_usage, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.1 on 2026-10-18 09:54
+
+import django.db.models.manager
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0012_storageusage'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='file',
+            options={'base_manager_name': 'all_objects', 'verbose_name': 'file', 'verbose_name_plural': 'files'},
+        ),
+        migrations.AlterModelManagers(
+            name='file',
+            managers=[
+                ('objects', django.db.models.manager.Manager()),
+                ('all_objects', django.db.models.manager.Manager()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='file',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='deleted at'),
+        ),
+        migrations.AddIndex(
+            model_name='file',
+            index=models.Index(fields=['deleted_at', 'id'], name='portfolio_f_deleted_169e0a_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:07
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0013_file_trash'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Broadcast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('message', models.TextField(verbose_name='message')),
+                ('type', models.CharField(choices=[('success', 'Success'), ('error', 'Error'), ('info', 'Info'), ('warning', 'Warning')], default='info', max_length=10, verbose_name='type')),
+                ('audience', models.CharField(choices=[('all', 'All active users'), ('track', 'Users with files in a track'), ('users', 'Listed users')], max_length=10, verbose_name='audience')),
+                ('user_ids', models.JSONField(blank=True, default=list, verbose_name='user ids')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done')], default='pending', max_length=10, verbose_name='status')),
+                ('total', models.PositiveIntegerField(blank=True, null=True, verbose_name='total recipients')),
+                ('sent', models.PositiveIntegerField(default=0, verbose_name='sent')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='created at')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='finished at')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='broadcasts', to=settings.AUTH_USER_MODEL)),
+                ('track', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='broadcasts', to='portfolio.track')),
+            ],
+            options={
+                'verbose_name': 'broadcast',
+                'verbose_name_plural': 'broadcasts',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
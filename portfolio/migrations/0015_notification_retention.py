@@ -0,0 +1,54 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:09
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0014_broadcast'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('message', models.TextField(verbose_name='message')),
+                ('type', models.CharField(choices=[('success', 'Success'), ('error', 'Error'), ('info', 'Info'), ('warning', 'Warning')], max_length=10, verbose_name='type')),
+                ('count', models.PositiveIntegerField(default=1, verbose_name='count')),
+                ('created_at', models.DateTimeField(verbose_name='created at')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, verbose_name='archived at')),
+            ],
+            options={
+                'verbose_name': 'archived notification',
+                'verbose_name_plural': 'archived notifications',
+            },
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='collapse_key',
+            field=models.CharField(blank=True, max_length=64, verbose_name='collapse key'),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='count',
+            field=models.PositiveIntegerField(default=1, verbose_name='count'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'collapse_key', 'is_read'], name='portfolio_n_user_id_dabdf6_idx'),
+        ),
+        migrations.AddField(
+            model_name='notificationarchive',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='archived_notifications', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='notificationarchive',
+            index=models.Index(fields=['user', 'created_at'], name='portfolio_n_user_id_fd29a4_idx'),
+        ),
+    ]
@@ -0,0 +1,98 @@
+from django.db import migrations
+
+FTS_TABLE = 'portfolio_file_fts'
+
+# Keep portfolio_file_fts in step with the file and extracted text tables.
+FTS_TRIGGERS = {
+    'file_ai': (
+        f"AFTER INSERT ON portfolio_file BEGIN "
+        f"INSERT INTO {FTS_TABLE}(rowid, title, description, body) "
+        f"VALUES (new.id, new.title, new.description, ''); END"
+    ),
+    'file_ad': (
+        f"AFTER DELETE ON portfolio_file BEGIN "
+        f"DELETE FROM {FTS_TABLE} WHERE rowid = old.id; END"
+    ),
+    'file_au': (
+        f"AFTER UPDATE OF title, description ON portfolio_file BEGIN "
+        f"UPDATE {FTS_TABLE} SET title = new.title, description = new.description "
+        f"WHERE rowid = new.id; END"
+    ),
+    'text_ai': (
+        f"AFTER INSERT ON portfolio_filetext BEGIN "
+        f"UPDATE {FTS_TABLE} SET body = new.content WHERE rowid = new.file_id; END"
+    ),
+    'text_au': (
+        f"AFTER UPDATE OF content ON portfolio_filetext BEGIN "
+        f"UPDATE {FTS_TABLE} SET body = new.content WHERE rowid = new.file_id; END"
+    ),
+    'text_ad': (
+        f"AFTER DELETE ON portfolio_filetext BEGIN "
+        f"UPDATE {FTS_TABLE} SET body = '' WHERE rowid = old.file_id; END"
+    ),
+}
+
+
+def postgres_indexes(apps):
+    """GIN indexes over the same expressions ``PostgresFileSearch`` queries."""
+    from django.contrib.postgres.indexes import GinIndex
+    from django.contrib.postgres.search import SearchVector
+
+    return [
+        (
+            apps.get_model('portfolio', 'File'),
+            GinIndex(SearchVector('title', 'description', config='english'), name='portfolio_file_search_idx'),
+        ),
+        (
+            apps.get_model('portfolio', 'FileText'),
+            GinIndex(SearchVector('content', config='english'), name='portfolio_filetext_search_idx'),
+        ),
+    ]
+
+
+def drop_sqlite_fts(schema_editor):
+    for name in FTS_TRIGGERS:
+        schema_editor.execute(f'DROP TRIGGER IF EXISTS {FTS_TABLE}_{name}')
+    schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        drop_sqlite_fts(schema_editor)
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+            f"title, description, body, tokenize='unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(
+            f"INSERT INTO {FTS_TABLE}(rowid, title, description, body) "
+            f"SELECT f.id, f.title, f.description, COALESCE(t.content, '') "
+            f"FROM portfolio_file f LEFT JOIN portfolio_filetext t ON t.file_id = f.id"
+        )
+        for name, statement in FTS_TRIGGERS.items():
+            schema_editor.execute(f'CREATE TRIGGER {FTS_TABLE}_{name} {statement}')
+    elif vendor == 'postgresql':
+        for model, index in postgres_indexes(apps):
+            # Databases that ran the old post_migrate hook already have them.
+            schema_editor.execute(f'DROP INDEX IF EXISTS {index.name}')
+            schema_editor.add_index(model, index)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        drop_sqlite_fts(schema_editor)
+    elif vendor == 'postgresql':
+        for model, index in postgres_indexes(apps):
+            schema_editor.remove_index(model, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0015_notification_retention'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
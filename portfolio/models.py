@@ -1,6 +1,11 @@
-from django.db import models
+import os
+import uuid
+import mimetypes
+from django.db import models, transaction
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.utils.translation import gettext_lazy as _
+from django_cleanup import cleanup
 
 User = get_user_model()
 
@@ -42,6 +47,9 @@ class Folder(models.Model):
     description = models.TextField(_('description'), blank=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='folders')
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='subfolders')
+    # Materialized path of ancestor ids including this folder, e.g. "/1/5/12/".
+    path = models.CharField(_('path'), max_length=1024, blank=True, editable=False)
+    depth = models.PositiveSmallIntegerField(_('depth'), default=0, editable=False)
     created_at = models.DateTimeField(_('created at'), auto_now_add=True)
     
     class Meta:
@@ -50,11 +58,70 @@ class Folder(models.Model):
         unique_together = ['name', 'user', 'parent']
         indexes = [
             models.Index(fields=['name', 'user']),
+            # Pattern ops so PostgreSQL can use the index for LIKE 'prefix%'
+            # under a non-C collation; other backends ignore opclasses.
+            models.Index(
+                fields=['user', 'path'],
+                name='portfolio_folder_path_like',
+                opclasses=['', 'varchar_pattern_ops'],
+            ),
+            models.Index(fields=['user', 'created_at']),
         ]
     
     def __str__(self):
         return f"{self.name} ({self.user.email})"
 
+    @staticmethod
+    def subtree_q(path, prefix=''):
+        """
+        Match every folder under ``path`` (inclusive) with a prefix match,
+        which the ``varchar_pattern_ops`` index serves regardless of collation.
+        """
+        return models.Q(**{f'{prefix}path__startswith': path})
+
+    def get_descendants(self, include_self=True):
+        queryset = Folder.objects.filter(Folder.subtree_q(self.path), user_id=self.user_id)
+        return queryset if include_self else queryset.exclude(pk=self.pk)
+
+    def get_ancestor_ids(self):
+        return [int(part) for part in self.path.strip('/').split('/') if part]
+
+    def save(self, *args, **kwargs):
+        from django.db.models import F, Value
+        from django.db.models.functions import Concat, Substr
+
+        if self.parent_id:
+            # Read the parent's path fresh; it may have moved since it was loaded.
+            parent_path = Folder.objects.filter(pk=self.parent_id).values_list('path', flat=True).get()
+        else:
+            parent_path = '/'
+
+        with transaction.atomic():
+            if not self._state.adding:
+                # Lock the row and take path and depth from it: the instance may
+                # be stale if the folder moved since it was loaded, and saving it
+                # as is would write the old values back over the subtree's root.
+                self.path, self.depth = (
+                    Folder.objects.select_for_update().filter(pk=self.pk).values_list('path', 'depth').get()
+                )
+            old_path, old_depth = self.path, self.depth
+            super().save(*args, **kwargs)
+            new_path = f'{parent_path}{self.pk}/'
+            if old_path == new_path:
+                return
+
+            new_depth = new_path.count('/') - 2
+            if not old_path:
+                Folder.objects.filter(pk=self.pk).update(path=new_path, depth=new_depth)
+            else:
+                # Re-root the whole subtree in one statement.
+                Folder.objects.filter(Folder.subtree_q(old_path), user_id=self.user_id).update(
+                    path=Concat(Value(new_path), Substr('path', len(old_path) + 1)),
+                    depth=F('depth') + (new_depth - old_depth),
+                )
+            self.path = new_path
+            self.depth = new_depth
+
 class CustomCriteria(models.Model):
     name = models.CharField(_('name'), max_length=100)
     description = models.TextField(_('description'), blank=True)
@@ -72,31 +139,298 @@ class CustomCriteria(models.Model):
     def __str__(self):
         return f"{self.name} ({self.user.email})"
 
+def blob_upload_to(instance, filename):
+    ext = os.path.splitext(filename)[1].lower()
+    digest = instance.sha256
+    return f'portfolio_files/blobs/{digest[:2]}/{digest[2:4]}/{digest}{ext}'
+
+# Storage for blobs and renditions is removed by the post_delete handlers
+# in signals.py, so bulk purges can batch the deletes.
+@cleanup.ignore
+class Blob(models.Model):
+    """Content-addressed file body shared by every ``File`` with the same bytes."""
+    sha256 = models.CharField(_('SHA-256'), max_length=64, unique=True)
+    file = models.FileField(_('file'), upload_to=blob_upload_to, max_length=255)
+    size = models.BigIntegerField(_('size'))
+    ref_count = models.PositiveIntegerField(_('reference count'), default=0)
+    created_at = models.DateTimeField(_('created at'), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('blob')
+        verbose_name_plural = _('blobs')
+
+    def __str__(self):
+        return self.sha256
+
+def rendition_upload_to(instance, filename):
+    digest = instance.blob.sha256
+    return f'portfolio_files/renditions/{digest[:2]}/{digest}/{instance.size}.webp'
+
+@cleanup.ignore
+class Rendition(models.Model):
+    """WebP thumbnail/preview of a blob, so it is built once per content."""
+    blob = models.ForeignKey(Blob, on_delete=models.CASCADE, related_name='renditions')
+    size = models.PositiveIntegerField(_('size'))
+    file = models.FileField(_('file'), upload_to=rendition_upload_to, max_length=255)
+    created_at = models.DateTimeField(_('created at'), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('rendition')
+        verbose_name_plural = _('renditions')
+        unique_together = ['blob', 'size']
+
+    def __str__(self):
+        return f"{self.blob.sha256} @ {self.size}px"
+
+class FileQuerySet(models.QuerySet):
+    def alive(self):
+        return self.filter(deleted_at__isnull=True)
+
+    def trashed(self):
+        return self.filter(deleted_at__isnull=False)
+
+class FileManager(models.Manager.from_queryset(FileQuerySet)):
+    """Default manager: files in the trash are hidden."""
+    def get_queryset(self):
+        return super().get_queryset().alive()
+
+# Stored content is shared between rows, so it is released through
+# Blob reference counts (see signals.py) rather than deleted per row.
+@cleanup.ignore
 class File(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_SNIFFED = 'sniffed'
+    STATUS_VALIDATED = 'validated'
+    STATUS_READY = 'ready'
+    STATUS_FAILED = 'failed'
+    PROCESSING_STATUS_CHOICES = [
+        (STATUS_PENDING, _('Pending')),
+        (STATUS_SNIFFED, _('Sniffed')),
+        (STATUS_VALIDATED, _('Validated')),
+        (STATUS_READY, _('Ready')),
+        (STATUS_FAILED, _('Failed')),
+    ]
+
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='files')
     title = models.CharField(_('title'), max_length=255)
     description = models.TextField(_('description'), blank=True)
-    file = models.FileField(_('file'), upload_to='portfolio_files/')
+    file = models.FileField(_('file'), upload_to='portfolio_files/', max_length=255)
+    blob = models.ForeignKey(Blob, on_delete=models.PROTECT, null=True, blank=True, related_name='files')
     folder = models.ForeignKey(Folder, on_delete=models.SET_NULL, null=True, blank=True, related_name='files')
     categories = models.ManyToManyField(Category, related_name='files', blank=True)
     custom_criteria = models.ManyToManyField(CustomCriteria, related_name='files', blank=True)
     track = models.ForeignKey(Track, on_delete=models.SET_NULL, null=True, blank=True, related_name='files')
     is_public = models.BooleanField(_('is public'), default=False)
+    size = models.BigIntegerField(_('size'), default=0)
+    content_type = models.CharField(_('content type'), max_length=100, blank=True)
+    processing_status = models.CharField(
+        _('processing status'), max_length=20, choices=PROCESSING_STATUS_CHOICES, default=STATUS_PENDING
+    )
+    processing_error = models.TextField(_('processing error'), blank=True)
     uploaded_at = models.DateTimeField(_('uploaded at'), auto_now_add=True)
     updated_at = models.DateTimeField(_('updated at'), auto_now=True)
+    deleted_at = models.DateTimeField(_('deleted at'), null=True, blank=True)
+
+    objects = FileManager()
+    all_objects = FileQuerySet.as_manager()
     
     class Meta:
         verbose_name = _('file')
         verbose_name_plural = _('files')
+        base_manager_name = 'all_objects'
         indexes = [
+            models.Index(fields=['deleted_at', 'id']),
             models.Index(fields=['user', 'title']),
             models.Index(fields=['user', 'uploaded_at']),
             models.Index(fields=['is_public']),
+            models.Index(fields=['processing_status', 'updated_at']),
         ]
     
     def __str__(self):
         return f"{self.title} ({self.user.email})"
 
+    def save(self, *args, **kwargs):
+        if not self.file or self.file._committed:
+            return super().save(*args, **kwargs)
+
+        from .storage import acquire_blob, release_blob, delete_stored_file
+
+        # Record size and type while the uploaded content is still at hand.
+        self.size = self.file.size
+        self.content_type = (
+            getattr(self.file.file, 'content_type', None)
+            or mimetypes.guess_type(self.file.name)[0]
+            or ''
+        )
+        # New content goes through the ingestion pipeline again.
+        self.processing_status = self.STATUS_PENDING
+        self.processing_error = ''
+
+        from .quota import deferred_usage_changes, record_usage
+
+        previous_blob_id = self.blob_id
+        previous = None
+        if self.pk:
+            previous = File.all_objects.filter(pk=self.pk).values_list('file', 'size').first()
+
+        with transaction.atomic():
+            self.blob = acquire_blob(self.file)
+            self.file = self.blob.file.name
+            super().save(*args, **kwargs)
+            if previous_blob_id and previous_blob_id != self.blob_id:
+                release_blob(previous_blob_id)
+            elif previous and previous_blob_id is None and previous[0]:
+                delete_stored_file(previous[0])
+            if previous:
+                # Replacing content: swap the old bytes for the new in the owner's
+                # usage as one update, so only the net growth counts against the quota.
+                with deferred_usage_changes():
+                    record_usage(self.user_id, previous[0], -previous[1], files=0)
+                    record_usage(self.user_id, self.file.name, self.size, files=0)
+
+    def trash(self):
+        """Move the file to the trash; it is purged after ``FILE_TRASH_RETENTION_DAYS``."""
+        from django.utils import timezone
+
+        self.deleted_at = timezone.now()
+        self.save(update_fields=['deleted_at', 'updated_at'])
+
+    def restore(self):
+        self.deleted_at = None
+        self.save(update_fields=['deleted_at', 'updated_at'])
+
+class StorageUsage(models.Model):
+    """Running totals of what a user stores, kept current with ``F()`` updates."""
+    CATEGORY_COLUMNS = ['image_bytes', 'document_bytes', 'presentation_bytes', 'spreadsheet_bytes', 'other_bytes']
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='storage_usage')
+    total_bytes = models.BigIntegerField(_('total bytes'), default=0)
+    file_count = models.IntegerField(_('file count'), default=0)
+    image_bytes = models.BigIntegerField(_('image bytes'), default=0)
+    document_bytes = models.BigIntegerField(_('document bytes'), default=0)
+    presentation_bytes = models.BigIntegerField(_('presentation bytes'), default=0)
+    spreadsheet_bytes = models.BigIntegerField(_('spreadsheet bytes'), default=0)
+    other_bytes = models.BigIntegerField(_('other bytes'), default=0)
+    quota_bytes = models.BigIntegerField(_('quota bytes'), null=True, blank=True)
+    updated_at = models.DateTimeField(_('updated at'), auto_now=True)
+
+    class Meta:
+        verbose_name = _('storage usage')
+        verbose_name_plural = _('storage usage')
+
+    def __str__(self):
+        return f"{self.user_id}: {self.total_bytes} bytes in {self.file_count} files"
+
+class FileText(models.Model):
+    """Plain text extracted from a file, kept out of the ``File`` table."""
+    file = models.OneToOneField(File, on_delete=models.CASCADE, primary_key=True, related_name='text')
+    content = models.TextField(_('content'), blank=True)
+    truncated = models.BooleanField(_('truncated'), default=False)
+    extracted_at = models.DateTimeField(_('extracted at'), auto_now=True)
+
+    class Meta:
+        verbose_name = _('file text')
+        verbose_name_plural = _('file texts')
+
+    def __str__(self):
+        return f"Text of {self.file_id}"
+
+class UploadSession(models.Model):
+    STATUS_CHOICES = (
+        ('active', _('Active')),
+        ('complete', _('Complete')),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(_('filename'), max_length=255)
+    title = models.CharField(_('title'), max_length=255)
+    description = models.TextField(_('description'), blank=True)
+    folder = models.ForeignKey(Folder, on_delete=models.SET_NULL, null=True, blank=True, related_name='upload_sessions')
+    track = models.ForeignKey(Track, on_delete=models.SET_NULL, null=True, blank=True, related_name='upload_sessions')
+    is_public = models.BooleanField(_('is public'), default=False)
+    total_size = models.BigIntegerField(_('total size'))
+    chunk_size = models.PositiveIntegerField(_('chunk size'))
+    received_bytes = models.BigIntegerField(_('received bytes'), default=0)
+    next_chunk = models.PositiveIntegerField(_('next chunk'), default=0)
+    checksum = models.BigIntegerField(_('checksum'), default=0)
+    status = models.CharField(_('status'), max_length=10, choices=STATUS_CHOICES, default='active')
+    file = models.ForeignKey(File, on_delete=models.SET_NULL, null=True, blank=True, related_name='upload_sessions')
+    created_at = models.DateTimeField(_('created at'), auto_now_add=True)
+    updated_at = models.DateTimeField(_('updated at'), auto_now=True)
+
+    class Meta:
+        verbose_name = _('upload session')
+        verbose_name_plural = _('upload sessions')
+        indexes = [
+            models.Index(fields=['status', 'updated_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.filename} ({self.user.email})"
+
+    @property
+    def total_chunks(self):
+        return max(1, -(-self.total_size // self.chunk_size))
+
+    @property
+    def temp_path(self):
+        """Local path the received chunks are appended to."""
+        return os.path.join(settings.CHUNKED_UPLOAD_DIR, f'{self.id}.part')
+
+    def expected_chunk_size(self, index):
+        """Size in bytes the chunk at ``index`` must have."""
+        if index == self.total_chunks - 1:
+            return self.total_size - index * self.chunk_size
+        return self.chunk_size
+
+    def discard_temp_file(self):
+        try:
+            os.remove(self.temp_path)
+        except FileNotFoundError:
+            pass
+
+class NotificationManager(models.Manager):
+    def notify(self, user_id, message, type='info', collapse_key=None):
+        """
+        Create a notification, or fold it into the user's unread one with
+        the same ``collapse_key`` (by default: same type and message) from
+        the last ``NOTIFICATION_COLLAPSE_WINDOW`` seconds. A collapsed row
+        has its ``count`` incremented and ``created_at`` moved to the
+        latest occurrence.
+        """
+        import hashlib
+        from datetime import timedelta
+        from django.db.models import F
+        from django.utils import timezone
+        from core.versioning import bump_version
+        from .events import publish_notification
+
+        if collapse_key is None:
+            collapse_key = f'{type}:' + hashlib.sha1(message.encode()).hexdigest()[:32]
+        now = timezone.now()
+        window = settings.NOTIFICATION_COLLAPSE_WINDOW
+        if window:
+            with transaction.atomic():
+                # Locking the user's row serializes notify() per user; locking
+                # only a matching notification cannot stop two first
+                # occurrences from both inserting.
+                list(User.objects.select_for_update().filter(pk=user_id).values_list('pk'))
+                existing = self.select_for_update().filter(
+                    user_id=user_id, collapse_key=collapse_key, is_read=False,
+                    created_at__gte=now - timedelta(seconds=window)
+                ).order_by('-created_at').first()
+                if existing is not None:
+                    self.filter(pk=existing.pk).update(count=F('count') + 1, created_at=now)
+                    existing.count += 1
+                    existing.created_at = now
+                    bump_version(user_id, 'notifications')
+                    publish_notification(existing)
+                    return existing
+                return self.create(user_id=user_id, message=message, type=type, collapse_key=collapse_key)
+        return self.create(user_id=user_id, message=message, type=type, collapse_key=collapse_key)
+
+
 class Notification(models.Model):
     NOTIFICATION_TYPES = (
         ('success', _('Success')),
@@ -119,7 +453,11 @@ class Notification(models.Model):
         verbose_name=_('type')
     )
     is_read = models.BooleanField(default=False, verbose_name=_('is read'))
+    collapse_key = models.CharField(_('collapse key'), max_length=64, blank=True)
+    count = models.PositiveIntegerField(_('count'), default=1)
     created_at = models.DateTimeField(auto_now_add=True, verbose_name=_('created at'))
+
+    objects = NotificationManager()
     
     class Meta:
         verbose_name = _('notification')
@@ -127,12 +465,104 @@ class Notification(models.Model):
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['user', 'is_read']),
+            models.Index(fields=['user', 'created_at']),
             models.Index(fields=['created_at']),
+            models.Index(fields=['user', 'collapse_key', 'is_read']),
         ]
     
     def __str__(self):
         return f'{self.user.username} - {self.message[:50]}'
     
     def mark_as_read(self):
+        """
+        Flip ``is_read`` with a conditional single-column update. Returns
+        ``False`` if the notification was already read.
+        """
+        from core.versioning import bump_version
+        from .events import publish_unread_count
+        from .unread import adjust_unread_count
+
+        updated = Notification.objects.filter(pk=self.pk, is_read=False).update(is_read=True)
         self.is_read = True
-        self.save()
+        if not updated:
+            return False
+        user_id = self.user_id
+        bump_version(user_id, 'notifications')
+
+        def counted():
+            adjust_unread_count(user_id, -1)
+            publish_unread_count(user_id)
+
+        transaction.on_commit(counted)
+        return True
+
+
+class NotificationArchive(models.Model):
+    """
+    Compact, write-once copy of a read notification past retention; kept
+    out of the hot ``Notification`` table and its indexes.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_notifications', db_index=False)
+    message = models.TextField(_('message'))
+    type = models.CharField(_('type'), max_length=10, choices=Notification.NOTIFICATION_TYPES)
+    count = models.PositiveIntegerField(_('count'), default=1)
+    created_at = models.DateTimeField(_('created at'))
+    archived_at = models.DateTimeField(_('archived at'), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('archived notification')
+        verbose_name_plural = _('archived notifications')
+        indexes = [
+            models.Index(fields=['user', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id} - {self.message[:50]}'
+
+
+class Broadcast(models.Model):
+    """A notification sent to a whole audience, fanned out by ``deliver_broadcast``."""
+    AUDIENCE_ALL = 'all'
+    AUDIENCE_TRACK = 'track'
+    AUDIENCE_USERS = 'users'
+    AUDIENCE_CHOICES = (
+        (AUDIENCE_ALL, _('All active users')),
+        (AUDIENCE_TRACK, _('Users with files in a track')),
+        (AUDIENCE_USERS, _('Listed users')),
+    )
+    STATUS_CHOICES = (
+        ('pending', _('Pending')),
+        ('running', _('Running')),
+        ('done', _('Done')),
+    )
+
+    created_by = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, related_name='broadcasts'
+    )
+    message = models.TextField(_('message'))
+    type = models.CharField(_('type'), max_length=10, choices=Notification.NOTIFICATION_TYPES, default='info')
+    audience = models.CharField(_('audience'), max_length=10, choices=AUDIENCE_CHOICES)
+    track = models.ForeignKey(Track, on_delete=models.SET_NULL, null=True, blank=True, related_name='broadcasts')
+    user_ids = models.JSONField(_('user ids'), default=list, blank=True)
+    status = models.CharField(_('status'), max_length=10, choices=STATUS_CHOICES, default='pending')
+    total = models.PositiveIntegerField(_('total recipients'), null=True, blank=True)
+    sent = models.PositiveIntegerField(_('sent'), default=0)
+    created_at = models.DateTimeField(_('created at'), auto_now_add=True)
+    finished_at = models.DateTimeField(_('finished at'), null=True, blank=True)
+
+    class Meta:
+        verbose_name = _('broadcast')
+        verbose_name_plural = _('broadcasts')
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f'{self.get_audience_display()}: {self.message[:50]}'
+
+    def recipient_ids(self):
+        """Ids of the audience's users, as an unordered ``values_list`` queryset."""
+        users = User.objects.filter(is_active=True)
+        if self.audience == self.AUDIENCE_TRACK:
+            users = users.filter(id__in=File.objects.filter(track_id=self.track_id).values('user_id'))
+        elif self.audience == self.AUDIENCE_USERS:
+            users = users.filter(id__in=self.user_ids)
+        return users.values_list('id', flat=True)
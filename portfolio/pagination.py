@@ -0,0 +1,85 @@
+import json
+from django.conf import settings
+from django.db import connections
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+
+def estimate_count(queryset):
+    """
+    Cheap row count for ``queryset``: the planner's estimate on PostgreSQL,
+    otherwise an exact count that stops at ``PAGINATION_COUNT_ESTIMATE_CAP``.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        sql, params = queryset.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return plan[0]['Plan']['Plan Rows']
+
+    cap = settings.PAGINATION_COUNT_ESTIMATE_CAP
+    return queryset.order_by().values('pk')[:cap].count()
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Seek pagination: each page filters past the last row of the previous
+    one instead of using ``OFFSET``, and no ``COUNT(*)`` is run unless the
+    client asks for ``?count=estimate``. Cursors are opaque and encode the
+    position, so rows inserted meanwhile do not shift later pages.
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    count_query_param = 'count'
+
+    def __init__(self, ordering):
+        self.ordering = ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        if request.query_params.get(self.count_query_param) == 'estimate':
+            self.count = estimate_count(queryset)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        payload = {'next': self.get_next_link(), 'previous': self.get_previous_link()}
+        if self.count is not None:
+            payload['count'] = self.count
+        payload['results'] = data
+        return Response(payload)
+
+    def get_paginated_response_schema(self, schema):
+        response = super().get_paginated_response_schema(schema)
+        response['properties']['count'] = {
+            'type': 'integer',
+            'description': 'Approximate total, only present with ?count=estimate.',
+        }
+        return response
+
+
+class CursorPaginationMixin:
+    """
+    Viewset mixin that switches the list to ``KeysetPagination`` when the
+    request carries a ``cursor`` parameter (``?cursor=`` starts at the top).
+    Without it the default page-number pagination is used, as it is when
+    one of ``ranked_query_params`` is set: a keyset over ``cursor_ordering``
+    would replace the relevance order.
+    """
+    cursor_ordering = ('-created_at', '-id')
+    ranked_query_params = ()
+
+    def use_cursor_pagination(self):
+        params = self.request.query_params
+        return 'cursor' in params and not any(params.get(name) for name in self.ranked_query_params)
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if self.use_cursor_pagination():
+                self._paginator = KeysetPagination(self.cursor_ordering)
+            else:
+                self._paginator = super().paginator
+        return self._paginator
@@ -11,7 +11,7 @@ class IsOwnerOrReadOnly(permissions.BasePermission):
             return True
 
         # Write permissions are only allowed to the owner of the object.
-        return obj.user == request.user
+        return obj.user_id == request.user.pk
 
 class IsFileOwner(permissions.BasePermission):
     """
@@ -23,7 +23,7 @@ class IsFileOwner(permissions.BasePermission):
 
     def has_object_permission(self, request, view, obj):
         # Only the owner can access their files
-        return obj.user == request.user
+        return obj.user_id == request.user.pk
 
 class IsOwnerOrReadOnly(permissions.BasePermission):
     """
@@ -32,4 +32,4 @@ class IsOwnerOrReadOnly(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         if request.method in permissions.SAFE_METHODS:
             return True
-        return obj.user == request.user
\ No newline at end of file
+        return obj.user_id == request.user.pk
\ No newline at end of file
@@ -0,0 +1,176 @@
+import os
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import reduce
+from operator import or_
+from django.conf import settings
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+_deferred_changes = ContextVar('deferred_usage_changes', default=None)
+
+
+class QuotaExceeded(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Storage quota exceeded.'
+    default_code = 'quota_exceeded'
+
+
+def usage_column(name):
+    """``StorageUsage`` byte column for a stored file name."""
+    from .models import StorageUsage
+
+    ext = os.path.splitext(name or '')[1][1:].lower()
+    for category, extensions in settings.ALLOWED_FILE_TYPES.items():
+        column = f'{category}_bytes'
+        if ext in extensions and column in StorageUsage.CATEGORY_COLUMNS:
+            return column
+    return 'other_bytes'
+
+
+def _fits(incoming_bytes):
+    """Rows whose quota still has room for ``incoming_bytes`` (0 means unlimited)."""
+    default = settings.STORAGE_QUOTA_BYTES
+    own_quota = Q(quota_bytes__gt=0, total_bytes__lte=F('quota_bytes') - incoming_bytes)
+    unlimited = Q(quota_bytes=0)
+    if default:
+        return own_quota | unlimited | Q(quota_bytes__isnull=True, total_bytes__lte=default - incoming_bytes)
+    return own_quota | unlimited | Q(quota_bytes__isnull=True)
+
+
+def _apply(changes):
+    """
+    Apply per-user ``Counter``s of column deltas, one UPDATE per user.
+    Growth is conditional on the quota (``WHERE total_bytes + n <= quota``),
+    so concurrent uploads cannot jointly overrun it; ``QuotaExceeded`` is
+    raised, rolling back the caller's transaction, when it does not fit.
+    """
+    from .models import StorageUsage
+
+    for user_id, deltas in changes.items():
+        deltas = {column: delta for column, delta in deltas.items() if delta}
+        if not deltas:
+            continue
+        update = {column: F(column) + delta for column, delta in deltas.items()}
+        growth = deltas.get('total_bytes', 0)
+        rows = StorageUsage.objects.filter(user_id=user_id)
+        if growth > 0:
+            rows = rows.filter(_fits(growth))
+        if rows.update(**update):
+            continue
+        if growth <= 0 and any(delta < 0 for delta in deltas.values()):
+            # Nothing was ever recorded (or the user is being deleted);
+            # reconciliation will create the row from the real totals.
+            continue
+        if StorageUsage.objects.filter(user_id=user_id).exists():
+            raise QuotaExceeded()
+        StorageUsage.objects.bulk_create([StorageUsage(user_id=user_id)], ignore_conflicts=True)
+        if not rows.update(**update):
+            raise QuotaExceeded()
+
+
+def record_usage(user_id, name, size, files=1):
+    """
+    Add (or, with negative ``size``/``files``, remove) a file's bytes to
+    its owner's counters with ``F()`` updates.
+    """
+    deltas = Counter({'total_bytes': size, 'file_count': files, usage_column(name): size})
+    pending = _deferred_changes.get()
+    if pending is not None:
+        pending.setdefault(user_id, Counter()).update(deltas)
+        return
+    _apply({user_id: deltas})
+
+
+@contextmanager
+def deferred_usage_changes():
+    """Fold every ``record_usage`` call in the block into one update per user."""
+    pending = {}
+    token = _deferred_changes.set(pending)
+    try:
+        yield
+    finally:
+        _deferred_changes.reset(token)
+    _apply(pending)
+
+
+def check_quota(user_id, incoming_bytes):
+    """Raise ``QuotaExceeded`` if ``incoming_bytes`` would not fit. Reads one row."""
+    from .models import StorageUsage
+
+    row = StorageUsage.objects.filter(user_id=user_id).values_list('total_bytes', 'quota_bytes').first()
+    used, quota = row or (0, None)
+    limit = quota if quota is not None else settings.STORAGE_QUOTA_BYTES
+    if limit and used + incoming_bytes > limit:
+        raise QuotaExceeded(
+            f'Storage quota exceeded: {used + incoming_bytes} of {limit} bytes would be used.'
+        )
+
+
+def _usage_annotations():
+    from .models import StorageUsage
+
+    annotations = {'total_bytes': Coalesce(Sum('size'), 0), 'file_count': Count('id')}
+    for category, extensions in settings.ALLOWED_FILE_TYPES.items():
+        column = f'{category}_bytes'
+        if column in StorageUsage.CATEGORY_COLUMNS and extensions:
+            matches = reduce(or_, (Q(file__iendswith=f'.{ext}') for ext in extensions))
+            annotations[column] = Coalesce(Sum('size', filter=matches), 0)
+    return annotations
+
+
+def _with_other_bytes(totals):
+    from .models import StorageUsage
+
+    totals['other_bytes'] = totals['total_bytes'] - sum(
+        totals.get(column, 0) for column in StorageUsage.CATEGORY_COLUMNS if column != 'other_bytes'
+    )
+    return totals
+
+
+def reconcile_usage():
+    """
+    Recompute every user's counters from ``File`` in one grouped aggregate
+    to find the rows that drifted, then fix each one under a row lock with
+    its totals recounted, so ``F()`` increments in flight are not
+    overwritten. Returns the number of rows fixed.
+    """
+    from django.db import transaction
+    from .models import File, StorageUsage
+
+    annotations = _usage_annotations()
+    columns = ['total_bytes', 'file_count', *StorageUsage.CATEGORY_COLUMNS]
+
+    def drifted(usage, expected):
+        return any(usage[column] != expected.get(column, 0) for column in columns)
+
+    actual = {}
+    # Trashed files keep counting until they are purged.
+    for row in File.all_objects.values('user_id').annotate(**annotations).order_by():
+        user_id = row.pop('user_id')
+        actual[user_id] = _with_other_bytes(row)
+
+    suspects = []
+    for usage in StorageUsage.objects.values('user_id', *columns).iterator(chunk_size=1000):
+        if drifted(usage, actual.pop(usage['user_id'], {})):
+            suspects.append(usage['user_id'])
+
+    fixed = 0
+    for user_id in suspects:
+        with transaction.atomic():
+            usage = StorageUsage.objects.select_for_update().filter(user_id=user_id).values(*columns).first()
+            if usage is None:
+                continue
+            # Recounted after the lock: writers that already moved the counter
+            # have committed their files, and later ones add on top of this.
+            expected = _with_other_bytes(File.all_objects.filter(user_id=user_id).aggregate(**annotations))
+            if drifted(usage, expected):
+                StorageUsage.objects.filter(user_id=user_id).update(**{column: expected[column] for column in columns})
+                fixed += 1
+
+    missing = [StorageUsage(user_id=user_id, **values) for user_id, values in actual.items()]
+    StorageUsage.objects.bulk_create(missing, batch_size=500, ignore_conflicts=True)
+    return fixed + len(missing)
@@ -0,0 +1,107 @@
+import io
+import os
+import shutil
+import logging
+import subprocess
+import tempfile
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, transaction
+from PIL import Image, ImageOps
+from .models import Rendition
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif'}
+OFFICE_EXTENSIONS = {'doc', 'docx', 'ppt', 'pptx', 'xls', 'xlsx'}
+
+
+def _open_image(fh, max_size):
+    image = Image.open(fh)
+    # Let the JPEG decoder downscale while decoding instead of afterwards.
+    image.draft('RGB', (max_size, max_size))
+    image = ImageOps.exif_transpose(image)
+    return image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+
+
+def _render_pdf(data, max_size):
+    """Render the first page of a PDF, or ``None`` without PyMuPDF."""
+    try:
+        import fitz  # PyMuPDF is optional
+    except ImportError:
+        logger.info('PyMuPDF is not installed; skipping PDF preview')
+        return None
+
+    with fitz.open(stream=data, filetype='pdf') as document:
+        if document.page_count == 0:
+            return None
+        page = document[0]
+        zoom = max_size / max(page.rect.width, page.rect.height)
+        pixmap = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+        return Image.frombytes('RGB', (pixmap.width, pixmap.height), pixmap.samples)
+
+
+def _render_office(fh, ext, max_size):
+    """Convert an office document to PDF with LibreOffice and render page one."""
+    soffice = shutil.which('soffice')
+    if not soffice:
+        logger.info('LibreOffice is not installed; skipping document preview')
+        return None
+
+    with tempfile.TemporaryDirectory() as workdir:
+        source = os.path.join(workdir, f'source.{ext}')
+        with open(source, 'wb') as out:
+            for chunk in fh.chunks():
+                out.write(chunk)
+        subprocess.run(
+            [soffice, '--headless', '--convert-to', 'pdf', '--outdir', workdir, source],
+            check=True, capture_output=True, timeout=120,
+        )
+        with open(os.path.join(workdir, 'source.pdf'), 'rb') as pdf:
+            return _render_pdf(pdf.read(), max_size)
+
+
+def render_source(blob, ext, max_size):
+    """Decode ``blob`` into a PIL image, or ``None`` if we cannot preview it."""
+    with blob.file.open('rb') as fh:
+        if ext in IMAGE_EXTENSIONS:
+            return _open_image(fh, max_size)
+        if ext == 'pdf':
+            return _render_pdf(fh.read(), max_size)
+        if ext in OFFICE_EXTENSIONS:
+            return _render_office(fh, ext, max_size)
+    return None
+
+
+def build_renditions(blob, ext):
+    """
+    Create the missing WebP renditions for ``blob``. Sizes that already
+    exist for this content hash are never rebuilt.
+    """
+    existing = set(blob.renditions.values_list('size', flat=True))
+    missing = [size for size in settings.THUMBNAIL_SIZES if size not in existing]
+    if not missing:
+        return []
+
+    source = render_source(blob, ext, max(missing))
+    if source is None:
+        return []
+
+    created = []
+    for size in sorted(missing, reverse=True):
+        image = source.copy()
+        image.thumbnail((size, size), Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, 'WEBP', quality=80, method=4)
+
+        rendition = Rendition(blob=blob, size=size)
+        rendition.file.save(f'{size}.webp', ContentFile(buffer.getvalue()), save=False)
+        try:
+            with transaction.atomic():
+                rendition.save()
+        except IntegrityError:
+            # Another worker built the same rendition concurrently.
+            rendition.file.delete(save=False)
+            continue
+        created.append(rendition)
+    return created
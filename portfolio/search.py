@@ -0,0 +1,144 @@
+import re
+import html
+from django.db import connections
+from django.db.models.expressions import RawSQL
+from rest_framework import filters
+
+# Highlight markers emitted by the database; swapped for <mark> tags only
+# after the snippet text itself has been HTML-escaped.
+MARK_START = '\x02'
+MARK_END = '\x03'
+
+SQLITE_FTS_TABLE = 'portfolio_file_fts'
+POSTGRES_SEARCH_CONFIG = 'english'
+# Only the start of long documents is fed to ts_headline.
+POSTGRES_HEADLINE_CHARS = 5000
+
+
+def highlight(snippet):
+    """Escape a raw snippet and turn the database markers into <mark> tags."""
+    if snippet is None:
+        return None
+    return html.escape(snippet).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+
+
+class SQLiteFileSearch:
+    """
+    FTS5 table over file titles, descriptions and extracted text, kept in
+    sync with ``portfolio_file`` and ``portfolio_filetext`` by triggers
+    (created in migration 0016). SQLite drops a table's triggers when a
+    migration rebuilds it, so such a migration must recreate them.
+    """
+
+    def match_expression(self, query):
+        """Quote each term so user input cannot inject FTS5 syntax."""
+        terms = re.findall(r'\w+', query)
+        return ' '.join('"%s"' % term for term in terms)
+
+    def search(self, queryset, query):
+        match = self.match_expression(query)
+        if not match:
+            return queryset.none()
+
+        lookup = f'FROM {SQLITE_FTS_TABLE} WHERE {SQLITE_FTS_TABLE} MATCH %s AND rowid = portfolio_file.id'
+        return queryset.filter(
+            id__in=RawSQL(f'SELECT rowid FROM {SQLITE_FTS_TABLE} WHERE {SQLITE_FTS_TABLE} MATCH %s', [match])
+        ).annotate(
+            search_rank=RawSQL(f'SELECT bm25({SQLITE_FTS_TABLE}) {lookup}', [match]),
+            search_snippet=RawSQL(
+                f"SELECT snippet({SQLITE_FTS_TABLE}, -1, char(2), char(3), '…', 12) {lookup}", [match]
+            ),
+        ).order_by('search_rank')
+
+
+class PostgresFileSearch:
+    """
+    ``tsvector`` expressions with GIN indexes on ``portfolio_file`` and on
+    the extracted text in ``portfolio_filetext`` (created in migration
+    0016 from the same expressions).
+    """
+
+    def vector(self):
+        from django.contrib.postgres.search import SearchVector
+
+        return SearchVector('title', 'description', config=POSTGRES_SEARCH_CONFIG)
+
+    def text_vector(self, prefix=''):
+        from django.contrib.postgres.search import SearchVector
+
+        return SearchVector(f'{prefix}content', config=POSTGRES_SEARCH_CONFIG)
+
+    def search(self, queryset, query):
+        from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank
+        from django.db.models import Q, Value
+        from django.db.models.functions import Coalesce, Concat, Substr
+        from .models import FileText
+
+        vector = self.vector()
+        search_query = SearchQuery(query, search_type='websearch', config=POSTGRES_SEARCH_CONFIG)
+        text_matches = FileText.objects.annotate(
+            search_vector=self.text_vector()
+        ).filter(search_vector=search_query).values('file_id')
+
+        return queryset.annotate(search_vector=vector).filter(
+            Q(search_vector=search_query) | Q(id__in=text_matches)
+        ).annotate(
+            search_rank=SearchRank(vector, search_query) + Coalesce(
+                SearchRank(self.text_vector('text__'), search_query), 0.0
+            ),
+            search_snippet=SearchHeadline(
+                Concat(
+                    'title', Value(' '), 'description', Value(' '),
+                    Coalesce(Substr('text__content', 1, POSTGRES_HEADLINE_CHARS), Value('')),
+                ),
+                search_query,
+                config=POSTGRES_SEARCH_CONFIG,
+                start_sel=MARK_START,
+                stop_sel=MARK_END,
+            ),
+        ).order_by('-search_rank')
+
+
+def get_search_backend(using='default'):
+    vendor = connections[using].vendor
+    if vendor == 'sqlite':
+        return SQLiteFileSearch()
+    if vendor == 'postgresql':
+        return PostgresFileSearch()
+    return None
+
+
+class FileSearchFilter(filters.BaseFilterBackend):
+    """Ranked full-text search over files via ``?q=`` (``?search=`` is still accepted)."""
+    search_param = 'q'
+    legacy_search_param = 'search'
+
+    def get_query(self, request):
+        params = request.query_params
+        return (params.get(self.search_param) or params.get(self.legacy_search_param, '')).strip()
+
+    def filter_queryset(self, request, queryset, view):
+        query = self.get_query(request)
+        if not query:
+            return queryset
+
+        backend = get_search_backend(queryset.db)
+        if backend is None:
+            return queryset.filter(title__icontains=query)
+        return backend.search(queryset, query)
+
+    def get_schema_operation_parameters(self, view):
+        return [{
+            'name': self.search_param,
+            'required': False,
+            'in': 'query',
+            'description': 'Full-text search over title, description and document text, ranked by relevance.',
+            'schema': {'type': 'string'},
+        }, {
+            'name': self.legacy_search_param,
+            'required': False,
+            'in': 'query',
+            'deprecated': True,
+            'description': f'Alias of ``{self.search_param}``.',
+            'schema': {'type': 'string'},
+        }]
@@ -1,9 +1,30 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from .models import Track, Category, Folder, CustomCriteria, File, Notification
+from .models import Track, Category, Folder, CustomCriteria, File, UploadSession, Notification, Broadcast
 
 User = get_user_model()
 
+def validate_extension(filename):
+    """Reject file names whose extension is not in ``ALLOWED_FILE_TYPES``."""
+    import os
+    from django.conf import settings
+
+    ext = os.path.splitext(filename)[1][1:].lower()
+    allowed = sum(settings.ALLOWED_FILE_TYPES.values(), [])
+    if ext not in allowed:
+        raise serializers.ValidationError(f"Unsupported file extension '{ext}'.")
+    return ext
+
+def validate_upload(value):
+    """Extension and size checks shared by single and batch uploads."""
+    from django.conf import settings
+
+    validate_extension(value.name)
+    max_size = getattr(settings, 'FILE_UPLOAD_MAX_MEMORY_SIZE', 10 * 1024 * 1024)  # 10MB
+    if value.size > max_size:
+        raise serializers.ValidationError(f"File size exceeds the limit of {max_size / (1024 * 1024):.0f}MB.")
+    return value
+
 class TrackSerializer(serializers.ModelSerializer):
     class Meta:
         model = Track
@@ -25,22 +46,34 @@ class CategorySerializer(serializers.ModelSerializer):
 class FolderSerializer(serializers.ModelSerializer):
     class Meta:
         model = Folder
-        fields = ['id', 'name', 'description', 'parent', 'created_at']
-        read_only_fields = ['id', 'created_at']
+        fields = ['id', 'name', 'description', 'parent', 'path', 'depth', 'created_at']
+        read_only_fields = ['id', 'path', 'depth', 'created_at']
 
     def validate(self, data):
         user = self.context['request'].user
         name = data.get('name')
         parent = data.get('parent')
 
-        if Folder.objects.filter(user=user, name=name, parent=parent).exists():
+        siblings = Folder.objects.filter(user=user, name=name, parent=parent)
+        if self.instance is not None:
+            siblings = siblings.exclude(pk=self.instance.pk)
+        if siblings.exists():
             raise serializers.ValidationError("A folder with this name already exists in this location.")
         
         if parent and parent.user != user:
             raise serializers.ValidationError("Cannot create folder in another user's folder.")
+
+        if parent and self.instance is not None and parent.path.startswith(self.instance.path):
+            raise serializers.ValidationError("Cannot move a folder into itself or one of its subfolders.")
         
         return data
 
+
+class BreadcrumbSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Folder
+        fields = ['id', 'name', 'depth']
+
 class CustomCriteriaSerializer(serializers.ModelSerializer):
     class Meta:
         model = CustomCriteria
@@ -56,6 +89,8 @@ class CustomCriteriaSerializer(serializers.ModelSerializer):
 class FileSerializer(serializers.ModelSerializer):
     categories = CategorySerializer(many=True, read_only=True)
     custom_criteria = CustomCriteriaSerializer(many=True, read_only=True)
+    thumbnail_urls = serializers.SerializerMethodField()
+    search_snippet = serializers.SerializerMethodField()
     category_ids = serializers.ListField(
         child=serializers.IntegerField(),
         write_only=True,
@@ -71,10 +106,31 @@ class FileSerializer(serializers.ModelSerializer):
         model = File
         fields = [
             'id', 'title', 'description', 'file', 'folder', 'categories',
-            'custom_criteria', 'track', 'is_public', 'uploaded_at', 'updated_at',
-            'category_ids', 'criteria_ids'
+            'custom_criteria', 'track', 'is_public', 'size', 'content_type',
+            'processing_status', 'processing_error', 'thumbnail_urls', 'search_snippet',
+            'uploaded_at', 'updated_at', 'category_ids', 'criteria_ids'
         ]
-        read_only_fields = ['id', 'uploaded_at', 'updated_at']
+        read_only_fields = [
+            'id', 'size', 'content_type', 'processing_status', 'processing_error',
+            'uploaded_at', 'updated_at'
+        ]
+        # Relations read by method fields, for prefetch_for_serializer().
+        method_field_relations = {'thumbnail_urls': ['blob__renditions']}
+
+    def get_thumbnail_urls(self, obj):
+        if obj.blob is None:
+            return {}
+        request = self.context.get('request')
+        urls = {}
+        for rendition in obj.blob.renditions.all():
+            url = rendition.file.url
+            urls[str(rendition.size)] = request.build_absolute_uri(url) if request else url
+        return urls
+
+    def get_search_snippet(self, obj):
+        from .search import highlight
+
+        return highlight(getattr(obj, 'search_snippet', None))
 
     def validate(self, data):
         user = self.context['request'].user
@@ -86,17 +142,7 @@ class FileSerializer(serializers.ModelSerializer):
         return data
 
     def validate_file(self, value):
-        import os
-        from django.conf import settings
-
-        ext = os.path.splitext(value.name)[1][1:].lower()
-        allowed = sum(settings.ALLOWED_FILE_TYPES.values(), [])
-        if ext not in allowed:
-            raise serializers.ValidationError(f"Unsupported file extension '{ext}'.")
-        max_size = getattr(settings, 'FILE_UPLOAD_MAX_MEMORY_SIZE', 10 * 1024 * 1024)  # 10MB
-        if value.size > max_size:
-            raise serializers.ValidationError(f"File size exceeds the limit of {max_size / (1024 * 1024):.0f}MB.")
-        return value
+        return validate_upload(value)
 
     def create(self, validated_data):
         validated_data['user'] = self.context['request'].user
@@ -116,13 +162,190 @@ class FileSerializer(serializers.ModelSerializer):
         
         return file 
 
+class UploadSessionSerializer(serializers.ModelSerializer):
+    total_chunks = serializers.IntegerField(read_only=True)
+    checksum = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UploadSession
+        fields = [
+            'id', 'filename', 'title', 'description', 'folder', 'track', 'is_public',
+            'total_size', 'chunk_size', 'total_chunks', 'received_bytes', 'next_chunk',
+            'checksum', 'status', 'file', 'created_at'
+        ]
+        read_only_fields = [
+            'id', 'chunk_size', 'received_bytes', 'next_chunk', 'status', 'file', 'created_at'
+        ]
+        extra_kwargs = {'title': {'required': False}}
+
+    def get_checksum(self, obj):
+        return f'{obj.checksum:08x}'
+
+    def validate_filename(self, value):
+        import os
+
+        validate_extension(value)
+        return os.path.basename(value)
+
+    def validate_total_size(self, value):
+        from django.conf import settings
+
+        max_size = settings.CHUNKED_UPLOAD_MAX_SIZE
+        if value <= 0:
+            raise serializers.ValidationError("File is empty.")
+        if value > max_size:
+            raise serializers.ValidationError(f"File size exceeds the limit of {max_size / (1024 * 1024):.0f}MB.")
+        return value
+
+    def validate(self, data):
+        user = self.context['request'].user
+        folder = data.get('folder')
+
+        if folder and folder.user != user:
+            raise serializers.ValidationError("Cannot add file to another user's folder.")
+
+        if not data.get('title'):
+            data['title'] = data['filename']
+        return data
+
+class PresignedUploadSerializer(serializers.Serializer):
+    filename = serializers.CharField(max_length=255)
+    content_type = serializers.CharField(max_length=100, required=False)
+    size = serializers.IntegerField(min_value=1)
+
+    def validate_filename(self, value):
+        import os
+
+        validate_extension(value)
+        return os.path.basename(value)
+
+    def validate_size(self, value):
+        from django.conf import settings
+
+        max_size = settings.DIRECT_UPLOAD_MAX_SIZE
+        if value > max_size:
+            raise serializers.ValidationError(f"File size exceeds the limit of {max_size / (1024 * 1024):.0f}MB.")
+        return value
+
+class PresignedFinalizeSerializer(serializers.Serializer):
+    key = serializers.CharField(max_length=255)
+    title = serializers.CharField(max_length=255, required=False)
+    description = serializers.CharField(required=False, allow_blank=True, default='')
+    folder = serializers.PrimaryKeyRelatedField(queryset=Folder.objects.all(), required=False, allow_null=True)
+    track = serializers.PrimaryKeyRelatedField(queryset=Track.objects.all(), required=False, allow_null=True)
+    is_public = serializers.BooleanField(required=False, default=False)
+
+    def validate_key(self, value):
+        user = self.context['request'].user
+        # Storage normalizes keys, so "<prefix>/../<other user>/" must not get past the prefix check.
+        segments = value.split('/')
+        if '' in segments or '.' in segments or '..' in segments or '\\' in value:
+            raise serializers.ValidationError("Invalid upload key.")
+        if not value.startswith(f'portfolio_files/{user.id}/'):
+            raise serializers.ValidationError("Invalid upload key.")
+        validate_extension(value)
+        return value
+
+    def validate(self, data):
+        import os
+
+        user = self.context['request'].user
+        folder = data.get('folder')
+
+        if folder and folder.user != user:
+            raise serializers.ValidationError("Cannot add file to another user's folder.")
+
+        if not data.get('title'):
+            data['title'] = os.path.basename(data['key'])
+        return data
+
+class BatchUploadSerializer(serializers.Serializer):
+    """Metadata shared by every part of a batch upload."""
+    folder = serializers.PrimaryKeyRelatedField(queryset=Folder.objects.all(), required=False, allow_null=True)
+    track = serializers.PrimaryKeyRelatedField(queryset=Track.objects.all(), required=False, allow_null=True)
+    is_public = serializers.BooleanField(required=False, default=False)
+    description = serializers.CharField(required=False, allow_blank=True, default='')
+    category_ids = serializers.ListField(child=serializers.IntegerField(), required=False, default=list)
+    criteria_ids = serializers.ListField(child=serializers.IntegerField(), required=False, default=list)
+
+    def validate(self, data):
+        user = self.context['request'].user
+        folder = data.get('folder')
+
+        if folder and folder.user_id != user.id:
+            raise serializers.ValidationError("Cannot add file to another user's folder.")
+
+        data['categories'] = list(Category.objects.filter(user=user, id__in=data['category_ids']).values_list('id', flat=True))
+        data['criteria'] = list(CustomCriteria.objects.filter(user=user, id__in=data['criteria_ids']).values_list('id', flat=True))
+        return data
+
+class BulkFileOperationSerializer(serializers.Serializer):
+    OPERATIONS = ['move', 'tag', 'untag', 'set_public', 'delete', 'restore']
+
+    ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+    operation = serializers.ChoiceField(choices=OPERATIONS)
+    folder = serializers.PrimaryKeyRelatedField(queryset=Folder.objects.all(), required=False, allow_null=True)
+    category_ids = serializers.ListField(child=serializers.IntegerField(), required=False, default=list)
+    criteria_ids = serializers.ListField(child=serializers.IntegerField(), required=False, default=list)
+    is_public = serializers.BooleanField(required=False)
+
+    def validate_ids(self, value):
+        from django.conf import settings
+
+        if len(value) > settings.FILE_BULK_MAX_ITEMS:
+            raise serializers.ValidationError(f"At most {settings.FILE_BULK_MAX_ITEMS} files per request.")
+        return sorted(set(value))
+
+    def validate(self, data):
+        user = self.context['request'].user
+        operation = data['operation']
+
+        if operation == 'move':
+            if 'folder' not in data:
+                raise serializers.ValidationError("A folder (or null for the root) is required to move files.")
+            if data['folder'] and data['folder'].user_id != user.id:
+                raise serializers.ValidationError("Cannot move files into another user's folder.")
+
+        if operation in ('tag', 'untag'):
+            if not data['category_ids'] and not data['criteria_ids']:
+                raise serializers.ValidationError("Provide category_ids and/or criteria_ids.")
+            for field, model in (('category_ids', Category), ('criteria_ids', CustomCriteria)):
+                requested = set(data[field])
+                owned = set(model.objects.filter(user=user, id__in=requested).values_list('id', flat=True))
+                if requested - owned:
+                    raise serializers.ValidationError({field: f"Unknown ids: {sorted(requested - owned)}"})
+
+        if operation == 'set_public' and 'is_public' not in data:
+            raise serializers.ValidationError("is_public is required for set_public.")
+        return data
+
 class NotificationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Notification
-        fields = ['id', 'message', 'type', 'is_read', 'created_at']
-        read_only_fields = ['id', 'created_at']
+        fields = ['id', 'message', 'type', 'is_read', 'count', 'created_at']
+        read_only_fields = ['id', 'count', 'created_at']
     
     def update(self, instance, validated_data):
-        if 'is_read' in validated_data:
+        if validated_data.get('is_read'):
             instance.mark_as_read()
-        return instance 
\ No newline at end of file
+        return instance 
+
+
+class BroadcastSerializer(serializers.ModelSerializer):
+    user_ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+
+    class Meta:
+        model = Broadcast
+        fields = [
+            'id', 'message', 'type', 'audience', 'track', 'user_ids',
+            'status', 'total', 'sent', 'created_at', 'finished_at'
+        ]
+        read_only_fields = ['id', 'status', 'total', 'sent', 'created_at', 'finished_at']
+
+    def validate(self, data):
+        audience = data.get('audience')
+        if audience == Broadcast.AUDIENCE_TRACK and not data.get('track'):
+            raise serializers.ValidationError({'track': 'A track is required for this audience.'})
+        if audience == Broadcast.AUDIENCE_USERS and not data.get('user_ids'):
+            raise serializers.ValidationError({'user_ids': 'At least one user is required for this audience.'})
+        return data
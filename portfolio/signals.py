@@ -0,0 +1,106 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from core.versioning import bump_version
+from .models import Blob, Category, CustomCriteria, File, Folder, Notification, Rendition
+from .storage import release_blob, delete_stored_file
+from .quota import record_usage
+from .tree import invalidate_folder_tree
+from .events import publish_notification, publish_unread_count
+from .unread import adjust_unread_count, forget_unread_count
+
+
+@receiver(post_delete, sender=File)
+def release_file_content(sender, instance, **kwargs):
+    """Turn a File deletion into a blob reference-count decrement."""
+    if instance.blob_id:
+        release_blob(instance.blob_id)
+    elif instance.file:
+        delete_stored_file(instance.file.name)
+    record_usage(instance.user_id, instance.file.name, -instance.size, files=-1)
+
+
+@receiver(post_delete, sender=Blob)
+@receiver(post_delete, sender=Rendition)
+def delete_unreferenced_content(sender, instance, **kwargs):
+    """Remove a blob's or rendition's stored bytes once its row is gone."""
+    if instance.file:
+        delete_stored_file(instance.file.name)
+
+
+@receiver(post_save, sender=File)
+def count_new_file_usage(sender, instance, created, **kwargs):
+    """Add a new file's bytes to its owner's storage usage."""
+    if created:
+        record_usage(instance.user_id, instance.file.name, instance.size)
+
+
+@receiver([post_save, post_delete], sender=Folder)
+@receiver([post_save, post_delete], sender=File)
+def invalidate_cached_folder_tree(sender, instance, **kwargs):
+    """Drop the owner's cached folder tree when a folder or file changes."""
+    invalidate_folder_tree(instance.user_id)
+
+
+@receiver(post_save, sender=Notification)
+def stream_notification(sender, instance, created, **kwargs):
+    """Keep the unread counter current and push the change to open streams."""
+    user_id = instance.user_id
+    if created:
+        if not instance.is_read:
+            transaction.on_commit(lambda: adjust_unread_count(user_id, 1))
+        publish_notification(instance)
+    else:
+        def recount():
+            forget_unread_count(user_id)
+            publish_unread_count(user_id)
+
+        transaction.on_commit(recount)
+
+
+@receiver(post_delete, sender=Notification)
+def stream_unread_count(sender, instance, **kwargs):
+    if not instance.is_read:
+        user_id = instance.user_id
+
+        def counted():
+            adjust_unread_count(user_id, -1)
+            publish_unread_count(user_id)
+
+        transaction.on_commit(counted)
+
+
+# Resources whose cached ETags go stale when a row of each model changes.
+VERSIONED_RESOURCES = {
+    File: ('files',),
+    Folder: ('folders', 'files'),
+    Category: ('categories', 'files'),
+    CustomCriteria: ('criteria', 'files'),
+    Notification: ('notifications',),
+}
+
+
+def bump_data_versions(sender, instance, **kwargs):
+    """Invalidate the owner's list/detail ETags for the affected resources."""
+    bump_version(instance.user_id, *VERSIONED_RESOURCES[sender])
+
+
+for model in VERSIONED_RESOURCES:
+    post_save.connect(bump_data_versions, sender=model, dispatch_uid=f'bump_versions_save_{model.__name__}')
+    post_delete.connect(bump_data_versions, sender=model, dispatch_uid=f'bump_versions_delete_{model.__name__}')
+
+
+@receiver(m2m_changed, sender=File.categories.through)
+@receiver(m2m_changed, sender=File.custom_criteria.through)
+def bump_file_tags_version(sender, instance, action, **kwargs):
+    if action.startswith('post_'):
+        bump_version(instance.user_id, 'files')
+
+
+@receiver(post_save, sender=Rendition)
+def bump_rendition_owners_version(sender, instance, created, **kwargs):
+    """New thumbnails change ``thumbnail_urls`` for every file sharing the blob."""
+    if created:
+        owners = File.all_objects.filter(blob_id=instance.blob_id).values_list('user_id', flat=True).distinct()
+        for user_id in owners:
+            bump_version(user_id, 'files')
@@ -0,0 +1,214 @@
+import os
+import hashlib
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.core.files.storage import storages
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+# Errors a storage backend raises when a read or write fails.
+try:
+    from botocore.exceptions import BotoCoreError, ClientError
+except ImportError:  # botocore is only needed with S3 storage
+    STORAGE_ERRORS = (OSError,)
+else:
+    STORAGE_ERRORS = (OSError, BotoCoreError, ClientError)
+
+_deferred_releases = ContextVar('deferred_blob_releases', default=None)
+_collected_deletes = ContextVar('collected_storage_deletes', default=None)
+
+
+def get_s3_storage():
+    """Return the default storage if it is S3-backed, otherwise ``None``."""
+    try:
+        from storages.backends.s3boto3 import S3Boto3Storage
+    except ImportError:
+        return None
+
+    storage = storages['default']
+    return storage if isinstance(storage, S3Boto3Storage) else None
+
+
+def get_s3_client(storage):
+    """Return the low-level boto3 client behind an ``S3Boto3Storage``."""
+    return storage.connection.meta.client
+
+
+def s3_key(storage, name):
+    """Translate a storage name into the object key inside the bucket."""
+    return storage._normalize_name(name)
+
+
+def file_digest(content):
+    """SHA-256 of ``content``, read chunk by chunk and rewound afterwards."""
+    sha = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks():
+        sha.update(chunk)
+    content.seek(0)
+    return sha.hexdigest()
+
+
+def acquire_blob(content):
+    """
+    Return the ``Blob`` holding ``content`` with one more reference taken.
+
+    The bytes are only written to storage when no blob with the same
+    SHA-256 exists yet.
+    """
+    from .models import Blob
+
+    digest = file_digest(content)
+    if Blob.objects.filter(sha256=digest).update(ref_count=F('ref_count') + 1):
+        return Blob.objects.get(sha256=digest)
+
+    blob = Blob(sha256=digest, size=content.size, ref_count=1)
+    blob.file.save(os.path.basename(content.name), content, save=False)
+    try:
+        with transaction.atomic():
+            blob.save()
+    except IntegrityError:
+        # A concurrent upload of the same content won the race; use its copy.
+        blob.file.storage.delete(blob.file.name)
+        Blob.objects.filter(sha256=digest).update(ref_count=F('ref_count') + 1)
+        return Blob.objects.get(sha256=digest)
+    return blob
+
+
+def adopt_blob(file):
+    """
+    Attach a ``Blob`` to a file whose content was stored without one (e.g.
+    a presigned upload written straight to S3). Its object becomes the new
+    blob's content, or is deleted in favour of an existing blob with the
+    same bytes. Returns the file's blob.
+    """
+    from .models import Blob, File
+
+    name = file.file.name
+    with file.file.open('rb') as fh:
+        digest = file_digest(fh)
+
+    with transaction.atomic():
+        # Lock the file so concurrent adoptions take one reference between them.
+        current = File.all_objects.select_for_update().filter(pk=file.pk).values_list('blob_id', 'file').first()
+        if current is None:
+            return None
+        if current != (None, name):
+            # Adopted, or given new content, since it was loaded.
+            file.refresh_from_db(fields=['blob', 'file'])
+            return file.blob
+
+        blob = None
+        if not Blob.objects.filter(sha256=digest).update(ref_count=F('ref_count') + 1):
+            try:
+                with transaction.atomic():
+                    blob = Blob.objects.create(sha256=digest, file=name, size=file.size, ref_count=1)
+            except IntegrityError:
+                Blob.objects.filter(sha256=digest).update(ref_count=F('ref_count') + 1)
+        if blob is None:
+            blob = Blob.objects.get(sha256=digest)
+            if blob.file.name != name:
+                delete_stored_file(name)
+        File.all_objects.filter(pk=file.pk).update(blob=blob, file=blob.file.name)
+    file.blob, file.file = blob, blob.file.name
+    return blob
+
+
+def release_blob(blob_id):
+    """Drop one reference to a blob, deleting it once nothing points at it."""
+    pending = _deferred_releases.get()
+    if pending is not None:
+        pending[blob_id] += 1
+        return
+    _release_blobs(Counter([blob_id]))
+
+
+def _release_blobs(releases):
+    from .models import Blob
+
+    by_amount = {}
+    for blob_id, amount in releases.items():
+        by_amount.setdefault(amount, []).append(blob_id)
+    for amount, blob_ids in by_amount.items():
+        Blob.objects.filter(pk__in=blob_ids).update(ref_count=F('ref_count') - amount)
+    # The post_delete handlers in signals.py remove the stored content.
+    Blob.objects.filter(pk__in=list(releases), ref_count__lte=0).delete()
+
+
+@contextmanager
+def deferred_blob_releases():
+    """
+    Collect ``release_blob`` calls made inside the block (e.g. by the
+    post_delete handler during a bulk delete) and apply them as a few
+    grouped updates on exit.
+    """
+    pending = Counter()
+    token = _deferred_releases.set(pending)
+    try:
+        yield
+    finally:
+        _deferred_releases.reset(token)
+    if pending:
+        _release_blobs(pending)
+
+
+def delete_stored_file(name):
+    """Delete a stored file once the transaction commits (or hand it to the active collector)."""
+    pending = _collected_deletes.get()
+    if pending is not None:
+        pending.append(name)
+        return
+    storage = storages['default']
+    transaction.on_commit(lambda: storage.delete(name))
+
+
+@contextmanager
+def collect_storage_deletes():
+    """
+    Gather the names ``delete_stored_file`` is asked to remove inside the
+    block instead of deleting them one by one; pass the yielded list to
+    ``delete_storage_objects`` afterwards.
+    """
+    pending = []
+    token = _collected_deletes.set(pending)
+    try:
+        yield pending
+    finally:
+        _collected_deletes.reset(token)
+
+
+def delete_storage_objects(names, workers=8):
+    """
+    Remove many stored files concurrently. On S3 keys go out in
+    ``DeleteObjects`` batches of 1000; elsewhere each file is deleted from
+    a thread pool. Returns the number of names processed.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    names = list(dict.fromkeys(name for name in names if name))
+    if not names:
+        return 0
+
+    storage = get_s3_storage()
+    if storage is not None:
+        client = get_s3_client(storage)
+        keys = [s3_key(storage, name) for name in names]
+
+        def delete_batch(batch):
+            client.delete_objects(
+                Bucket=storage.bucket_name,
+                Delete={'Objects': [{'Key': key} for key in batch], 'Quiet': True},
+            )
+
+        tasks = [keys[i:i + 1000] for i in range(0, len(keys), 1000)]
+        work = delete_batch
+    else:
+        storage = storages['default']
+        tasks = names
+        work = storage.delete
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # list() re-raises the first error from any worker.
+        list(pool.map(work, tasks))
+    return len(names)
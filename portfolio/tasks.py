@@ -1,84 +1,369 @@
+import os
 from celery import shared_task
-from django.core.mail import send_mail
 from django.conf import settings
-from django.template.loader import render_to_string
-from .models import File, Notification
-from .utils import validate_file_type, validate_file_size, get_file_category
+from django.db import connection, transaction
+from core.versioning import bump_version
+from .models import Broadcast, File, FileText, UploadSession, Notification
 
 
+def schedule_file_processing(file):
+    """Queue the ingestion pipeline for a new or replaced file once it is committed."""
+    transaction.on_commit(lambda: process_uploaded_file.delay(file.id))
+
+def schedule_batch_processing(file_ids):
+    """Queue the ingestion pipeline for many new files as a single Celery group."""
+    from celery import group
+
+    def enqueue():
+        group([process_uploaded_file.s(file_id) for file_id in file_ids]).apply_async()
+
+    if file_ids:
+        transaction.on_commit(enqueue)
+
 @shared_task
 def test_add(x, y):
     return x + y
 
 @shared_task
-def process_uploaded_file(file_id):
-    """Process uploaded file in the background."""
+def generate_renditions(file_id):
+    """Build WebP thumbnails/previews for a file's content."""
+    from .renditions import build_renditions
+    from .storage import adopt_blob
+
+    file = File.objects.select_related('blob').filter(id=file_id).first()
+    if file is None or not file.file:
+        return 'Nothing to render'
+    if file.blob is None:
+        # Presigned uploads reach storage without a blob; renditions hang off one.
+        adopt_blob(file)
+        if file.blob is None:
+            return 'Nothing to render'
+
+    ext = os.path.splitext(file.file.name)[1][1:].lower()
+    created = build_renditions(file.blob, ext)
+    return f'Created {len(created)} renditions for file {file_id}'
+
+# Routed to the ``extraction`` queue (CELERY_TASK_ROUTES), whose worker's
+# concurrency bounds parallelism. The hard limit has the pool replace a
+# child stuck on a pathological document.
+@shared_task(soft_time_limit=settings.TEXT_EXTRACTION_TIMEOUT, time_limit=settings.TEXT_EXTRACTION_TIMEOUT + 30)
+def extract_file_text(file_id):
+    """Extract a document's plain text into the search index."""
+    from .extraction import extract_file, is_extractable
+
+    file = File.objects.filter(id=file_id).first()
+    if file is None:
+        return 'File no longer exists'
+
+    ext = os.path.splitext(file.file.name)[1][1:].lower()
+    if not is_extractable(ext) or file.size > settings.TEXT_EXTRACTION_MAX_BYTES:
+        return f'Skipped text extraction for file {file_id}'
+
+    content, truncated = extract_file(file.file, ext)
+    FileText.objects.update_or_create(
+        file_id=file_id,
+        defaults={'content': content, 'truncated': truncated},
+    )
+    # Snippets and matches in cached file listings depend on the text.
+    bump_version(file.user_id, 'files')
+    return f'Extracted {len(content)} characters from file {file_id}'
+
+@shared_task(bind=True, autoretry_for=(OSError,), retry_backoff=True, max_retries=5)
+def process_uploaded_file(self, file_id):
+    """
+    Ingestion pipeline: pending -> sniffed -> validated -> ready (or failed).
+
+    Each stage only runs if the file is still in the stage before it, so a
+    retried or duplicated task resumes where the last run stopped.
+    """
+    from celery import group
+    from .ingestion import IngestionError, advance, fail, sniff, validate
+
+    file = File.objects.filter(id=file_id).first()
+    if file is None:
+        return 'File no longer exists'
+    if file.processing_status in (File.STATUS_READY, File.STATUS_FAILED):
+        return f'File {file_id} is already {file.processing_status}'
+
     try:
-        file = File.objects.get(id=file_id)
-        
-        # Validate file
-        validate_file_type(file.file)
-        validate_file_size(file.file)
-        
-        # Set file category
-        file.category = get_file_category(file.file)
-        file.save()
-        
-        # Create notification
-        Notification.objects.create(
-            user=file.owner,
-            message=f'File {file.name} has been processed successfully.',
-            type='success'
+        if file.processing_status == File.STATUS_PENDING:
+            sniff(file)
+        validate(file)
+    except IngestionError as e:
+        fail(file_id, e)
+        bump_version(file.user_id, 'files')
+        Notification.objects.notify(
+            file.user_id, f'Error processing file {file.title}: {e}', type='error'
         )
-        
-        return f'File {file.name} processed successfully'
-    except Exception as e:
-        # Create error notification
-        Notification.objects.create(
-            user=file.owner,
-            message=f'Error processing file {file.name}: {str(e)}',
-            type='error'
+        return f'File {file_id} failed validation'
+
+    # Derived work is idempotent, so dispatching it again on a retry is harmless.
+    group(generate_renditions.s(file_id), extract_file_text.s(file_id)).apply_async()
+    if advance(file_id, File.STATUS_VALIDATED, File.STATUS_READY):
+        bump_version(file.user_id, 'files')
+        Notification.objects.notify(
+            file.user_id, f'File {file.title} has been processed successfully.', type='success'
         )
-        raise
+    return f'File {file_id} is ready'
 
 @shared_task
 def send_email_notification(user_id, subject, message):
-    """Send email notification in the background."""
+    """
+    Queue a notification email. Users who opted into the daily digest get
+    it there instead.
+    """
     from django.contrib.auth import get_user_model
-    User = get_user_model()
-    
-    try:
-        user = User.objects.get(id=user_id)
-        html_message = render_to_string('email/notification.html', {
-            'user': user,
-            'message': message
-        })
-        
-        send_mail(
-            subject=subject,
-            message=message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[user.email],
-            html_message=html_message,
-            fail_silently=False,
-        )
-        return f'Email sent to {user.email}'
-    except Exception as e:
-        raise
+    from users.mail import queue_email, render_email
+
+    user = get_user_model().objects.filter(id=user_id, is_active=True).first()
+    if user is None:
+        return f'User {user_id} not found'
+    if user.email_digest:
+        return f'Deferred to the digest for {user.email}'
+
+    html_message = render_email('email/notification.html', {'user': user, 'message': message})
+    queue_email(user.email, subject, message, html_body=html_message, user=user)
+    return f'Email queued for {user.email}'
+
+@shared_task
+def send_notification_digests():
+    """
+    Queue one email per digest subscriber listing the unread notifications
+    of the last day. Subscribers are paged by id and their notifications
+    fetched with one query per page.
+    """
+    from collections import defaultdict
+    from datetime import timedelta
+    from django.contrib.auth import get_user_model
+    from django.utils import timezone
+    from users.mail import render_email, schedule_email_flush
+    from users.models import OutgoingEmail
+
+    since = timezone.now() - timedelta(days=1)
+    subscribers = get_user_model().objects.filter(email_digest=True, is_active=True).order_by('id')
+    max_items = settings.NOTIFICATION_DIGEST_MAX_ITEMS
+    last_id = queued = 0
+
+    while True:
+        users = list(subscribers.filter(id__gt=last_id)[:settings.NOTIFICATION_DIGEST_BATCH_SIZE])
+        if not users:
+            break
+        last_id = users[-1].id
+
+        pending = defaultdict(list)
+        notifications = Notification.objects.filter(
+            user_id__in=[user.id for user in users], is_read=False, created_at__gte=since
+        ).order_by('user_id', '-created_at').only('user_id', 'message', 'type', 'count', 'created_at')
+        for notification in notifications:
+            pending[notification.user_id].append(notification)
+
+        emails = []
+        for user in users:
+            items = pending.get(user.id)
+            if not items:
+                continue
+            context = {'user': user, 'notifications': items[:max_items], 'remaining': len(items) - max_items}
+            subject = f'You have {len(items)} new notification{"s" if len(items) != 1 else ""}'
+            body = '\n'.join(f'- {item.message}' for item in items[:max_items])
+            emails.append(OutgoingEmail(
+                user=user, to_email=user.email, subject=subject, body=body,
+                html_body=render_email('email/digest.html', context)
+            ))
+        OutgoingEmail.objects.bulk_create(emails)
+        queued += len(emails)
+
+    if queued:
+        schedule_email_flush()
+    return f'Queued {queued} digest emails'
+
+PURGE_CHECKPOINT_KEY = 'portfolio:purge_trash_checkpoint'
 
 @shared_task
 def cleanup_old_files():
-    """Clean up old files that are no longer needed."""
+    """
+    Permanently delete files that have been in the trash for longer than
+    ``FILE_TRASH_RETENTION_DAYS``, in bounded id-ordered batches.
+
+    The last purged id is checkpointed in the cache so a restarted worker
+    resumes where it stopped; storage objects freed by each batch are
+    deleted concurrently once the batch's transaction has committed.
+    """
+    import time
+    from datetime import timedelta
+    from django.core.cache import cache
+    from django.utils import timezone
+    from .quota import deferred_usage_changes
+    from .storage import collect_storage_deletes, deferred_blob_releases, delete_storage_objects
+
+    cutoff = timezone.now() - timedelta(days=settings.FILE_TRASH_RETENTION_DAYS)
+    last_id = cache.get(PURGE_CHECKPOINT_KEY, 0)
+    purged = 0
+
+    for _ in range(settings.FILE_PURGE_MAX_BATCHES):
+        batch = list(
+            File.all_objects.filter(deleted_at__lt=cutoff, id__gt=last_id)
+            .order_by('id').values_list('id', flat=True)[:settings.FILE_PURGE_BATCH_SIZE]
+        )
+        if not batch:
+            # A full pass finished; the next run starts from the beginning.
+            cache.delete(PURGE_CHECKPOINT_KEY)
+            break
+
+        with collect_storage_deletes() as names:
+            with transaction.atomic(), deferred_blob_releases(), deferred_usage_changes():
+                # Files restored since the batch was read are left alone.
+                expired = list(
+                    File.all_objects.select_for_update()
+                    .filter(id__in=batch, deleted_at__lt=cutoff).values_list('id', flat=True)
+                )
+                File.all_objects.filter(id__in=expired).delete()
+        delete_storage_objects(names, workers=settings.FILE_PURGE_WORKERS)
+
+        last_id = batch[-1]
+        cache.set(PURGE_CHECKPOINT_KEY, last_id, None)
+        purged += len(expired)
+        time.sleep(settings.FILE_PURGE_BATCH_PAUSE)
+
+    return f'Purged {purged} trashed files'
+
+@shared_task
+def cleanup_expired_uploads():
+    """Remove upload sessions that were abandoned before being finalized."""
     from django.utils import timezone
     from datetime import timedelta
-    
-    # Delete files older than 30 days
-    old_files = File.objects.filter(
-        created_at__lt=timezone.now() - timedelta(days=30),
-        is_deleted=True
-    )
-    
-    count = old_files.count()
-    old_files.delete()
-    
-    return f'Deleted {count} old files' 
\ No newline at end of file
+
+    cutoff = timezone.now() - timedelta(hours=settings.CHUNKED_UPLOAD_EXPIRATION_HOURS)
+
+    count = 0
+    for session in UploadSession.objects.filter(status='active', updated_at__lt=cutoff).iterator():
+        session.discard_temp_file()
+        session.delete()
+        count += 1
+
+    UploadSession.objects.filter(status='complete', updated_at__lt=cutoff).delete()
+
+    return f'Removed {count} expired upload sessions'
+
+@shared_task
+def reconcile_storage_usage():
+    """Rewrite storage usage counters that drifted from the real file totals."""
+    from .quota import reconcile_usage
+
+    fixed = reconcile_usage()
+    return f'Reconciled storage usage for {fixed} users'
+
+@shared_task
+def apply_notification_retention():
+    """
+    Move read notifications older than ``NOTIFICATION_RETENTION_DAYS`` out
+    of the hot table in bounded id-ordered batches: copied to
+    ``NotificationArchive`` and deleted, or only deleted, depending on
+    ``NOTIFICATION_RETENTION_MODE``. Unread notifications are never touched.
+    """
+    import logging
+    from datetime import timedelta
+    from django.utils import timezone
+    from core.versioning import invalidate_versions
+    from .models import NotificationArchive
+
+    archive = settings.NOTIFICATION_RETENTION_MODE == 'archive'
+    table = connection.ops.quote_name(Notification._meta.db_table)
+    cutoff = timezone.now() - timedelta(days=settings.NOTIFICATION_RETENTION_DAYS)
+    expired = Notification.objects.filter(is_read=True, created_at__lt=cutoff).order_by('id')
+    last_id = reclaimed = 0
+
+    for _ in range(settings.NOTIFICATION_RETENTION_MAX_BATCHES):
+        batch = list(
+            expired.filter(id__gt=last_id)
+            .values('id', 'user_id', 'message', 'type', 'count', 'created_at')
+            [:settings.NOTIFICATION_RETENTION_BATCH_SIZE]
+        )
+        if not batch:
+            break
+        ids = [row['id'] for row in batch]
+        with transaction.atomic():
+            if archive:
+                NotificationArchive.objects.bulk_create(
+                    [NotificationArchive(**{k: v for k, v in row.items() if k != 'id'}) for row in batch]
+                )
+            # One DELETE without per-row signals; versions are invalidated in bulk below.
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'DELETE FROM {table} WHERE id IN ({", ".join(["%s"] * len(ids))}) AND is_read = %s',
+                    [*ids, True],
+                )
+        invalidate_versions({row['user_id'] for row in batch}, 'notifications')
+        last_id = ids[-1]
+        reclaimed += len(ids)
+
+    action = 'Archived' if archive else 'Deleted'
+    report = f'{action} {reclaimed} read notifications older than {settings.NOTIFICATION_RETENTION_DAYS} days'
+    logging.getLogger(__name__).info(report)
+    return report
+
+def _finish_broadcast(broadcast_id):
+    from django.db.models import F
+    from django.utils import timezone
+
+    Broadcast.objects.filter(
+        pk=broadcast_id, status='running', total__isnull=False, sent__gte=F('total')
+    ).update(status='done', finished_at=timezone.now())
+
+@shared_task
+def deliver_broadcast(broadcast_id):
+    """
+    Fan a broadcast out: page through the audience by primary key and
+    queue one ``deliver_broadcast_chunk`` per page, so the inserts are
+    spread across workers.
+    """
+    if not Broadcast.objects.filter(pk=broadcast_id, status='pending').update(status='running'):
+        return f'Broadcast {broadcast_id} already started'
+
+    recipients = Broadcast.objects.get(pk=broadcast_id).recipient_ids()
+    # A first estimate for progress; corrected to the exact number queued below.
+    Broadcast.objects.filter(pk=broadcast_id).update(total=recipients.count())
+
+    chunk_size = settings.NOTIFICATION_BROADCAST_CHUNK_SIZE
+    queued = chunks = last_id = 0
+    while True:
+        user_ids = list(recipients.filter(id__gt=last_id).order_by('id')[:chunk_size])
+        if not user_ids:
+            break
+        deliver_broadcast_chunk.delay(broadcast_id, user_ids)
+        queued += len(user_ids)
+        chunks += 1
+        last_id = user_ids[-1]
+
+    Broadcast.objects.filter(pk=broadcast_id).update(total=queued)
+    _finish_broadcast(broadcast_id)
+    return f'Queued {queued} notifications in {chunks} chunks for broadcast {broadcast_id}'
+
+@shared_task
+def deliver_broadcast_chunk(broadcast_id, user_ids):
+    """Insert one chunk of a broadcast with batched ``bulk_create`` and record the progress."""
+    from django.db.models import F
+    from core.versioning import invalidate_versions
+    from .events import publish_notifications
+    from .unread import forget_unread_counts
+
+    content = Broadcast.objects.filter(pk=broadcast_id).values('message', 'type').first()
+    if content is None:
+        return f'Broadcast {broadcast_id} no longer exists'
+
+    with transaction.atomic():
+        notifications = Notification.objects.bulk_create(
+            [Notification(user_id=user_id, **content) for user_id in user_ids],
+            batch_size=settings.NOTIFICATION_BROADCAST_BATCH_SIZE,
+        )
+        Broadcast.objects.filter(pk=broadcast_id).update(sent=F('sent') + len(user_ids))
+
+        def announce():
+            # bulk_create sends no signals; invalidate in bulk instead.
+            invalidate_versions(user_ids, 'notifications')
+            forget_unread_counts(user_ids)
+            publish_notifications(notifications)
+
+        transaction.on_commit(announce)
+
+    _finish_broadcast(broadcast_id)
+    return f'Sent {len(user_ids)} notifications for broadcast {broadcast_id}'
@@ -1,17 +1,41 @@
-from django.test import TestCase
+from asgiref.sync import async_to_sync
+from django.test import TestCase, override_settings
+from unittest import mock, skipUnless
 from django.contrib.auth import get_user_model
 from rest_framework.test import APIClient
 from rest_framework import status
-from .models import File, Notification
-from .tasks import process_uploaded_file
+from core.testing import QueryBudgetMixin, TempMediaMixin
+from .models import (
+    Blob, Rendition, Category, CustomCriteria, Folder, File, FileText, StorageUsage, UploadSession, Notification,
+    Track, Broadcast
+)
+from .tasks import (
+    process_uploaded_file, generate_renditions, extract_file_text, reconcile_storage_usage,
+    cleanup_old_files, deliver_broadcast_chunk, PURGE_CHECKPOINT_KEY
+)
 from django.core.files.uploadedfile import SimpleUploadedFile
+from .storage import adopt_blob
+from .events import issue_stream_ticket, redeem_stream_ticket
 import os
+import io
+import zipfile
+import zlib
+
+try:
+    import boto3
+    from moto import mock_aws
+except ImportError:  # moto is only needed for the S3 tests
+    mock_aws = None
 
 User = get_user_model()
 
 class NotificationTests(TestCase):
     def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
         self.user = User.objects.create_user(
+            username='testuser',
             email='test@example.com',
             password='testpass123'
         )
@@ -29,8 +53,8 @@ class NotificationTests(TestCase):
         """Test retrieving user notifications."""
         response = self.client.get('/api/portfolio/notifications/')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['message'], 'Test notification')
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(response.data['results'][0]['message'], 'Test notification')
     
     def test_mark_notification_read(self):
         """Test marking a notification as read."""
@@ -66,9 +90,172 @@ class NotificationTests(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['unread_count'], 1)
 
-class FileProcessingTests(TestCase):
+    def test_unread_count_is_cached(self):
+        """Test the badge count is rebuilt once, then served without queries."""
+        self.client.get('/api/portfolio/notifications/unread_count/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/portfolio/notifications/unread_count/')
+        self.assertEqual(response.data['unread_count'], 1)
+
+    def test_unread_counter_follows_changes(self):
+        """Test create, read, delete and mark-all keep the counter in step with the rows."""
+        url = '/api/portfolio/notifications/unread_count/'
+        self.assertEqual(self.client.get(url).data['unread_count'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second = Notification.objects.create(user=self.user, message='second', type='info')
+            third = Notification.objects.create(user=self.user, message='third', type='info')
+        self.assertEqual(self.client.get(url).data['unread_count'], 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/portfolio/notifications/{second.id}/', {'is_read': True})
+            self.client.patch(f'/api/portfolio/notifications/{second.id}/', {'is_read': True})
+        self.assertEqual(self.client.get(url).data['unread_count'], 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            third.delete()
+        self.assertEqual(self.client.get(url).data['unread_count'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/portfolio/notifications/mark_all_read/')
+        self.assertEqual(self.client.get(url).data['unread_count'], 0)
+        self.assertFalse(Notification.objects.filter(user=self.user, is_read=False).exists())
+
+    def test_rebuild_racing_an_increment(self):
+        """Test an increment that finds no counter while it is being rebuilt is not lost."""
+        from django.db.models import QuerySet
+        from .unread import adjust_unread_count, get_unread_count
+
+        real_count = QuerySet.count
+
+        def count_then_notify(queryset):
+            count = real_count(queryset)
+            # Committed after the COUNT read, before the rebuilt counter is stored.
+            Notification.objects.bulk_create([Notification(user=self.user, message='late', type='info')])
+            adjust_unread_count(self.user.id, 1)
+            return count
+
+        with mock.patch.object(QuerySet, 'count', count_then_notify):
+            self.assertEqual(get_unread_count(self.user.id), 1)
+        self.assertEqual(get_unread_count(self.user.id), 2)
+
+    def test_mark_all_read_keeps_notifications_created_meanwhile(self):
+        """Test mark_all_read recounts instead of zeroing the counter."""
+        from .unread import adjust_unread_count
+
+        url = '/api/portfolio/notifications/unread_count/'
+        self.assertEqual(self.client.get(url).data['unread_count'], 1)
+
+        def notify_meanwhile(*args):
+            # Another request's notification, committed and counted mid-request.
+            Notification.objects.bulk_create([Notification(user=self.user, message='meanwhile', type='info')])
+            adjust_unread_count(self.user.id, 1)
+
+        with mock.patch('portfolio.views.bump_version', side_effect=notify_meanwhile):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post('/api/portfolio/notifications/mark_all_read/')
+        self.assertEqual(self.client.get(url).data['unread_count'], 1)
+
+    def test_repeats_collapse(self):
+        """Test repeated unread notifications fold into one row with a count."""
+        with mock.patch('django_redis.get_redis_connection'):
+            first = Notification.objects.notify(self.user.id, 'Sync failed', type='error')
+            second = Notification.objects.notify(self.user.id, 'Sync failed', type='error')
+            other = Notification.objects.notify(self.user.id, 'Sync failed', type='warning')
+        self.assertEqual(first.pk, second.pk)
+        self.assertNotEqual(first.pk, other.pk)
+        first.refresh_from_db()
+        self.assertEqual(first.count, 2)
+
+        first.mark_as_read()
+        with mock.patch('django_redis.get_redis_connection'):
+            third = Notification.objects.notify(self.user.id, 'Sync failed', type='error')
+        self.assertNotEqual(third.pk, first.pk)
+
+    @override_settings(NOTIFICATION_RETENTION_DAYS=30, NOTIFICATION_RETENTION_BATCH_SIZE=2)
+    def test_retention_archives_old_read_rows(self):
+        """Test only old read notifications leave the table, archived in batches."""
+        from datetime import timedelta
+        from django.utils import timezone
+        from .models import NotificationArchive
+        from .tasks import apply_notification_retention
+
+        old = timezone.now() - timedelta(days=31)
+        expired = Notification.objects.bulk_create(
+            [Notification(user=self.user, message=f'old {i}', is_read=True) for i in range(3)]
+        )
+        Notification.objects.filter(pk__in=[n.pk for n in expired]).update(created_at=old)
+        Notification.objects.filter(pk=self.notification.pk).update(created_at=old)  # old but unread
+        recent = Notification.objects.create(user=self.user, message='recent', is_read=True)
+
+        self.assertEqual(apply_notification_retention(), 'Archived 3 read notifications older than 30 days')
+        self.assertEqual(
+            set(Notification.objects.values_list('pk', flat=True)), {self.notification.pk, recent.pk}
+        )
+        self.assertEqual(
+            sorted(NotificationArchive.objects.values_list('message', flat=True)), ['old 0', 'old 1', 'old 2']
+        )
+
+        with override_settings(NOTIFICATION_RETENTION_MODE='delete', NOTIFICATION_RETENTION_DAYS=0):
+            self.assertIn('Deleted 1', apply_notification_retention())
+        self.assertEqual(NotificationArchive.objects.count(), 3)
+
+    def test_email_notification_is_queued_and_sent(self):
+        """Test notification emails go through the queue with the HTML template."""
+        from django.core import mail
+        from .tasks import send_email_notification
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(
+                send_email_notification(self.user.id, 'Heads up', 'Your export is ready.'),
+                'Email queued for test@example.com'
+            )
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].subject, 'Heads up')
+        self.assertIn('Your export is ready.', mail.outbox[0].alternatives[0][0])
+
+    @override_settings(NOTIFICATION_DIGEST_MAX_ITEMS=2)
+    def test_digest_rolls_notifications_into_one_email(self):
+        """Test digest subscribers get one email per day and no per-notification emails."""
+        from django.core import mail
+        from .tasks import send_email_notification, send_notification_digests
+
+        User.objects.filter(pk=self.user.pk).update(email_digest=True)
+        User.objects.create_user(username='quiet', email='quiet@example.com', password='testpass123')
+        self.assertIn('Deferred to the digest', send_email_notification(self.user.id, 'Heads up', 'x'))
+        Notification.objects.bulk_create(
+            [Notification(user=self.user, message=f'Update {i}') for i in range(2)]
+        )
+
+        self.assertEqual(send_notification_digests(), 'Queued 1 digest emails')
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['test@example.com'])
+        self.assertEqual(mail.outbox[0].subject, 'You have 3 new notifications')
+        self.assertIn('and 1 more', mail.outbox[0].alternatives[0][0])
+
+    @override_settings(NOTIFICATION_MARK_READ_BATCH_SIZE=2)
+    def test_mark_all_read_in_batches(self):
+        """Test mark_all_read walks the unread rows in bounded batches."""
+        Notification.objects.bulk_create(
+            [Notification(user=self.user, message=f'n{i}', type='info') for i in range(4)]
+        )
+        self.client.post('/api/portfolio/notifications/mark_all_read/')
+        self.assertFalse(Notification.objects.filter(user=self.user, is_read=False).exists())
+
+    def test_mark_as_read_is_conditional(self):
+        """Test mark_as_read is one UPDATE and a no-op the second time."""
+        with self.assertNumQueries(1):
+            self.assertTrue(self.notification.mark_as_read())
+        self.assertFalse(self.notification.mark_as_read())
+        self.notification.refresh_from_db()
+        self.assertTrue(self.notification.is_read)
+
+class FileProcessingTests(TempMediaMixin, TestCase):
     def setUp(self):
+        super().setUp()
+
         self.user = User.objects.create_user(
+            username='testuser',
             email='test@example.com',
             password='testpass123'
         )
@@ -81,18 +268,20 @@ class FileProcessingTests(TestCase):
         )
         
         self.file = File.objects.create(
-            name='test.txt',
-            file=self.test_file,
-            owner=self.user
+            user=self.user,
+            title='test.txt',
+            file=self.test_file
         )
     
     def test_file_processing(self):
         """Test file processing task."""
+        self.assertEqual(self.file.processing_status, File.STATUS_PENDING)
         result = process_uploaded_file.delay(self.file.id)
         result.get()  # Wait for task to complete
         
         self.file.refresh_from_db()
-        self.assertEqual(self.file.category, 'document')
+        self.assertEqual(self.file.processing_status, File.STATUS_READY)
+        self.assertEqual(self.file.content_type, 'text/plain')
         
         # Check if notification was created
         notification = Notification.objects.filter(
@@ -100,23 +289,47 @@ class FileProcessingTests(TestCase):
             message__contains='processed successfully'
         ).first()
         self.assertIsNotNone(notification)
+
+    def test_processing_is_idempotent(self):
+        """Test running the pipeline again does not repeat its side effects."""
+        process_uploaded_file.delay(self.file.id).get()
+        process_uploaded_file.delay(self.file.id).get()
+        self.assertEqual(Notification.objects.filter(user=self.user, type='success').count(), 1)
+
+    def test_resumes_from_current_stage(self):
+        """Test a retried task skips stages that already completed."""
+        File.objects.filter(pk=self.file.pk).update(processing_status=File.STATUS_SNIFFED, content_type='text/plain')
+        with mock.patch('portfolio.ingestion.read_header') as read_header:
+            process_uploaded_file.delay(self.file.id).get()
+        read_header.assert_not_called()
+        self.file.refresh_from_db()
+        self.assertEqual(self.file.processing_status, File.STATUS_READY)
+
+    def test_header_only_read(self):
+        """Test sniffing reads only the configured number of header bytes."""
+        from .ingestion import read_header
+
+        with override_settings(FILE_SNIFF_BYTES=4):
+            self.assertEqual(read_header(self.file), b'Test')
     
     def test_invalid_file_type(self):
         """Test processing invalid file type."""
         invalid_file = SimpleUploadedFile(
             name='test.exe',
-            content=b'Invalid file content',
+            content=b'MZ' + b'\x00' * 62 + b'PE\x00\x00',
             content_type='application/x-msdownload'
         )
         
         file = File.objects.create(
-            name='test.exe',
-            file=invalid_file,
-            owner=self.user
+            user=self.user,
+            title='test.exe',
+            file=invalid_file
         )
         
-        with self.assertRaises(Exception):
-            process_uploaded_file.delay(file.id).get()
+        process_uploaded_file.delay(file.id).get()
+        file.refresh_from_db()
+        self.assertEqual(file.processing_status, File.STATUS_FAILED)
+        self.assertTrue(file.processing_error)
         
         # Check if error notification was created
         notification = Notification.objects.filter(
@@ -124,3 +337,1447 @@ class FileProcessingTests(TestCase):
             type='error'
         ).first()
         self.assertIsNotNone(notification)
+
+    def test_image_extension_must_match_content(self):
+        """Test a non-image renamed to .png fails validation."""
+        file = File.objects.create(
+            user=self.user,
+            title='fake.png',
+            file=SimpleUploadedFile('fake.png', b'just some text pretending')
+        )
+        process_uploaded_file.delay(file.id).get()
+        file.refresh_from_db()
+        self.assertEqual(file.processing_status, File.STATUS_FAILED)
+
+class ChunkedUploadTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        overrides = override_settings(
+            CHUNKED_UPLOAD_DIR=os.path.join(self.media_root, 'chunks'),
+            CHUNKED_UPLOAD_CHUNK_SIZE=4,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        self.user = User.objects.create_user(
+            username='uploader',
+            email='uploader@example.com',
+            password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.content = b'0123456789'
+
+    def create_session(self):
+        response = self.client.post('/api/portfolio/uploads/', {
+            'filename': 'notes.txt',
+            'total_size': len(self.content),
+        })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['total_chunks'], 3)
+        return response.data['id']
+
+    def put_chunk(self, session_id, index):
+        chunk = self.content[index * 4:(index + 1) * 4]
+        return self.client.put(
+            f'/api/portfolio/uploads/{session_id}/chunks/{index}/',
+            data=chunk,
+            content_type='application/octet-stream',
+            HTTP_X_CHUNK_CHECKSUM=f'{zlib.crc32(chunk):08x}'
+        )
+
+    def test_chunked_upload_creates_file(self):
+        """Test uploading a file in chunks and finalizing it."""
+        session_id = self.create_session()
+        for index in range(3):
+            response = self.put_chunk(session_id, index)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.post(f'/api/portfolio/uploads/{session_id}/finalize/', {
+            'checksum': f'{zlib.crc32(self.content):08x}'
+        })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        file = File.objects.get(id=response.data['id'])
+        self.assertEqual(file.title, 'notes.txt')
+        with file.file.open('rb') as fh:
+            self.assertEqual(fh.read(), self.content)
+        self.assertFalse(os.path.exists(UploadSession.objects.get(id=session_id).temp_path))
+
+    def test_chunk_retry_and_out_of_order(self):
+        """Test that re-sent chunks are accepted and skipped chunks are rejected."""
+        session_id = self.create_session()
+        self.put_chunk(session_id, 0)
+
+        response = self.put_chunk(session_id, 0)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['next_chunk'], 1)
+
+        response = self.put_chunk(session_id, 2)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        response = self.client.post(f'/api/portfolio/uploads/{session_id}/finalize/')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_chunk_checksum_mismatch(self):
+        """Test that a corrupted chunk is discarded."""
+        session_id = self.create_session()
+        response = self.client.put(
+            f'/api/portfolio/uploads/{session_id}/chunks/0/',
+            data=b'xxxx',
+            content_type='application/octet-stream',
+            HTTP_X_CHUNK_CHECKSUM=f'{zlib.crc32(b"0123"):08x}'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        session = UploadSession.objects.get(id=session_id)
+        self.assertEqual(session.received_bytes, 0)
+        self.assertEqual(os.path.getsize(session.temp_path), 0)
+
+    def test_finalize_after_file_deleted(self):
+        """Test re-finalizing a session whose file was deleted reports it gone."""
+        session_id = self.create_session()
+        for index in range(3):
+            self.put_chunk(session_id, index)
+        url = f'/api/portfolio/uploads/{session_id}/finalize/'
+        file_id = self.client.post(url).data['id']
+        self.assertEqual(self.client.post(url).data['id'], file_id)
+
+        File.objects.filter(id=file_id).delete()
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_410_GONE)
+
+S3_STORAGES = {
+    'default': {'BACKEND': 'storages.backends.s3boto3.S3Boto3Storage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+@skipUnless(mock_aws, 'moto is not installed')
+@override_settings(
+    STORAGES=S3_STORAGES,
+    AWS_STORAGE_BUCKET_NAME='portfolio-test',
+    AWS_ACCESS_KEY_ID='testing',
+    AWS_SECRET_ACCESS_KEY='testing',
+    AWS_S3_CUSTOM_DOMAIN=None,
+)
+class DirectUploadTests(TestCase):
+    def setUp(self):
+        self.mock = mock_aws()
+        self.mock.start()
+        self.addCleanup(self.mock.stop)
+        self.s3 = boto3.client('s3', region_name='us-east-1')
+        self.s3.create_bucket(Bucket='portfolio-test')
+
+        self.user = User.objects.create_user(
+            username='direct',
+            email='direct@example.com',
+            password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_presign_and_finalize(self):
+        """Test that a presigned upload is registered without passing through the app."""
+        response = self.client.post('/api/portfolio/files/presign/', {
+            'filename': 'report.pdf',
+            'size': 7,
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        key = response.data['key']
+        self.assertTrue(key.startswith(f'portfolio_files/{self.user.id}/'))
+        self.assertIn('url', response.data['put'])
+        self.assertIn('fields', response.data['post'])
+
+        self.s3.put_object(Bucket='portfolio-test', Key=key, Body=b'%PDF-1.', ContentType='application/pdf')
+
+        response = self.client.post('/api/portfolio/files/presign/finalize/', {'key': key, 'title': 'Report'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['size'], 7)
+        self.assertEqual(response.data['content_type'], 'application/pdf')
+        self.assertEqual(File.objects.get(id=response.data['id']).file.name, key)
+
+    def test_finalize_rolls_back_when_quota_update_is_refused(self):
+        """Test a finalize that passed the pre-check but lost a quota race leaves no row and no object."""
+        StorageUsage.objects.create(user=self.user, total_bytes=10, quota_bytes=12)
+        key = f'portfolio_files/{self.user.id}/big.txt'
+        self.s3.put_object(Bucket='portfolio-test', Key=key, Body=b'12345')
+
+        with mock.patch('portfolio.views.check_quota'):
+            response = self.client.post('/api/portfolio/files/presign/finalize/', {'key': key, 'title': 'Big'})
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.assertFalse(File.all_objects.exists())
+        self.assertEqual(StorageUsage.objects.get(user=self.user).total_bytes, 10)
+        self.assertNotIn('Contents', self.s3.list_objects_v2(Bucket='portfolio-test'))
+
+    def test_finalize_rejects_keys_owned_by_other_rows(self):
+        """Test a key still referenced by a trashed file or a blob cannot be finalized again."""
+        key = f'portfolio_files/{self.user.id}/kept.txt'
+        self.s3.put_object(Bucket='portfolio-test', Key=key, Body=b'kept')
+        trashed = File.objects.create(user=self.user, title='kept', file=key, size=4)
+        trashed.trash()
+
+        response = self.client.post('/api/portfolio/files/presign/finalize/', {'key': key, 'title': 'Again'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        File.all_objects.filter(pk=trashed.pk).update(file=f'portfolio_files/{self.user.id}/other.txt')
+        Blob.objects.create(sha256='0' * 64, file=key, size=4, ref_count=1)
+        response = self.client.post('/api/portfolio/files/presign/finalize/', {'key': key, 'title': 'Again'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(File.all_objects.count(), 1)
+
+    @override_settings(FILE_DOWNLOAD_OFFLOAD='x-sendfile')
+    def test_sendfile_offload_falls_back_to_streaming(self):
+        """Test X-Sendfile is skipped for storage without local paths instead of failing."""
+        key = f'portfolio_files/{self.user.id}/notes.txt'
+        self.s3.put_object(Bucket='portfolio-test', Key=key, Body=b'hello s3')
+        file = File.objects.create(user=self.user, title='notes', file=key, size=8)
+
+        response = self.client.get(f'/api/portfolio/files/{file.id}/download/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('X-Sendfile', response)
+        self.assertEqual(b''.join(response.streaming_content), b'hello s3')
+
+    def test_finalize_rejects_missing_and_foreign_keys(self):
+        """Test that only existing objects under the user's prefix can be finalized."""
+        response = self.client.post('/api/portfolio/files/presign/finalize/', {
+            'key': f'portfolio_files/{self.user.id}/missing.pdf'
+        })
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post('/api/portfolio/files/presign/finalize/', {
+            'key': 'portfolio_files/999/other.pdf'
+        })
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(File.objects.exists())
+
+    def test_finalize_rejects_path_traversal(self):
+        """Test a key that climbs out of the user's prefix cannot claim another user's object."""
+        self.s3.put_object(Bucket='portfolio-test', Key='portfolio_files/999/secret.pdf', Body=b'%PDF-1.')
+        for key in (
+            f'portfolio_files/{self.user.id}/../999/secret.pdf',
+            f'portfolio_files/{self.user.id}/./../999/secret.pdf',
+            f'portfolio_files/{self.user.id}//secret.pdf',
+        ):
+            response = self.client.post('/api/portfolio/files/presign/finalize/', {'key': key})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, key)
+        self.assertFalse(File.objects.exists())
+
+class BlobStorageTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.user = User.objects.create_user(
+            username='student',
+            email='student@example.com',
+            password='testpass123'
+        )
+
+    def create_file(self, name, content):
+        return File.objects.create(
+            user=self.user,
+            title=name,
+            file=SimpleUploadedFile(name, content, content_type='application/pdf')
+        )
+
+    def test_identical_uploads_share_one_blob(self):
+        """Test that duplicate content is stored once and reference counted."""
+        first = self.create_file('syllabus.pdf', b'same bytes')
+        second = self.create_file('syllabus-copy.pdf', b'same bytes')
+
+        self.assertEqual(first.blob_id, second.blob_id)
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertEqual(Blob.objects.get().ref_count, 2)
+        self.assertEqual(second.size, len(b'same bytes'))
+
+    def test_delete_releases_blob(self):
+        """Test that stored content is removed only with its last reference."""
+        first = self.create_file('a.pdf', b'shared')
+        second = self.create_file('b.pdf', b'shared')
+        path = first.file.path
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(Blob.objects.get().ref_count, 1)
+        self.assertTrue(os.path.exists(path))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(Blob.objects.exists())
+        self.assertFalse(os.path.exists(path))
+
+    def test_replacing_content_moves_reference(self):
+        """Test that uploading new content releases the previous blob."""
+        file = self.create_file('draft.pdf', b'version one')
+        old_blob_id = file.blob_id
+
+        file.file = SimpleUploadedFile('draft.pdf', b'version two')
+        file.save()
+
+        self.assertNotEqual(file.blob_id, old_blob_id)
+        self.assertFalse(Blob.objects.filter(id=old_blob_id).exists())
+
+    def test_adopting_the_blobs_own_object_keeps_it(self):
+        """Test adopting a file that already points at its blob's object does not delete that object."""
+        from django.core.files.base import ContentFile
+        from django.core.files.storage import default_storage
+
+        key = default_storage.save(f'portfolio_files/{self.user.id}/shared.pdf', ContentFile(b'shared'))
+        first = File.objects.create(user=self.user, title='first', file=key, size=6)
+        second = File.objects.create(user=self.user, title='second', file=key, size=6)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            adopt_blob(first)
+            adopt_blob(second)
+        self.assertEqual(Blob.objects.get().ref_count, 2)
+        self.assertTrue(default_storage.exists(key))
+
+class FileDownloadTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.user = User.objects.create_user(
+            username='reader',
+            email='reader@example.com',
+            password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.file = File.objects.create(
+            user=self.user,
+            title='Slides',
+            file=SimpleUploadedFile('slides.pdf', b'0123456789', content_type='application/pdf')
+        )
+        self.url = f'/api/portfolio/files/{self.file.id}/download/'
+
+    def test_full_download(self):
+        """Test downloading the whole file."""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['ETag'], f'"{self.file.blob.sha256}"')
+        self.assertIn('Slides.pdf', response['Content-Disposition'])
+
+    def test_range_and_etag(self):
+        """Test partial downloads and conditional requests."""
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=20-')
+        self.assertEqual(response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=f'"{self.file.blob.sha256}"')
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    @override_settings(FILE_DOWNLOAD_OFFLOAD='x-accel-redirect', FILE_DOWNLOAD_ACCEL_PREFIX='/protected/')
+    def test_accel_redirect_offload(self):
+        """Test that the transfer is handed to the proxy when configured."""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected/{self.file.file.name}')
+        self.assertEqual(response.content, b'')
+
+    def test_other_users_cannot_download(self):
+        """Test that downloads are limited to the file's owner."""
+        other = User.objects.create_user(username='other', email='other@example.com', password='testpass123')
+        self.client.force_authenticate(user=other)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+class FolderExportTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.user = User.objects.create_user(
+            username='exporter',
+            email='exporter@example.com',
+            password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_export_folder_tree(self):
+        """Test exporting a folder with nested subfolders as a ZIP."""
+        root = Folder.objects.create(user=self.user, name='Year 1')
+        child = Folder.objects.create(user=self.user, name='Essays', parent=root)
+        File.objects.create(user=self.user, title='notes.txt', folder=root,
+                            file=SimpleUploadedFile('notes.txt', b'plain text ' * 100))
+        File.objects.create(user=self.user, title='photo.png', folder=child,
+                            file=SimpleUploadedFile('photo.png', b'not really a png'))
+        File.objects.create(user=self.user, title='elsewhere.txt',
+                            file=SimpleUploadedFile('elsewhere.txt', b'outside'))
+
+        response = self.client.get(f'/api/portfolio/folders/{root.id}/export.zip/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(sorted(archive.namelist()), ['Year 1/Essays/photo.png', 'Year 1/notes.txt'])
+        self.assertEqual(archive.read('Year 1/notes.txt'), b'plain text ' * 100)
+        self.assertEqual(archive.getinfo('Year 1/Essays/photo.png').compress_type, zipfile.ZIP_STORED)
+        self.assertEqual(archive.getinfo('Year 1/notes.txt').compress_type, zipfile.ZIP_DEFLATED)
+
+class FolderHierarchyTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.user = User.objects.create_user(
+            username='organiser',
+            email='organiser@example.com',
+            password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.root = Folder.objects.create(user=self.user, name='Root')
+        self.child = Folder.objects.create(user=self.user, name='Child', parent=self.root)
+        self.leaf = Folder.objects.create(user=self.user, name='Leaf', parent=self.child)
+
+    def test_paths_on_create(self):
+        """Test that new folders get their materialized path and depth."""
+        self.assertEqual(self.leaf.path, f'/{self.root.id}/{self.child.id}/{self.leaf.id}/')
+        self.assertEqual(self.leaf.depth, 2)
+        self.assertEqual(self.root.get_descendants().count(), 3)
+
+    def test_move_rewrites_subtree(self):
+        """Test moving a folder updates the paths of everything beneath it."""
+        other = Folder.objects.create(user=self.user, name='Other')
+        response = self.client.patch(
+            f'/api/portfolio/folders/{self.child.id}/', {'parent': other.id}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.leaf.refresh_from_db()
+        self.assertEqual(self.leaf.path, f'/{other.id}/{self.child.id}/{self.leaf.id}/')
+        self.assertEqual(self.leaf.depth, 2)
+        self.assertEqual(list(self.root.get_descendants()), [self.root])
+
+    def test_save_from_stale_instance(self):
+        """Test saving an instance loaded before its folder moved keeps the subtree intact."""
+        stale = Folder.objects.get(pk=self.child.pk)
+        other = Folder.objects.create(user=self.user, name='Other')
+        self.child.parent = other
+        self.child.save()
+
+        stale.parent = None
+        stale.save()
+
+        self.leaf.refresh_from_db()
+        self.assertEqual((self.leaf.path, self.leaf.depth), (f'/{self.child.id}/{self.leaf.id}/', 1))
+        self.assertEqual(Folder.objects.get(pk=self.child.pk).path, f'/{self.child.id}/')
+
+    def test_move_into_descendant_rejected(self):
+        """Test a folder cannot be moved underneath itself."""
+        response = self.client.patch(
+            f'/api/portfolio/folders/{self.root.id}/', {'parent': self.leaf.id}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_breadcrumbs(self):
+        """Test breadcrumbs list the ancestors from the root down."""
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/portfolio/folders/{self.leaf.id}/breadcrumbs/')
+        self.assertEqual([crumb['name'] for crumb in response.data], ['Root', 'Child', 'Leaf'])
+
+    def test_subtree_file_listing(self):
+        """Test listing the files anywhere under a folder."""
+        File.objects.create(user=self.user, title='deep', folder=self.leaf,
+                            file=SimpleUploadedFile('deep.txt', b'deep'))
+        File.objects.create(user=self.user, title='top', folder=self.root,
+                            file=SimpleUploadedFile('top.txt', b'top'))
+        File.objects.create(user=self.user, title='loose',
+                            file=SimpleUploadedFile('loose.txt', b'loose'))
+
+        response = self.client.get('/api/portfolio/files/', {'folder_subtree': self.child.id})
+        self.assertEqual([item['title'] for item in response.data['results']], ['deep'])
+
+    def test_tree(self):
+        """Test the nested tree endpoint with subtree file totals."""
+        File.objects.create(user=self.user, title='deep', folder=self.leaf,
+                            file=SimpleUploadedFile('deep.txt', b'12345'))
+        File.objects.create(user=self.user, title='top', folder=self.root,
+                            file=SimpleUploadedFile('top.txt', b'123'))
+
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/portfolio/folders/tree/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        root = response.data[0]
+        self.assertEqual((root['file_count'], root['total_bytes']), (2, 8))
+        child = root['children'][0]
+        self.assertEqual((child['name'], child['file_count'], child['total_bytes']), ('Child', 1, 5))
+        self.assertEqual(child['children'][0]['name'], 'Leaf')
+
+        with self.assertNumQueries(0):
+            self.client.get('/api/portfolio/folders/tree/')
+
+        Folder.objects.create(user=self.user, name='New', parent=self.leaf)
+        response = self.client.get('/api/portfolio/folders/tree/')
+        self.assertEqual(response.data[0]['children'][0]['children'][0]['children'][0]['name'], 'New')
+
+    def test_delete_subtree(self):
+        """Test deleting a folder removes its whole subtree."""
+        response = self.client.delete(f'/api/portfolio/folders/{self.root.id}/')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Folder.objects.filter(user=self.user).exists())
+
+@override_settings(THUMBNAIL_SIZES=[32, 64])
+class RenditionTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.user = User.objects.create_user(
+            username='artist',
+            email='artist@example.com',
+            password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def create_image(self, name='photo.png'):
+        from PIL import Image
+
+        buffer = io.BytesIO()
+        Image.new('RGB', (300, 200), 'teal').save(buffer, 'PNG')
+        return File.objects.create(
+            user=self.user,
+            title=name,
+            file=SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+        )
+
+    def test_thumbnails_are_built_once_per_content(self):
+        """Test that renditions are keyed by content hash and not rebuilt."""
+        from PIL import Image
+
+        first = self.create_image()
+        generate_renditions(first.id)
+        self.assertEqual(sorted(first.blob.renditions.values_list('size', flat=True)), [32, 64])
+
+        rendition = first.blob.renditions.get(size=64)
+        with rendition.file.open('rb') as fh:
+            image = Image.open(fh)
+            self.assertEqual(image.format, 'WEBP')
+            self.assertEqual(max(image.size), 64)
+
+        duplicate = self.create_image('copy.png')
+        generate_renditions(duplicate.id)
+        self.assertEqual(Rendition.objects.count(), 2)
+
+    def test_thumbnail_urls_in_serializer(self):
+        """Test that the file listing exposes thumbnail URLs."""
+        file = self.create_image()
+        generate_renditions(file.id)
+
+        response = self.client.get(f'/api/portfolio/files/{file.id}/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.data['thumbnail_urls']), {'32', '64'})
+        self.assertTrue(response.data['thumbnail_urls']['32'].endswith('/32.webp'))
+
+    def test_files_stored_without_a_blob_get_thumbnails(self):
+        """Test content written straight to storage (presigned uploads) is adopted into a blob."""
+        from PIL import Image
+        from django.core.files.base import ContentFile
+        from django.core.files.storage import default_storage
+
+        buffer = io.BytesIO()
+        Image.new('RGB', (300, 200), 'teal').save(buffer, 'PNG')
+        files = []
+        for name in ('a.png', 'b.png'):
+            key = default_storage.save(f'portfolio_files/{self.user.id}/{name}', ContentFile(buffer.getvalue()))
+            files.append(File.objects.create(user=self.user, title=name, file=key, size=len(buffer.getvalue())))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            for file in files:
+                generate_renditions(file.id)
+        first, second = (File.objects.get(pk=file.pk) for file in files)
+        self.assertEqual(first.blob_id, second.blob_id)
+        self.assertEqual((first.blob.ref_count, first.file.name), (2, files[0].file.name))
+        self.assertEqual(sorted(first.blob.renditions.values_list('size', flat=True)), [32, 64])
+        self.assertFalse(default_storage.exists(files[1].file.name))
+
+class FileSearchTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.user = User.objects.create_user(
+            username='searcher',
+            email='searcher@example.com',
+            password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def create_file(self, title, description='', user=None):
+        return File.objects.create(
+            user=user or self.user,
+            title=title,
+            description=description,
+            file=SimpleUploadedFile(f'{title}.txt', title.encode())
+        )
+
+    def search(self, query):
+        response = self.client.get('/api/portfolio/files/', {'q': query})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['results']
+
+    def test_ranked_search_with_snippets(self):
+        """Test that matches are ranked and highlighted."""
+        self.create_file('Chemistry lab report', 'Titration of <acids>')
+        self.create_file('Chemistry essay', 'Chemistry of chemistry in chemistry')
+        self.create_file('History essay', 'The French revolution')
+        other = User.objects.create_user(username='other', email='other@example.com', password='testpass123')
+        self.create_file('Chemistry notes', user=other)
+
+        results = self.search('chemistry')
+        self.assertEqual([r['title'] for r in results], ['Chemistry essay', 'Chemistry lab report'])
+
+        results = self.search('titration')
+        self.assertEqual(len(results), 1)
+        self.assertIn('<mark>Titration</mark>', results[0]['search_snippet'])
+        self.assertIn('&lt;acids&gt;', results[0]['search_snippet'])
+
+    def test_search_ignores_cursor(self):
+        """Test a cursor request with ``?q=`` keeps the relevance order."""
+        self.create_file('Chemistry essay', 'Chemistry of chemistry in chemistry')
+        self.create_file('Chemistry lab report', 'Titration')
+        response = self.client.get('/api/portfolio/files/', {'q': 'chemistry', 'cursor': ''})
+        self.assertEqual([r['title'] for r in response.data['results']], ['Chemistry essay', 'Chemistry lab report'])
+
+    def test_legacy_search_param(self):
+        """Test ``?search=`` still works as an alias of ``?q=``."""
+        self.create_file('Chemistry lab report')
+        self.create_file('History essay')
+        response = self.client.get('/api/portfolio/files/', {'search': 'chemistry'})
+        self.assertEqual([r['title'] for r in response.data['results']], ['Chemistry lab report'])
+
+    def test_index_follows_updates_and_deletes(self):
+        """Test that the index is kept in sync with the files table."""
+        file = self.create_file('Draft')
+        file.title = 'Portfolio statement'
+        file.save()
+        self.assertEqual(len(self.search('draft')), 0)
+        self.assertEqual(len(self.search('statement')), 1)
+
+        file.delete()
+        self.assertEqual(len(self.search('statement')), 0)
+
+    def test_query_syntax_is_escaped(self):
+        """Test that FTS operators in user input are treated as text."""
+        self.create_file('Essay NOT final')
+        self.assertEqual(len(self.search('essay NOT "final')), 1)
+        self.assertEqual(len(self.search('*')), 0)
+
+    @override_settings(TEXT_EXTRACTION_MAX_CHARS=40)
+    def test_search_covers_extracted_document_text(self):
+        """Test that text pulled out of a DOCX is searchable."""
+        buffer = io.BytesIO()
+        ns = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+        with zipfile.ZipFile(buffer, 'w') as docx:
+            docx.writestr('word/document.xml', (
+                f'<w:document xmlns:w="{ns}"><w:body>'
+                '<w:p><w:r><w:t>Photosynthesis in chloroplasts</w:t></w:r></w:p>'
+                '<w:p><w:r><w:t>is how plants make sugar from light</w:t></w:r></w:p>'
+                '</w:body></w:document>'
+            ))
+        file = File.objects.create(
+            user=self.user,
+            title='Biology homework',
+            file=SimpleUploadedFile('homework.docx', buffer.getvalue())
+        )
+
+        from core.versioning import get_versions
+
+        versions = get_versions(self.user.id, ['files'])
+        with self.captureOnCommitCallbacks(execute=True):
+            extract_file_text(file.id)
+        # Cached listings must not keep serving results without the new text.
+        self.assertNotEqual(get_versions(self.user.id, ['files']), versions)
+        text = FileText.objects.get(file=file)
+        self.assertTrue(text.content.startswith('Photosynthesis in chloroplasts'))
+        self.assertTrue(text.truncated)
+        self.assertLessEqual(len(text.content), 40)
+
+        results = self.search('chloroplasts')
+        self.assertEqual([r['title'] for r in results], ['Biology homework'])
+        self.assertIn('<mark>chloroplasts</mark>', results[0]['search_snippet'])
+
+    def test_extraction_runs_on_its_own_queue(self):
+        """Test text extraction is routed away from the default worker queue."""
+        from core.celery import app
+
+        self.assertEqual(app.amqp.router.route({}, extract_file_text.name)['queue'].name, 'extraction')
+        self.assertEqual(app.amqp.router.route({}, generate_renditions.name)['queue'].name, 'celery')
+
+
+class FileQueryBudgetTests(TempMediaMixin, QueryBudgetMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.user = User.objects.create_user(
+            username='budget',
+            email='budget@example.com',
+            password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.category = Category.objects.create(user=self.user, name='Essays')
+        self.criteria = CustomCriteria.objects.create(user=self.user, name='Graded')
+        self.counter = 0
+
+    def make_files(self, count=5):
+        for _ in range(count):
+            self.counter += 1
+            file = File.objects.create(
+                user=self.user, title=f'file {self.counter}',
+                file=SimpleUploadedFile(f'file{self.counter}.txt', f'content {self.counter}'.encode())
+            )
+            file.categories.add(self.category)
+            file.custom_criteria.add(self.criteria)
+            Rendition.objects.create(blob=file.blob, size=128, file=f'renditions/{self.counter}.webp')
+
+    def test_list_query_count_is_constant(self):
+        """Test the file list does not run extra queries per file."""
+        self.make_files()
+        response = self.assertConstantQueries('/api/portfolio/files/', self.make_files)
+        self.assertEqual(response.data['count'], 10)
+        self.assertEqual(len(response.data['results'][0]['categories']), 1)
+
+    def test_list_query_budget(self):
+        """Test the file list stays within its query budget."""
+        self.make_files()
+        # count, page, blob renditions, categories, criteria
+        self.assertQueryBudget('/api/portfolio/files/', 5)
+
+    def test_detail_query_budget(self):
+        """Test the file detail stays within its query budget."""
+        self.make_files(1)
+        file = File.objects.get()
+        response = self.assertQueryBudget(f'/api/portfolio/files/{file.id}/', 4)
+        self.assertIn('128', response.data['thumbnail_urls'])
+
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='pager',
+            email='pager@example.com',
+            password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        for i in range(15):
+            Notification.objects.create(user=self.user, message=f'note {i}', type='info')
+
+    def test_cursor_walks_all_rows(self):
+        """Test following next links visits every row exactly once."""
+        seen = []
+        response = self.client.get('/api/portfolio/notifications/', {'cursor': ''})
+        while True:
+            self.assertNotIn('count', response.data)
+            seen.extend(item['id'] for item in response.data['results'])
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertEqual(len(seen), 15)
+        self.assertEqual(seen, sorted(seen, reverse=True))
+
+    def test_cursor_stable_under_inserts(self):
+        """Test rows inserted after the first page do not shift later pages."""
+        first = self.client.get('/api/portfolio/notifications/', {'cursor': ''})
+        for i in range(5):
+            Notification.objects.create(user=self.user, message=f'late {i}', type='info')
+        second = self.client.get(first.data['next'])
+        first_ids = [item['id'] for item in first.data['results']]
+        second_ids = [item['id'] for item in second.data['results']]
+        self.assertEqual(len(second_ids), 5)
+        self.assertTrue(max(second_ids) < min(first_ids))
+
+    def test_count_estimate(self):
+        """Test ?count=estimate adds an approximate total."""
+        response = self.client.get('/api/portfolio/folders/', {'cursor': '', 'count': 'estimate'})
+        self.assertEqual(response.data['count'], 0)
+        response = self.client.get('/api/portfolio/notifications/', {'cursor': '', 'count': 'estimate'})
+        self.assertEqual(response.data['count'], 15)
+
+    def test_page_number_still_default(self):
+        """Test lists without a cursor keep page-number pagination."""
+        response = self.client.get('/api/portfolio/notifications/')
+        self.assertEqual(response.data['count'], 15)
+        self.assertEqual(len(response.data['results']), 10)
+
+
+class BulkFileOperationTests(TempMediaMixin, QueryBudgetMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.user = User.objects.create_user(
+            username='reorganiser',
+            email='reorganiser@example.com',
+            password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.files = [
+            File.objects.create(user=self.user, title=f'file {i}',
+                                file=SimpleUploadedFile(f'file{i}.txt', b'shared content'))
+            for i in range(20)
+        ]
+        self.ids = [file.id for file in self.files]
+
+    def bulk(self, **payload):
+        return self.client.post('/api/portfolio/files/bulk/', payload, format='json')
+
+    def test_move(self):
+        """Test moving many files with a handful of statements."""
+        folder = Folder.objects.create(user=self.user, name='Archive')
+        with self.assertMaxQueries(8):
+            response = self.bulk(ids=self.ids, operation='move', folder=folder.id)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 20)
+        self.assertEqual(File.objects.filter(folder=folder).count(), 20)
+
+    def test_tag_and_untag(self):
+        """Test tagging is set-based and idempotent."""
+        category = Category.objects.create(user=self.user, name='Essays')
+        criteria = CustomCriteria.objects.create(user=self.user, name='Graded')
+        self.files[0].categories.add(category)
+
+        with self.assertMaxQueries(10):
+            response = self.bulk(ids=self.ids, operation='tag',
+                                 category_ids=[category.id], criteria_ids=[criteria.id])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(File.categories.through.objects.filter(category=category).count(), 20)
+        self.assertEqual(File.custom_criteria.through.objects.count(), 20)
+
+        response = self.bulk(ids=self.ids[:5], operation='untag', category_ids=[category.id])
+        self.assertEqual(File.categories.through.objects.filter(category=category).count(), 15)
+
+    def test_set_public(self):
+        """Test toggling visibility for many files."""
+        self.bulk(ids=self.ids, operation='set_public', is_public=True)
+        self.assertEqual(File.objects.filter(is_public=True).count(), 20)
+
+    def test_delete_and_restore(self):
+        """Test a bulk delete moves files to the trash and restore brings them back."""
+        with self.assertMaxQueries(8):
+            self.bulk(ids=self.ids[:5], operation='delete')
+        self.assertEqual(File.objects.count(), 15)
+        self.assertEqual(File.all_objects.trashed().count(), 5)
+        self.assertEqual(Blob.objects.get().ref_count, 20)
+
+        response = self.bulk(ids=self.ids[:5], operation='restore')
+        self.assertEqual(response.data['count'], 5)
+        self.assertEqual(File.objects.count(), 20)
+
+    def test_foreign_ids_rejected(self):
+        """Test nothing changes if any id belongs to someone else."""
+        other = User.objects.create_user(username='other', email='other@example.com', password='testpass123')
+        foreign = File.objects.create(user=other, title='theirs', file=SimpleUploadedFile('t.txt', b'x'))
+        response = self.bulk(ids=self.ids + [foreign.id], operation='delete')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.data['ids'], [foreign.id])
+        self.assertEqual(File.objects.count(), 21)
+
+    def test_move_requires_folder(self):
+        """Test move without a folder is rejected."""
+        response = self.bulk(ids=self.ids, operation='move')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class BatchUploadTests(TempMediaMixin, QueryBudgetMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.user = User.objects.create_user(
+            username='batcher',
+            email='batcher@example.com',
+            password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.category = Category.objects.create(user=self.user, name='Essays')
+
+    def test_batch_upload(self):
+        """Test uploading several files in one request with shared metadata."""
+        folder = Folder.objects.create(user=self.user, name='Inbox')
+        payload = {
+            'files': [
+                SimpleUploadedFile(f'part{i}.txt', f'part {i}'.encode(), content_type='text/plain')
+                for i in range(5)
+            ],
+            'folder': folder.id,
+            'category_ids': [self.category.id],
+        }
+        with mock.patch('celery.group') as group, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/portfolio/files/batch/', payload, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([r['status'] for r in response.data['results']], ['created'] * 5)
+        self.assertEqual(File.objects.filter(folder=folder, categories=self.category).count(), 5)
+        self.assertEqual(response.data['results'][0]['file']['categories'][0]['name'], 'Essays')
+        group.assert_called_once()
+        self.assertEqual(len(group.call_args[0][0]), 5)
+
+    def test_partial_failure(self):
+        """Test one bad part does not abort the rest of the batch."""
+        payload = {'files': [
+            SimpleUploadedFile('good.txt', b'fine'),
+            SimpleUploadedFile('bad.exe', b'MZ'),
+        ]}
+        response = self.client.post('/api/portfolio/files/batch/', payload, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        good, bad = response.data['results']
+        self.assertEqual(good['status'], 'created')
+        self.assertEqual(bad['status'], 'error')
+        self.assertIn('exe', bad['error'])
+        self.assertEqual(list(File.objects.values_list('title', flat=True)), ['good.txt'])
+
+    def test_storage_failure_is_reported_without_details(self):
+        """Test a part that cannot be stored fails alone and leaks no internal error text."""
+        from .storage import acquire_blob
+
+        payload = {'files': [SimpleUploadedFile('good.txt', b'fine'), SimpleUploadedFile('lost.txt', b'gone')]}
+        def fail_second(upload):
+            if upload.name == 'lost.txt':
+                raise OSError('/srv/media/secret: No space left on device')
+            return acquire_blob(upload)
+
+        with mock.patch('portfolio.views.acquire_blob', side_effect=fail_second), self.assertLogs('portfolio.views'):
+            response = self.client.post('/api/portfolio/files/batch/', payload, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(response.data['results'][1], {'name': 'lost.txt', 'status': 'error', 'error': 'Could not store the file'})
+
+    def test_unexpected_error_releases_blobs(self):
+        """Test an unexpected failure surfaces and gives back the blobs already stored."""
+        payload = {'files': [SimpleUploadedFile('a.txt', b'a'), SimpleUploadedFile('b.txt', b'b')]}
+        with mock.patch('portfolio.views.schedule_batch_processing', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.client.post('/api/portfolio/files/batch/', payload, format='multipart')
+        self.assertFalse(File.objects.exists())
+        self.assertFalse(Blob.objects.exists())
+
+    def test_duplicate_parts_share_blob(self):
+        """Test identical parts in one batch are stored once."""
+        payload = {'files': [SimpleUploadedFile(f'copy{i}.txt', b'same bytes') for i in range(3)]}
+        self.client.post('/api/portfolio/files/batch/', payload, format='multipart')
+        self.assertEqual(Blob.objects.get().ref_count, 3)
+
+
+class StorageUsageTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.user = User.objects.create_user(
+            username='hoarder',
+            email='hoarder@example.com',
+            password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def usage(self):
+        return StorageUsage.objects.get(user=self.user)
+
+    def test_counters_follow_upload_replace_delete(self):
+        """Test usage tracks uploads, content replacement and deletion."""
+        doc = File.objects.create(user=self.user, title='a', file=SimpleUploadedFile('a.txt', b'x' * 10))
+        File.objects.create(user=self.user, title='b', file=SimpleUploadedFile('b.png', b'y' * 5))
+        usage = self.usage()
+        self.assertEqual((usage.total_bytes, usage.file_count), (15, 2))
+        self.assertEqual((usage.document_bytes, usage.image_bytes), (10, 5))
+
+        doc.file = SimpleUploadedFile('a.csv', b'z' * 3)
+        doc.save()
+        usage = self.usage()
+        self.assertEqual((usage.total_bytes, usage.file_count), (8, 2))
+        self.assertEqual((usage.document_bytes, usage.spreadsheet_bytes), (0, 3))
+
+        doc.delete()
+        usage = self.usage()
+        self.assertEqual((usage.total_bytes, usage.file_count, usage.spreadsheet_bytes), (5, 1, 0))
+
+    def test_quota_check_reads_one_row(self):
+        """Test uploads over quota are rejected after a single usage lookup."""
+        File.objects.create(user=self.user, title='a', file=SimpleUploadedFile('a.txt', b'x' * 10))
+        StorageUsage.objects.filter(user=self.user).update(quota_bytes=12)
+
+        from .quota import check_quota, QuotaExceeded
+        with self.assertNumQueries(1):
+            check_quota(self.user.id, 2)
+        with self.assertNumQueries(1), self.assertRaises(QuotaExceeded):
+            check_quota(self.user.id, 3)
+
+        response = self.client.post('/api/portfolio/files/', {
+            'title': 'too big', 'file': SimpleUploadedFile('big.txt', b'y' * 5)
+        }, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+        response = self.client.post('/api/portfolio/uploads/', {'filename': 'big.txt', 'total_size': 50}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+    def test_quota_enforced_when_usage_is_recorded(self):
+        """Test an upload that passed the pre-check is still refused if it would overrun the quota."""
+        from .quota import QuotaExceeded
+
+        File.objects.create(user=self.user, title='a', file=SimpleUploadedFile('a.txt', b'x' * 10))
+        StorageUsage.objects.filter(user=self.user).update(quota_bytes=12)
+
+        # As if a concurrent upload had passed check_quota at the same moment.
+        with mock.patch('portfolio.views.check_quota'):
+            response = self.client.post('/api/portfolio/files/', {
+                'title': 'racer', 'file': SimpleUploadedFile('racer.txt', b'y' * 5)
+            }, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.assertEqual(File.objects.count(), 1)
+        self.assertEqual(self.usage().total_bytes, 10)
+
+        with self.assertRaises(QuotaExceeded):
+            File.objects.create(user=self.user, title='c', file=SimpleUploadedFile('c.txt', b'z' * 3))
+        File.objects.create(user=self.user, title='d', file=SimpleUploadedFile('d.txt', b'z' * 2))
+        self.assertEqual(self.usage().total_bytes, 12)
+
+    def test_batch_and_bulk_paths(self):
+        """Test batch uploads and bulk deletes keep the counters right."""
+        payload = {'files': [SimpleUploadedFile(f'p{i}.txt', b'abcd') for i in range(3)]}
+        self.client.post('/api/portfolio/files/batch/', payload, format='multipart')
+        self.assertEqual((self.usage().total_bytes, self.usage().file_count), (12, 3))
+
+        ids = list(File.objects.values_list('id', flat=True))
+        self.client.post('/api/portfolio/files/bulk/', {'ids': ids[:2], 'operation': 'delete'}, format='json')
+        # Trashed files count until they are purged.
+        self.assertEqual((self.usage().total_bytes, self.usage().file_count), (12, 3))
+        with override_settings(FILE_TRASH_RETENTION_DAYS=0, FILE_PURGE_BATCH_PAUSE=0):
+            cleanup_old_files.delay().get()
+        self.assertEqual((self.usage().total_bytes, self.usage().file_count), (4, 1))
+
+        response = self.client.get('/api/portfolio/files/usage/')
+        self.assertEqual(response.data['document_bytes'], 4)
+
+    def test_reconciliation_fixes_drift(self):
+        """Test the periodic job rewrites counters that drifted."""
+        File.objects.create(user=self.user, title='a', file=SimpleUploadedFile('a.txt', b'x' * 10))
+        StorageUsage.objects.filter(user=self.user).update(total_bytes=999, file_count=7, image_bytes=3)
+
+        reconcile_storage_usage.delay().get()
+        usage = self.usage()
+        self.assertEqual((usage.total_bytes, usage.file_count, usage.document_bytes, usage.image_bytes), (10, 1, 10, 0))
+
+    def test_reconciliation_recounts_under_lock(self):
+        """Test a file added after the first pass is counted, not overwritten."""
+        from .quota import reconcile_usage
+
+        File.objects.create(user=self.user, title='a', file=SimpleUploadedFile('a.txt', b'x' * 10))
+        StorageUsage.objects.filter(user=self.user).update(total_bytes=999)
+
+        real_values = StorageUsage.objects.values
+
+        def values_then_upload(*fields):
+            # An upload lands between the grouped aggregate and the fix.
+            File.objects.create(user=self.user, title='b', file=SimpleUploadedFile('b.txt', b'y' * 4))
+            return real_values(*fields)
+
+        with mock.patch.object(StorageUsage.objects, 'values', side_effect=values_then_upload):
+            self.assertEqual(reconcile_usage(), 1)
+        self.assertEqual((self.usage().total_bytes, self.usage().file_count), (14, 2))
+
+
+@override_settings(FILE_TRASH_RETENTION_DAYS=0, FILE_PURGE_BATCH_PAUSE=0, FILE_PURGE_BATCH_SIZE=2)
+class TrashTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+
+        super().setUp()
+        cache.delete(PURGE_CHECKPOINT_KEY)
+
+        self.user = User.objects.create_user(
+            username='tidy',
+            email='tidy@example.com',
+            password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def make_file(self, content):
+        return File.objects.create(user=self.user, title='f.txt', file=SimpleUploadedFile('f.txt', content))
+
+    def test_delete_moves_to_trash(self):
+        """Test deleting a file hides it and lists it in the trash."""
+        file = self.make_file(b'keep me around')
+        response = self.client.delete(f'/api/portfolio/files/{file.id}/')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.client.get('/api/portfolio/files/').data['count'], 0)
+        self.assertEqual(self.client.get(f'/api/portfolio/files/{file.id}/').status_code, status.HTTP_404_NOT_FOUND)
+
+        trash = self.client.get('/api/portfolio/files/trash/')
+        self.assertEqual([item['id'] for item in trash.data['results']], [file.id])
+
+        response = self.client.post(f'/api/portfolio/files/{file.id}/restore/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get('/api/portfolio/files/').data['count'], 1)
+
+    def test_purge_in_batches(self):
+        """Test the purge removes rows and stored content batch by batch."""
+        files = [self.make_file(f'content {i}'.encode()) for i in range(5)]
+        paths = [file.file.path for file in files]
+        kept = self.make_file(b'not deleted')
+        for file in files:
+            file.trash()
+
+        from .storage import delete_storage_objects
+
+        with mock.patch('portfolio.storage.delete_storage_objects', wraps=delete_storage_objects) as deletes:
+            result = cleanup_old_files.delay().get()
+        self.assertEqual(result, 'Purged 5 trashed files')
+        self.assertEqual(deletes.call_count, 3)
+        self.assertEqual(list(File.all_objects.all()), [kept])
+        self.assertEqual(Blob.objects.count(), 1)
+        self.assertFalse(any(os.path.exists(path) for path in paths))
+        self.assertTrue(os.path.exists(kept.file.path))
+
+    def test_purge_skips_files_restored_after_the_batch_is_read(self):
+        """Test a file restored while its batch is being purged survives."""
+        from contextlib import contextmanager
+        from .storage import collect_storage_deletes
+
+        files = [self.make_file(f'content {i}'.encode()) for i in range(2)]
+        for file in files:
+            file.trash()
+
+        @contextmanager
+        def restore_first():
+            File.all_objects.get(pk=files[0].pk).restore()
+            with collect_storage_deletes() as names:
+                yield names
+
+        with mock.patch('portfolio.storage.collect_storage_deletes', restore_first):
+            result = cleanup_old_files.delay().get()
+        self.assertEqual(result, 'Purged 1 trashed files')
+        self.assertEqual(list(File.all_objects.all()), [files[0]])
+        self.assertTrue(os.path.exists(files[0].file.path))
+
+    def test_purge_resumes_from_checkpoint(self):
+        """Test a restarted purge continues after the last checkpointed id."""
+        from django.core.cache import cache
+
+        files = [self.make_file(f'content {i}'.encode()) for i in range(4)]
+        for file in files:
+            file.trash()
+        cache.set(PURGE_CHECKPOINT_KEY, files[1].id)
+
+        with override_settings(FILE_PURGE_MAX_BATCHES=1):
+            cleanup_old_files.delay().get()
+        self.assertEqual(list(File.all_objects.values_list('id', flat=True)), [files[0].id, files[1].id])
+        self.assertEqual(cache.get(PURGE_CHECKPOINT_KEY), files[3].id)
+
+        cleanup_old_files.delay().get()
+        self.assertIsNone(cache.get(PURGE_CHECKPOINT_KEY))
+        cleanup_old_files.delay().get()
+        self.assertFalse(File.all_objects.exists())
+
+    @skipUnless(mock_aws, 'moto is not installed')
+    def test_s3_batch_delete(self):
+        """Test S3 objects are removed with DeleteObjects batches."""
+        from .storage import delete_storage_objects
+
+        with mock_aws(), override_settings(
+            STORAGES=S3_STORAGES,
+            AWS_STORAGE_BUCKET_NAME='portfolio-test',
+            AWS_ACCESS_KEY_ID='testing',
+            AWS_SECRET_ACCESS_KEY='testing',
+            AWS_S3_CUSTOM_DOMAIN=None,
+        ):
+            s3 = boto3.client('s3', region_name='us-east-1')
+            s3.create_bucket(Bucket='portfolio-test')
+            for i in range(3):
+                s3.put_object(Bucket='portfolio-test', Key=f'portfolio_files/{i}.txt', Body=b'x')
+
+            self.assertEqual(delete_storage_objects([f'portfolio_files/{i}.txt' for i in range(3)]), 3)
+            self.assertEqual(s3.list_objects_v2(Bucket='portfolio-test').get('KeyCount'), 0)
+
+
+class VersionedETagTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.user = User.objects.create_user(
+            username='poller',
+            email='poller@example.com',
+            password='testpass123'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_unchanged_poll_is_not_modified(self):
+        """Test an unchanged list answers 304 without touching the database."""
+        File.objects.create(user=self.user, title='a', file=SimpleUploadedFile('a.txt', b'a'))
+        response = self.client.get('/api/portfolio/files/')
+        etag = response['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/portfolio/files/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_changes_invalidate_etag(self):
+        """Test writes, tag changes and bulk updates all produce a new ETag."""
+        file = File.objects.create(user=self.user, title='a', file=SimpleUploadedFile('a.txt', b'a'))
+        etags = [self.client.get('/api/portfolio/files/')['ETag']]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            category = Category.objects.create(user=self.user, name='Essays')
+        etags.append(self.client.get('/api/portfolio/files/')['ETag'])
+        with self.captureOnCommitCallbacks(execute=True):
+            file.categories.add(category)
+        etags.append(self.client.get('/api/portfolio/files/')['ETag'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                '/api/portfolio/files/bulk/', {'ids': [file.id], 'operation': 'set_public', 'is_public': True},
+                format='json'
+            )
+        response = self.client.get('/api/portfolio/files/', HTTP_IF_NONE_MATCH=etags[-1])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etags.append(response['ETag'])
+        self.assertEqual(len(set(etags)), 4)
+
+    def test_version_bumps_wait_for_commit(self):
+        """Test a write only changes the ETag once its transaction has committed."""
+        etag = self.client.get('/api/portfolio/folders/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Folder.objects.create(user=self.user, name='Pending')
+            # Still inside the transaction: a concurrent reader must not see a new version yet.
+            response = self.client.get('/api/portfolio/folders/', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        response = self.client.get('/api/portfolio/folders/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_etag_is_per_user_and_query(self):
+        """Test ETags differ between users and between query strings."""
+        other = User.objects.create_user(username='other', email='other@example.com', password='testpass123')
+        first = self.client.get('/api/portfolio/notifications/')['ETag']
+        self.assertNotEqual(first, self.client.get('/api/portfolio/notifications/?page_size=5')['ETag'])
+
+        self.client.force_authenticate(user=other)
+        response = self.client.get('/api/portfolio/notifications/', HTTP_IF_NONE_MATCH=first)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_detail_and_notifications(self):
+        """Test detail views and mark_all_read participate in versioning."""
+        Notification.objects.create(user=self.user, message='hi', type='info')
+        etag = self.client.get('/api/portfolio/notifications/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/portfolio/notifications/mark_all_read/')
+        response = self.client.get('/api/portfolio/notifications/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        folder = Folder.objects.create(user=self.user, name='Docs')
+        etag = self.client.get(f'/api/portfolio/folders/{folder.id}/')['ETag']
+        response = self.client.get(f'/api/portfolio/folders/{folder.id}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+
+class FakePubSub:
+    """In-memory stand-in for a ``redis.asyncio`` pub/sub connection."""
+
+    def __init__(self):
+        import asyncio
+        self.channels = set()
+        self.messages = asyncio.Queue()
+
+    async def subscribe(self, *channels):
+        self.channels.update(channels)
+
+    async def unsubscribe(self, *channels):
+        self.channels.difference_update(channels)
+
+    async def get_message(self, timeout=None):
+        import asyncio
+        try:
+            return await asyncio.wait_for(self.messages.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def publish(self, channel, data):
+        if channel in self.channels:
+            self.messages.put_nowait({'type': 'message', 'channel': channel.encode(), 'data': data})
+
+    async def aclose(self):
+        pass
+
+
+class NotificationStreamTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='listener',
+            email='listener@example.com',
+            password='testpass123'
+        )
+        self.pubsub = FakePubSub()
+        redis = mock.Mock()
+        redis.pubsub.return_value = self.pubsub
+        patcher = mock.patch('portfolio.events.get_async_redis', return_value=redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_requires_authentication(self):
+        """Test the stream rejects missing and invalid tickets."""
+        self.assertEqual(self.client.get('/api/portfolio/notifications/stream/').status_code, 401)
+        response = self.client.get('/api/portfolio/notifications/stream/?ticket=bogus')
+        self.assertEqual(response.status_code, 401)
+        response = self.client.get('/api/portfolio/notifications/stream/', HTTP_AUTHORIZATION='Bearer bogus')
+        self.assertEqual(response.status_code, 401)
+
+    def test_stream_ticket_is_single_use(self):
+        """Test a ticket is issued to authenticated users and opens the stream once."""
+        self.assertEqual(self.client.post('/api/portfolio/notifications/stream-ticket/').status_code, 401)
+        api = APIClient()
+        api.force_authenticate(user=self.user)
+        response = api.post('/api/portfolio/notifications/stream-ticket/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        ticket = response.data['ticket']
+
+        self.assertEqual(async_to_sync(redeem_stream_ticket)(ticket), self.user.id)
+        self.assertIsNone(async_to_sync(redeem_stream_ticket)(ticket))
+
+    def test_inactive_users_are_refused(self):
+        """Test a ticket or token issued before the account was deactivated no longer works."""
+        from rest_framework_simplejwt.tokens import AccessToken
+
+        ticket = issue_stream_ticket(self.user.id)
+        token = str(AccessToken.for_user(self.user))
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+
+        response = self.client.get(f'/api/portfolio/notifications/stream/?ticket={ticket}')
+        self.assertEqual(response.status_code, 401)
+        response = self.client.get('/api/portfolio/notifications/stream/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.status_code, 401)
+
+    def test_publishes_on_create_and_read(self):
+        """Test notification writes publish to the owner's channel after commit."""
+        import json
+        redis = mock.Mock()
+        with mock.patch('django_redis.get_redis_connection', return_value=redis):
+            with self.captureOnCommitCallbacks(execute=True):
+                notification = Notification.objects.create(user=self.user, message='hi', type='info')
+            with self.captureOnCommitCallbacks(execute=True):
+                notification.mark_as_read()
+
+        channels = {call.args[0] for call in redis.publish.call_args_list}
+        self.assertEqual(channels, {f'notifications:{self.user.id}'})
+        events = [json.loads(call.args[1]) for call in redis.publish.call_args_list]
+        self.assertEqual(events[0]['event'], 'notification')
+        self.assertEqual(events[0]['data']['id'], notification.id)
+        self.assertEqual(events[1], {'event': 'unread_count', 'data': {'unread_count': 1}})
+        self.assertEqual(events[-1], {'event': 'unread_count', 'data': {'unread_count': 0}})
+
+    async def test_stream_pushes_events(self):
+        """Test the stream sends the count, replays missed rows and relays published events."""
+        import asyncio
+        import json
+        from asgiref.sync import sync_to_async
+        missed = await sync_to_async(Notification.objects.create)(user=self.user, message='missed', type='info')
+        ticket = await sync_to_async(issue_stream_ticket)(self.user.id)
+
+        response = await self.async_client.get(
+            f'/api/portfolio/notifications/stream/?ticket={ticket}',
+            headers={'Last-Event-ID': str(missed.id - 1)},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+
+        self.assertTrue((await anext(stream)).startswith(b'retry:'))
+        replayed = (await anext(stream)).decode()
+        self.assertIn(f'id: {missed.id}\nevent: notification\n', replayed)
+        self.assertIn('event: unread_count\ndata: {"unread_count": 1}', (await anext(stream)).decode())
+
+        channel = f'notifications:{self.user.id}'
+        self.assertEqual(self.pubsub.channels, {channel})
+        self.pubsub.publish(channel, json.dumps({'event': 'unread_count', 'data': {'unread_count': 0}}))
+        self.assertIn('data: {"unread_count": 0}', (await anext(stream)).decode())
+
+        # A client disconnect cancels the pending read, which unsubscribes.
+        pending = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0)
+        pending.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await pending
+        self.assertEqual(self.pubsub.channels, set())
+
+
+
+@override_settings(NOTIFICATION_BROADCAST_CHUNK_SIZE=2, NOTIFICATION_BROADCAST_BATCH_SIZE=2)
+class BroadcastTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.staff = User.objects.create_user(
+            username='staff', email='staff@example.com', password='testpass123', is_staff=True
+        )
+        self.users = [
+            User.objects.create_user(username=f'member{i}', email=f'member{i}@example.com', password='testpass123')
+            for i in range(4)
+        ]
+        User.objects.create_user(
+            username='inactive', email='inactive@example.com', password='testpass123', is_active=False
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.staff)
+
+    def broadcast(self, **data):
+        with mock.patch('django_redis.get_redis_connection'):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post('/api/portfolio/broadcasts/', data, format='json')
+        return response
+
+    def test_staff_only(self):
+        """Test regular users cannot broadcast."""
+        self.client.force_authenticate(user=self.users[0])
+        response = self.client.post('/api/portfolio/broadcasts/', {'message': 'hi', 'audience': 'all'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_broadcast_to_all(self):
+        """Test every active user gets one notification and the broadcast completes."""
+        response = self.broadcast(message='Maintenance tonight', type='warning', audience='all')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        recipients = Notification.objects.filter(message='Maintenance tonight', type='warning')
+        self.assertEqual(
+            sorted(recipients.values_list('user_id', flat=True)),
+            sorted([self.staff.id] + [user.id for user in self.users])
+        )
+        broadcast = Broadcast.objects.get(pk=response.data['id'])
+        self.assertEqual((broadcast.status, broadcast.total, broadcast.sent), ('done', 5, 5))
+        self.assertIsNotNone(broadcast.finished_at)
+
+    def test_audiences(self):
+        """Test track and explicit-user audiences only reach their users."""
+        track = Track.objects.create(name='Design', description='')
+        File.objects.create(
+            user=self.users[1], title='a', track=track, file=SimpleUploadedFile('a.txt', b'a')
+        )
+        self.broadcast(message='For designers', audience='track', track=track.id)
+        self.broadcast(message='For two', audience='users', user_ids=[self.users[2].id, self.users[3].id])
+
+        self.assertEqual(
+            list(Notification.objects.filter(message='For designers').values_list('user_id', flat=True)),
+            [self.users[1].id]
+        )
+        self.assertEqual(Notification.objects.filter(message='For two').count(), 2)
+
+        response = self.client.post('/api/portfolio/broadcasts/', {'message': 'x', 'audience': 'track'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_chunk_inserts_in_batches(self):
+        """Test a chunk costs one INSERT per batch, not one per user."""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        broadcast = Broadcast.objects.create(message='batched', audience='all', status='running', total=4)
+        with CaptureQueriesContext(connection) as context:
+            deliver_broadcast_chunk(broadcast.id, [user.id for user in self.users])
+        inserts = [q for q in context.captured_queries if q['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 2)
+
+        broadcast.refresh_from_db()
+        self.assertEqual((broadcast.status, broadcast.sent), ('done', 4))
@@ -0,0 +1,65 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Sum
+from .models import Folder, File
+
+
+def folder_tree_cache_key(user_id):
+    return f'folder_tree_{user_id}'
+
+
+def invalidate_folder_tree(user_id):
+    cache.delete(folder_tree_cache_key(user_id))
+
+
+def build_folder_tree(user):
+    """
+    Nested folder hierarchy for ``user``. ``file_count`` and ``total_bytes``
+    cover each folder's whole subtree and come from a single aggregate.
+    """
+    folders = Folder.objects.filter(user=user).order_by('depth', 'name').values_list(
+        'id', 'name', 'parent_id', 'path', 'depth'
+    )
+    totals = File.objects.filter(user=user, folder__isnull=False).values('folder_id').annotate(
+        file_count=Count('id'), total_bytes=Sum('size')
+    ).order_by()
+
+    nodes = {}
+    roots = []
+    for folder_id, name, parent_id, path, depth in folders:
+        node = {
+            'id': folder_id,
+            'name': name,
+            'parent': parent_id,
+            'depth': depth,
+            'file_count': 0,
+            'total_bytes': 0,
+            'children': [],
+            '_ancestors': [int(part) for part in path.strip('/').split('/') if part],
+        }
+        nodes[folder_id] = node
+        parent = nodes.get(parent_id)
+        (parent['children'] if parent else roots).append(node)
+
+    for row in totals:
+        node = nodes.get(row['folder_id'])
+        if node is None:
+            continue
+        for ancestor_id in node['_ancestors']:
+            ancestor = nodes.get(ancestor_id)
+            if ancestor is not None:
+                ancestor['file_count'] += row['file_count']
+                ancestor['total_bytes'] += row['total_bytes'] or 0
+
+    for node in nodes.values():
+        del node['_ancestors']
+    return roots
+
+
+def get_folder_tree(user):
+    key = folder_tree_cache_key(user.id)
+    tree = cache.get(key)
+    if tree is None:
+        tree = build_folder_tree(user)
+        cache.set(key, tree, settings.FOLDER_TREE_CACHE_TIMEOUT)
+    return tree
@@ -0,0 +1,70 @@
+from django.conf import settings
+from django.core.cache import cache
+
+UNREAD_KEY = 'notifications:unread:{user_id}'
+GENERATION_KEY = 'notifications:unread:{user_id}:generation'
+
+
+def _unread_key(user_id):
+    return UNREAD_KEY.format(user_id=user_id)
+
+
+def _generation_key(user_id):
+    return GENERATION_KEY.format(user_id=user_id)
+
+
+def _bump_generation(user_id):
+    """Mark the counter's inputs as changed so an in-flight rebuild discards its count."""
+    key = _generation_key(user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, settings.NOTIFICATION_UNREAD_COUNT_TIMEOUT)
+
+
+def get_unread_count(user_id):
+    """
+    The user's unread notification count from the cache, rebuilt from the
+    database with one ``COUNT`` only when the counter is missing.
+    """
+    key = _unread_key(user_id)
+    count = cache.get(key)
+    if count is None:
+        from .models import Notification
+
+        generation = cache.get(_generation_key(user_id))
+        count = Notification.objects.filter(user_id=user_id, is_read=False).count()
+        if not cache.add(key, count, settings.NOTIFICATION_UNREAD_COUNT_TIMEOUT):
+            # Another rebuild got there first.
+            return max(cache.get(key, count), 0)
+        if cache.get(_generation_key(user_id)) != generation:
+            # A change landed while counting and its adjustment found no
+            # counter to move, so the count may already be stale; leave the
+            # next read to rebuild.
+            cache.delete(key)
+    return max(count, 0)
+
+
+def adjust_unread_count(user_id, delta):
+    """
+    Move the counter by ``delta``. A missing counter is left to be rebuilt
+    on the next read, and any rebuild already under way is invalidated.
+    """
+    if not delta:
+        return
+    try:
+        cache.incr(_unread_key(user_id), delta)
+    except ValueError:
+        _bump_generation(user_id)
+
+
+def forget_unread_count(user_id):
+    """Drop the counter after a change whose effect on it is unknown."""
+    cache.delete(_unread_key(user_id))
+    _bump_generation(user_id)
+
+
+def forget_unread_counts(user_ids):
+    cache.delete_many([_unread_key(user_id) for user_id in user_ids])
+    for user_id in user_ids:
+        _bump_generation(user_id)
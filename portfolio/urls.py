@@ -2,7 +2,8 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
     TrackViewSet, CategoryViewSet, FolderViewSet,
-    CustomCriteriaViewSet, FileViewSet, NotificationViewSet
+    CustomCriteriaViewSet, FileViewSet, UploadSessionViewSet,
+    NotificationViewSet, BroadcastViewSet, notification_stream
 )
 
 router = DefaultRouter()
@@ -11,8 +12,11 @@ router.register(r'categories', CategoryViewSet, basename='category')
 router.register(r'folders', FolderViewSet, basename='folder')
 router.register(r'criteria', CustomCriteriaViewSet, basename='criteria')
 router.register(r'files', FileViewSet, basename='file')
+router.register(r'uploads', UploadSessionViewSet, basename='upload')
 router.register(r'notifications', NotificationViewSet, basename='notification')
+router.register(r'broadcasts', BroadcastViewSet, basename='broadcast')
 
 urlpatterns = [
+    path('notifications/stream/', notification_stream, name='notification-stream'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
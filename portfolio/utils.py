@@ -4,14 +4,22 @@ from django.core.exceptions import ValidationError
 from django.conf import settings
 from django.utils.translation import gettext_lazy as _
 
+_magic = None
+
+def get_magic():
+    """One libmagic handle per process; opening the database is expensive."""
+    global _magic
+    if _magic is None:
+        _magic = magic.Magic(mime=True)
+    return _magic
+
 def validate_file_type(file):
     """Validate file type based on MIME type and extension."""
     # Get file extension
     ext = os.path.splitext(file.name)[1][1:].lower()
     
     # Get MIME type
-    mime = magic.Magic(mime=True)
-    mime_type = mime.from_buffer(file.read(1024))
+    mime_type = get_magic().from_buffer(file.read(1024))
     file.seek(0)  # Reset file pointer
     
     # Check if file type is allowed
@@ -45,4 +53,107 @@ def generate_unique_filename(file):
     """Generate a unique filename for the uploaded file."""
     import uuid
     ext = os.path.splitext(file.name)[1]
-    return f"{uuid.uuid4()}{ext}" 
\ No newline at end of file
+    return f"{uuid.uuid4()}{ext}"
+
+
+def write_chunk(path, offset, stream, crc=0, block_size=64 * 1024):
+    """
+    Stream a request body into ``path`` starting at ``offset``.
+
+    Anything past ``offset`` (e.g. left over from an interrupted attempt) is
+    truncated first. Returns the number of bytes written, the CRC32 of the
+    chunk and the running CRC32 continued from ``crc``; only one block is
+    held in memory at a time.
+    """
+    import zlib
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    mode = 'r+b' if os.path.exists(path) else 'wb'
+    written = 0
+    chunk_crc = 0
+    with open(path, mode) as out:
+        out.seek(offset)
+        out.truncate()
+        while stream is not None:
+            block = stream.read(block_size)
+            if not block:
+                break
+            out.write(block)
+            chunk_crc = zlib.crc32(block, chunk_crc)
+            crc = zlib.crc32(block, crc)
+            written += len(block)
+    return written, chunk_crc, crc
+
+def truncate_file(path, size):
+    """Drop everything in ``path`` past ``size`` bytes."""
+    if os.path.exists(path):
+        with open(path, 'r+b') as out:
+            out.truncate(size)
+
+def _is_forward_path(model, path):
+    """True if every hop in ``path`` is a forward FK/one-to-one (joinable)."""
+    for name in path.split('__'):
+        field = model._meta.get_field(name)
+        if not (field.many_to_one or field.one_to_one) or not field.concrete:
+            return False
+        model = field.related_model
+    return True
+
+def serializer_relations(serializer, prefix=''):
+    """
+    Yield the relation paths ``serializer`` reads when rendering: nested
+    serializers, related fields other than plain primary keys, and the
+    paths listed for method fields in ``Meta.method_field_relations``.
+    """
+    from rest_framework import serializers
+
+    method_relations = getattr(getattr(serializer, 'Meta', None), 'method_field_relations', {})
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if isinstance(field, serializers.SerializerMethodField):
+            for path in method_relations.get(name, []):
+                yield prefix + path
+            continue
+        if field.source == '*' or '.' in field.source:
+            continue
+        path = prefix + field.source
+        if isinstance(field, serializers.ListSerializer):
+            yield path
+            yield from serializer_relations(field.child, f'{path}__')
+        elif isinstance(field, serializers.Serializer):
+            yield path
+            yield from serializer_relations(field, f'{path}__')
+        elif isinstance(field, serializers.ManyRelatedField):
+            yield path
+        elif isinstance(field, serializers.RelatedField) and not isinstance(field, serializers.PrimaryKeyRelatedField):
+            yield path
+
+def prefetch_for_serializer(queryset, serializer_class, context=None):
+    """
+    Add the ``select_related``/``prefetch_related`` calls needed to render
+    ``queryset`` with ``serializer_class`` without per-row queries.
+    """
+    serializer = serializer_class(context=context or {})
+    select, prefetch = set(), set()
+    for path in serializer_relations(serializer):
+        if _is_forward_path(queryset.model, path):
+            select.add(path)
+            continue
+        prefetch.add(path)
+        # Join the leading forward hops so the prefetch starts from cached rows.
+        parts = path.split('__')
+        for end in range(len(parts) - 1, 0, -1):
+            head = '__'.join(parts[:end])
+            if _is_forward_path(queryset.model, head):
+                select.add(head)
+                break
+    # A prefetch nested under another prefetch already covers its parent.
+    prefetch = {path for path in prefetch if not any(
+        other != path and other.startswith(f'{path}__') for other in prefetch
+    )}
+    if select:
+        queryset = queryset.select_related(*sorted(select))
+    if prefetch:
+        queryset = queryset.prefetch_related(*sorted(prefetch))
+    return queryset
@@ -1,26 +1,55 @@
+import asyncio
+import logging
+import os
+import uuid
+import mimetypes
 from django.shortcuts import render
-from rest_framework import viewsets, permissions, filters
+from rest_framework import viewsets, permissions, filters, mixins, status
 from django_filters.rest_framework import DjangoFilterBackend
 from django.contrib.auth import get_user_model
-from .models import Track, Category, Folder, CustomCriteria, File, Notification
+from django.conf import settings
+from django.core.files import File as DjangoFile
+from django.db import transaction
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
+from .models import (
+    Blob, Track, Category, Folder, CustomCriteria, File, StorageUsage, UploadSession, Notification, Broadcast
+)
 from .serializers import (
-    TrackSerializer, CategorySerializer, FolderSerializer,
-    CustomCriteriaSerializer, FileSerializer, NotificationSerializer
+    TrackSerializer, CategorySerializer, FolderSerializer, BreadcrumbSerializer,
+    CustomCriteriaSerializer, FileSerializer, UploadSessionSerializer,
+    PresignedUploadSerializer, PresignedFinalizeSerializer, BatchUploadSerializer,
+    BulkFileOperationSerializer, NotificationSerializer, BroadcastSerializer, validate_upload
 )
 from .permissions import IsOwnerOrReadOnly, IsFileOwner
-from .tasks import process_uploaded_file, send_email_notification
+from .tasks import (
+    process_uploaded_file, send_email_notification, schedule_file_processing, schedule_batch_processing,
+    deliver_broadcast
+)
+from .utils import write_chunk, truncate_file, prefetch_for_serializer
+from .storage import STORAGE_ERRORS, get_s3_storage, get_s3_client, s3_key, acquire_blob, release_blob
+from .downloads import file_download_response, folder_export_response
+from .search import FileSearchFilter
+from .tree import get_folder_tree, invalidate_folder_tree
+from .pagination import CursorPaginationMixin
+from .events import format_event, get_hub, issue_stream_ticket, publish_unread_count, redeem_stream_ticket
+from .unread import forget_unread_count, get_unread_count
+from .quota import QuotaExceeded, check_quota, deferred_usage_changes, record_usage
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.core.cache import cache
+from core.versioning import VersionedETagMixin, bump_version
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
 
 class TrackViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Track.objects.all()
     serializer_class = TrackSerializer
     permission_classes = [permissions.IsAuthenticated]
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(VersionedETagMixin, viewsets.ModelViewSet):
+    etag_resources = ('categories',)
     serializer_class = CategorySerializer
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrReadOnly]
     filter_backends = [filters.SearchFilter]
@@ -32,7 +61,8 @@ class CategoryViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
-class FolderViewSet(viewsets.ModelViewSet):
+class FolderViewSet(VersionedETagMixin, CursorPaginationMixin, viewsets.ModelViewSet):
+    etag_resources = ('folders',)
     serializer_class = FolderSerializer
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrReadOnly]
     filter_backends = [filters.SearchFilter]
@@ -44,7 +74,31 @@ class FolderViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
-class CustomCriteriaViewSet(viewsets.ModelViewSet):
+    def perform_destroy(self, instance):
+        # The path range covers the whole subtree, so nothing is walked level by level.
+        instance.get_descendants().delete()
+
+    @action(detail=False, methods=['get'])
+    def tree(self, request):
+        """The user's whole folder hierarchy with per-folder file totals."""
+        return Response(get_folder_tree(request.user))
+
+    @action(detail=True, methods=['get'])
+    def breadcrumbs(self, request, pk=None):
+        """Ancestors of the folder from the root down, including itself."""
+        folder = self.get_object()
+        ancestors = Folder.objects.filter(
+            user=request.user, id__in=folder.get_ancestor_ids()
+        ).order_by('depth')
+        return Response(BreadcrumbSerializer(ancestors, many=True).data)
+
+    @action(detail=True, methods=['get'], url_path='export.zip')
+    def export_zip(self, request, pk=None):
+        """Stream the folder and everything beneath it as a ZIP archive."""
+        return folder_export_response(self.get_object())
+
+class CustomCriteriaViewSet(VersionedETagMixin, viewsets.ModelViewSet):
+    etag_resources = ('criteria',)
     serializer_class = CustomCriteriaSerializer
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrReadOnly]
     filter_backends = [filters.SearchFilter]
@@ -56,17 +110,30 @@ class CustomCriteriaViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
-class FileViewSet(viewsets.ModelViewSet):
+class FileViewSet(VersionedETagMixin, CursorPaginationMixin, viewsets.ModelViewSet):
+    etag_resources = ('files',)
     queryset = File.objects.all()
+    cursor_ordering = ('-uploaded_at', '-id')
+    ranked_query_params = (FileSearchFilter.search_param, FileSearchFilter.legacy_search_param)
     serializer_class = FileSerializer
     permission_classes = [permissions.IsAuthenticated, IsFileOwner]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['folder', 'categories', 'custom_criteria', 'track', 'is_public']
-    search_fields = ['title', 'description']
+    filter_backends = [DjangoFilterBackend, FileSearchFilter, filters.OrderingFilter]
+    filterset_fields = ['folder', 'categories', 'custom_criteria', 'track', 'is_public', 'processing_status']
     ordering_fields = ['uploaded_at', 'updated_at', 'title']
 
     def get_queryset(self):
-        return File.objects.filter(user=self.request.user)
+        queryset = prefetch_for_serializer(
+            File.objects.filter(user=self.request.user), self.get_serializer_class()
+        )
+        subtree = self.request.query_params.get('folder_subtree')
+        if subtree and self.action == 'list':
+            path = Folder.objects.filter(
+                user=self.request.user, pk=subtree if subtree.isdigit() else None
+            ).values_list('path', flat=True).first()
+            if path is None:
+                return queryset.none()
+            queryset = queryset.filter(Folder.subtree_q(path, prefix='folder__'))
+        return queryset
 
     def perform_create(self, serializer):
         from django.conf import settings
@@ -78,9 +145,446 @@ class FileViewSet(viewsets.ModelViewSet):
         if content_length > max_size:
             raise ValidationError({'file': f"File size exceeds the limit of {max_size / (1024 * 1024):.0f}MB."})
 
-        serializer.save(user=self.request.user)
+        upload = serializer.validated_data.get('file')
+        check_quota(self.request.user.id, upload.size if upload else 0)
+        file = serializer.save(user=self.request.user)
+        schedule_file_processing(file)
+
+    def perform_update(self, serializer):
+        upload = serializer.validated_data.get('file')
+        if upload:
+            check_quota(self.request.user.id, upload.size - serializer.instance.size)
+        file = serializer.save()
+        if upload:
+            schedule_file_processing(file)
+
+    def perform_destroy(self, instance):
+        instance.trash()
+
+    @action(detail=False, methods=['get'])
+    def trash(self, request):
+        """Files in the trash, most recently deleted first."""
+        queryset = prefetch_for_serializer(
+            File.all_objects.trashed().filter(user=request.user).order_by('-deleted_at', '-id'),
+            self.get_serializer_class()
+        )
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=['post'])
+    def restore(self, request, pk=None):
+        """Take a file back out of the trash."""
+        file = File.all_objects.trashed().filter(user=request.user, pk=pk).first()
+        if file is None:
+            return Response({'error': 'File is not in the trash'}, status=status.HTTP_404_NOT_FOUND)
+        file.restore()
+        return Response(self.get_serializer(file).data)
+
+    @action(detail=False, methods=['get'])
+    def usage(self, request):
+        """Bytes and files stored by the user, with a per-type breakdown."""
+        usage = StorageUsage.objects.filter(user=request.user).first() or StorageUsage(user=request.user)
+        quota = usage.quota_bytes if usage.quota_bytes is not None else settings.STORAGE_QUOTA_BYTES
+        data = {'total_bytes': usage.total_bytes, 'file_count': usage.file_count, 'quota_bytes': quota or None}
+        data.update({column: getattr(usage, column) for column in StorageUsage.CATEGORY_COLUMNS})
+        return Response(data)
+
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """Upload many files in one multipart request, reporting each part's outcome."""
+        from rest_framework.exceptions import ValidationError as DRFValidationError
+
+        uploads = request.FILES.getlist('files')
+        if not uploads:
+            return Response({'error': 'No files provided'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(uploads) > settings.FILE_BATCH_MAX_FILES:
+            return Response(
+                {'error': f'At most {settings.FILE_BATCH_MAX_FILES} files per request'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        serializer = BatchUploadSerializer(data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        check_quota(request.user.id, sum(upload.size for upload in uploads))
+
+        results = []
+        pending = []
+        try:
+            for upload in uploads:
+                name = os.path.basename(upload.name)
+                try:
+                    validate_upload(upload)
+                    # Each part commits on its own, so no transaction stays open
+                    # while the rest of the batch streams to storage.
+                    with transaction.atomic():
+                        blob = acquire_blob(upload)
+                except DRFValidationError as exc:
+                    results.append({'name': name, 'status': 'error', 'error': exc.detail[0]})
+                    continue
+                except STORAGE_ERRORS:
+                    logger.exception('Could not store batch upload part %r for user %s', name, request.user.id)
+                    results.append({'name': name, 'status': 'error', 'error': 'Could not store the file'})
+                    continue
+
+                results.append({'name': name, 'status': 'created'})
+                pending.append((len(results) - 1, File(
+                    user=request.user,
+                    title=name,
+                    description=data['description'],
+                    file=blob.file.name,
+                    blob=blob,
+                    folder=data.get('folder'),
+                    track=data.get('track'),
+                    is_public=data['is_public'],
+                    size=upload.size,
+                    content_type=upload.content_type or mimetypes.guess_type(name)[0] or '',
+                )))
+
+            with transaction.atomic():
+                created = File.objects.bulk_create([file for _, file in pending])
+                file_ids = [file.id for file in created]
+                # bulk_create sends no post_save, so count the new bytes here.
+                with deferred_usage_changes():
+                    for file in created:
+                        record_usage(request.user.id, file.file.name, file.size)
+                File.categories.through.objects.bulk_create([
+                    File.categories.through(file_id=file_id, category_id=category_id)
+                    for file_id in file_ids for category_id in data['categories']
+                ])
+                File.custom_criteria.through.objects.bulk_create([
+                    File.custom_criteria.through(file_id=file_id, customcriteria_id=criteria_id)
+                    for file_id in file_ids for criteria_id in data['criteria']
+                ])
+                schedule_batch_processing(file_ids)
+        except Exception:
+            # Give back the blob references taken for parts that never became files.
+            for _, file in pending:
+                release_blob(file.blob_id)
+            raise
+
+        if file_ids:
+            invalidate_folder_tree(request.user.id)
+            bump_version(request.user.id, 'files')
+            files = prefetch_for_serializer(File.objects.filter(id__in=file_ids), FileSerializer)
+            rendered = {item['id']: item for item in FileSerializer(
+                files, many=True, context=self.get_serializer_context()
+            ).data}
+            for (index, _), file_id in zip(pending, file_ids):
+                results[index]['file'] = rendered[file_id]
+
+        if not file_ids:
+            response_status = status.HTTP_400_BAD_REQUEST
+        elif len(file_ids) < len(results):
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_201_CREATED
+        return Response({'results': results}, status=response_status)
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """Move, tag, untag, publish, trash or restore many files in one transaction."""
+        from django.utils import timezone
+
+        serializer = BulkFileOperationSerializer(data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        operation = data['operation']
+
+        with transaction.atomic():
+            candidates = File.all_objects.trashed() if operation == 'restore' else File.objects
+            owned = list(
+                candidates.select_for_update()
+                .filter(user=request.user, id__in=data['ids'])
+                .values_list('id', flat=True)
+            )
+            missing = sorted(set(data['ids']) - set(owned))
+            if missing:
+                return Response(
+                    {'error': 'Some files do not exist or are not yours', 'ids': missing},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+
+            files = File.all_objects.filter(id__in=owned)
+            if operation == 'move':
+                files.update(folder=data['folder'], updated_at=timezone.now())
+            elif operation == 'set_public':
+                files.update(is_public=data['is_public'], updated_at=timezone.now())
+            elif operation in ('tag', 'untag'):
+                relations = (
+                    (File.categories.through, 'category_id', data['category_ids']),
+                    (File.custom_criteria.through, 'customcriteria_id', data['criteria_ids']),
+                )
+                for through, column, related_ids in relations:
+                    if not related_ids:
+                        continue
+                    if operation == 'tag':
+                        through.objects.bulk_create(
+                            [through(file_id=file_id, **{column: related_id})
+                             for file_id in owned for related_id in related_ids],
+                            ignore_conflicts=True,
+                        )
+                    else:
+                        through.objects.filter(file_id__in=owned, **{f'{column}__in': related_ids}).delete()
+            elif operation == 'delete':
+                files.update(deleted_at=timezone.now(), updated_at=timezone.now())
+            elif operation == 'restore':
+                files.update(deleted_at=None, updated_at=timezone.now())
+
+        invalidate_folder_tree(request.user.id)
+        bump_version(request.user.id, 'files')
+        return Response({'operation': operation, 'count': len(owned)})
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        """Stream the file's content with Range and ETag support."""
+        return file_download_response(request, self.get_object())
+
+    @action(detail=False, methods=['post'])
+    def presign(self, request):
+        """Issue presigned PUT/POST parameters for uploading straight to S3."""
+        storage = get_s3_storage()
+        if storage is None:
+            return Response({'error': 'Direct uploads require S3 storage'}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = PresignedUploadSerializer(data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        check_quota(request.user.id, serializer.validated_data['size'])
+        filename = serializer.validated_data['filename']
+        content_type = (
+            serializer.validated_data.get('content_type')
+            or mimetypes.guess_type(filename)[0]
+            or 'application/octet-stream'
+        )
+
+        ext = os.path.splitext(filename)[1].lower()
+        name = f'portfolio_files/{request.user.id}/{uuid.uuid4().hex}{ext}'
+        key = s3_key(storage, name)
+        client = get_s3_client(storage)
+        expires = settings.DIRECT_UPLOAD_EXPIRATION
+
+        post = client.generate_presigned_post(
+            Bucket=storage.bucket_name,
+            Key=key,
+            Fields={'Content-Type': content_type},
+            Conditions=[
+                {'Content-Type': content_type},
+                ['content-length-range', 1, settings.DIRECT_UPLOAD_MAX_SIZE],
+            ],
+            ExpiresIn=expires,
+        )
+        put_url = client.generate_presigned_url(
+            'put_object',
+            Params={'Bucket': storage.bucket_name, 'Key': key, 'ContentType': content_type},
+            ExpiresIn=expires,
+        )
+
+        return Response({
+            'key': name,
+            'put': {'url': put_url, 'headers': {'Content-Type': content_type}},
+            'post': post,
+            'expires_in': expires,
+        })
+
+    @action(detail=False, methods=['post'], url_path='presign/finalize')
+    def finalize_presigned(self, request):
+        """Create a ``File`` for an object uploaded with ``presign``."""
+        from botocore.exceptions import ClientError
+
+        storage = get_s3_storage()
+        if storage is None:
+            return Response({'error': 'Direct uploads require S3 storage'}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = PresignedFinalizeSerializer(data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        name = data['key']
 
-class NotificationViewSet(viewsets.ModelViewSet):
+        existing = File.objects.filter(user=request.user, file=name).first()
+        if existing:
+            return Response(self.get_serializer(existing).data)
+        # Trashed files and blobs own their objects too; a second row would
+        # share, and later delete, content it never uploaded.
+        if File.all_objects.filter(file=name).exists() or Blob.objects.filter(file=name).exists():
+            return Response({'error': 'Key is already in use'}, status=status.HTTP_400_BAD_REQUEST)
+
+        client = get_s3_client(storage)
+        key = s3_key(storage, name)
+        try:
+            head = client.head_object(Bucket=storage.bucket_name, Key=key)
+        except ClientError:
+            return Response({'error': 'Uploaded object not found'}, status=status.HTTP_400_BAD_REQUEST)
+
+        size = head['ContentLength']
+        max_size = settings.DIRECT_UPLOAD_MAX_SIZE
+        if size > max_size:
+            client.delete_object(Bucket=storage.bucket_name, Key=key)
+            return Response(
+                {'error': f"File size exceeds the limit of {max_size / (1024 * 1024):.0f}MB."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            # The name is already committed, so File.save adds no transaction of
+            # its own; a refused usage update must roll the row back too.
+            with transaction.atomic():
+                check_quota(request.user.id, size)
+                file = File.objects.create(
+                    user=request.user,
+                    title=data['title'],
+                    description=data['description'],
+                    folder=data.get('folder'),
+                    track=data.get('track'),
+                    is_public=data['is_public'],
+                    file=name,
+                    size=size,
+                    content_type=head.get('ContentType', ''),
+                )
+                schedule_file_processing(file)
+        except QuotaExceeded:
+            client.delete_object(Bucket=storage.bucket_name, Key=key)
+            raise
+        return Response(self.get_serializer(file).data, status=status.HTTP_201_CREATED)
+
+class UploadSessionViewSet(mixins.CreateModelMixin,
+                           mixins.RetrieveModelMixin,
+                           mixins.DestroyModelMixin,
+                           viewsets.GenericViewSet):
+    """
+    Resumable chunked uploads: create a session, PUT numbered chunks, then
+    finalize it into a ``File``.
+    """
+    serializer_class = UploadSessionSerializer
+    permission_classes = [permissions.IsAuthenticated, IsFileOwner]
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(user=self.request.user)
+
+    def perform_create(self, serializer):
+        check_quota(self.request.user.id, serializer.validated_data['total_size'])
+        serializer.save(user=self.request.user, chunk_size=settings.CHUNKED_UPLOAD_CHUNK_SIZE)
+
+    def perform_destroy(self, instance):
+        instance.discard_temp_file()
+        instance.delete()
+
+    @action(detail=True, methods=['put'], url_path=r'chunks/(?P<index>\d+)')
+    def chunk(self, request, pk=None, index=None):
+        """Stream one numbered chunk into the session's temporary file."""
+        session = self.get_object()
+        index = int(index)
+
+        if session.status != 'active':
+            return Response({'error': 'Upload session is already finalized'}, status=status.HTTP_409_CONFLICT)
+        if index >= session.total_chunks:
+            return Response({'error': 'Chunk index out of range'}, status=status.HTTP_400_BAD_REQUEST)
+        if index < session.next_chunk:
+            # Already stored; the client is retrying after a lost response.
+            return Response(self.get_serializer(session).data)
+        if index > session.next_chunk:
+            return Response(
+                {'error': f'Expected chunk {session.next_chunk}', 'next_chunk': session.next_chunk},
+                status=status.HTTP_409_CONFLICT
+            )
+
+        expected_size = session.expected_chunk_size(index)
+        try:
+            content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            content_length = 0
+        if content_length != expected_size:
+            return Response(
+                {'error': f'Chunk {index} must be exactly {expected_size} bytes'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        with transaction.atomic():
+            session = UploadSession.objects.select_for_update().get(pk=session.pk)
+            if index != session.next_chunk:
+                return Response(
+                    {'error': f'Expected chunk {session.next_chunk}', 'next_chunk': session.next_chunk},
+                    status=status.HTTP_409_CONFLICT
+                )
+
+            written, chunk_crc, crc = write_chunk(
+                session.temp_path, session.received_bytes, request.stream, session.checksum
+            )
+            if written != expected_size:
+                truncate_file(session.temp_path, session.received_bytes)
+                return Response({'error': 'Incomplete chunk received'}, status=status.HTTP_400_BAD_REQUEST)
+
+            expected_crc = request.headers.get('X-Chunk-Checksum')
+            if expected_crc:
+                try:
+                    matches = int(expected_crc, 16) == chunk_crc
+                except ValueError:
+                    matches = False
+                if not matches:
+                    truncate_file(session.temp_path, session.received_bytes)
+                    return Response({'error': 'Chunk checksum mismatch'}, status=status.HTTP_400_BAD_REQUEST)
+
+            session.received_bytes += written
+            session.next_chunk = index + 1
+            session.checksum = crc
+            session.save(update_fields=['received_bytes', 'next_chunk', 'checksum', 'updated_at'])
+
+        return Response(self.get_serializer(session).data)
+
+    @action(detail=True, methods=['post'])
+    def finalize(self, request, pk=None):
+        """Verify the assembled upload and turn it into a ``File``."""
+        session = self.get_object()
+        file_context = self.get_serializer_context()
+
+        with transaction.atomic():
+            # Lock the session so concurrent finalize calls create one file.
+            session = UploadSession.objects.select_for_update().get(pk=session.pk)
+            if session.status == 'complete':
+                if session.file is None:
+                    return Response(
+                        {'error': 'Upload was finalized and its file has since been deleted'},
+                        status=status.HTTP_410_GONE
+                    )
+                return Response(FileSerializer(session.file, context=file_context).data)
+            if session.received_bytes != session.total_size:
+                return Response(
+                    {'error': 'Upload is incomplete', 'next_chunk': session.next_chunk},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            checksum = request.data.get('checksum')
+            if checksum:
+                try:
+                    matches = int(checksum, 16) == session.checksum
+                except (TypeError, ValueError):
+                    matches = False
+                if not matches:
+                    return Response({'error': 'Checksum mismatch'}, status=status.HTTP_400_BAD_REQUEST)
+
+            try:
+                fh = open(session.temp_path, 'rb')
+            except FileNotFoundError:
+                return Response({'error': 'Uploaded data is no longer available'}, status=status.HTTP_410_GONE)
+            with fh:
+                file = File.objects.create(
+                    user=request.user,
+                    title=session.title,
+                    description=session.description,
+                    folder=session.folder,
+                    track=session.track,
+                    is_public=session.is_public,
+                    file=DjangoFile(fh, name=session.filename),
+                )
+            session.status = 'complete'
+            session.file = file
+            session.save(update_fields=['status', 'file', 'updated_at'])
+            schedule_file_processing(file)
+
+        session.discard_temp_file()
+        return Response(FileSerializer(file, context=file_context).data, status=status.HTTP_201_CREATED)
+
+class NotificationViewSet(VersionedETagMixin, CursorPaginationMixin, viewsets.ModelViewSet):
+    etag_resources = ('notifications',)
     serializer_class = NotificationSerializer
     permission_classes = [permissions.IsAuthenticated]
     
@@ -90,11 +594,121 @@ class NotificationViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['post'])
     def mark_all_read(self, request):
         """Mark all notifications as read."""
-        self.get_queryset().update(is_read=True)
+        user_id = request.user.id
+        unread = self.get_queryset().filter(is_read=False).order_by('id')
+        batch_size = settings.NOTIFICATION_MARK_READ_BATCH_SIZE
+        last_id = 0
+        # Bounded batches keep each UPDATE's locks short on large inboxes.
+        while True:
+            ids = list(unread.filter(id__gt=last_id).values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            Notification.objects.filter(id__in=ids, is_read=False).update(is_read=True)
+            last_id = ids[-1]
+        bump_version(user_id, 'notifications')
+
+        # Notifications created during the loop stay unread, so recount
+        # rather than assuming zero.
+        def recount():
+            forget_unread_count(user_id)
+            publish_unread_count(user_id)
+
+        transaction.on_commit(recount)
         return Response({'status': 'all notifications marked as read'})
     
     @action(detail=False, methods=['get'])
     def unread_count(self, request):
-        """Get count of unread notifications."""
-        count = self.get_queryset().filter(is_read=False).count()
-        return Response({'unread_count': count})
+        """Get count of unread notifications from the cached counter."""
+        return Response({'unread_count': get_unread_count(request.user.id)})
+
+    @action(detail=False, methods=['post'], url_path='stream-ticket')
+    def stream_ticket(self, request):
+        """Issue a single-use ticket for opening ``/notifications/stream/?ticket=``."""
+        return Response({
+            'ticket': issue_stream_ticket(request.user.id),
+            'expires_in': settings.NOTIFICATION_STREAM_TICKET_TTL,
+        })
+
+
+
+class BroadcastViewSet(mixins.CreateModelMixin, mixins.ListModelMixin, mixins.RetrieveModelMixin,
+                       viewsets.GenericViewSet):
+    """Staff-only: notify a whole audience at once and follow the fan-out's progress."""
+    queryset = Broadcast.objects.all()
+    serializer_class = BroadcastSerializer
+    permission_classes = [permissions.IsAdminUser]
+
+    def perform_create(self, serializer):
+        broadcast = serializer.save(created_by=self.request.user)
+        transaction.on_commit(lambda: deliver_broadcast.delay(broadcast.id))
+
+
+async def _stream_user_id(request):
+    """
+    Resolve the stream's user from a ticket issued by
+    ``/notifications/stream-ticket/`` (``?ticket=``, since ``EventSource``
+    cannot send headers), a JWT in ``Authorization: Bearer`` or the session.
+    Users deactivated or deleted since are refused.
+    """
+    from rest_framework_simplejwt.exceptions import TokenError
+    from rest_framework_simplejwt.settings import api_settings
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    ticket = request.GET.get('ticket')
+    header = request.headers.get('Authorization', '')
+    if ticket:
+        user_id = await redeem_stream_ticket(ticket)
+    elif header.startswith('Bearer '):
+        try:
+            user_id = AccessToken(header[len('Bearer '):])[api_settings.USER_ID_CLAIM]
+        except (TokenError, KeyError):
+            return None
+    else:
+        user = await request.auser()
+        user_id = user.pk if user.is_authenticated else None
+    if user_id is None or not await User.objects.filter(pk=user_id, is_active=True).aexists():
+        return None
+    return user_id
+
+
+async def notification_stream(request):
+    """
+    Server-Sent Events stream of the user's new notifications and unread
+    count. Replaces polling ``unread_count``; run under ``core.asgi`` so
+    each open stream is a coroutine rather than a worker thread.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    user_id = await _stream_user_id(request)
+    if user_id is None:
+        return JsonResponse({'error': 'Authentication credentials were not provided or are invalid.'}, status=401)
+
+    last_event_id = request.headers.get('Last-Event-ID', '')
+
+    async def events():
+        async with get_hub().listen(user_id) as queue:
+            # Subscribed first, so nothing published from here on is lost.
+            yield f'retry: {settings.NOTIFICATION_STREAM_HEARTBEAT * 1000}\n\n'
+            if last_event_id.isdigit():
+                missed = Notification.objects.filter(
+                    user_id=user_id, id__gt=int(last_event_id)
+                ).order_by('id')[:settings.NOTIFICATION_STREAM_REPLAY_LIMIT]
+                async for notification in missed:
+                    data = NotificationSerializer(notification).data
+                    yield format_event('notification', data, event_id=notification.id)
+            count = await sync_to_async(get_unread_count)(user_id)
+            yield format_event('unread_count', {'unread_count': count})
+
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), settings.NOTIFICATION_STREAM_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                    continue
+                event_id = message['data'].get('id') if message['event'] == 'notification' else None
+                yield format_event(message['event'], message['data'], event_id=event_id)
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def record_opening_balances(apps, schema_editor):
+    """Start every profile's ledger with its current XP so the ledger sums to ``xp``."""
+    UserProfile = apps.get_model('rpg', 'UserProfile')
+    XPEvent = apps.get_model('rpg', 'XPEvent')
+    events = (
+        XPEvent(user_profile_id=pk, source='opening_balance', amount=xp)
+        for pk, xp in UserProfile.objects.filter(xp__gt=0).values_list('pk', 'xp').iterator()
+    )
+    XPEvent.objects.bulk_create(events, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rpg', '0006_userprofile_achievements'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='XPEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=50, verbose_name='source')),
+                ('amount', models.IntegerField(verbose_name='amount')),
+                ('idempotency_key', models.CharField(blank=True, max_length=255, null=True, verbose_name='idempotency key')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='created at')),
+                ('user_profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='xp_events', to='rpg.userprofile')),
+            ],
+            options={
+                'verbose_name': 'XP event',
+                'verbose_name_plural': 'XP events',
+                'indexes': [models.Index(fields=['user_profile', 'created_at'], name='rpg_xpevent_user_pr_0ff536_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user_profile', 'idempotency_key'), name='rpg_xpevent_unique_key')],
+            },
+        ),
+        migrations.RunPython(record_opening_balances, migrations.RunPython.noop),
+    ]
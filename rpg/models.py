@@ -57,6 +57,8 @@ class Badge(models.Model):
         return self.name
 
 class UserProfile(models.Model):
+    XP_PER_LEVEL = 1000
+
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='rpg_profile')
     character_class = models.ForeignKey(CharacterClass, on_delete=models.SET_NULL, null=True)
     xp = models.IntegerField(_('XP'), default=0, validators=[MinValueValidator(0)])
@@ -81,17 +83,18 @@ class UserProfile(models.Model):
     @property
     def next_level_xp(self):
         # Example level progression: 1000 XP per level
-        return (self.level * 1000)
+        return (self.level * self.XP_PER_LEVEL)
 
-    def add_xp(self, amount):
-        self.xp += amount
-        while self.xp >= self.next_level_xp:
-            self.level_up()
-        self.save()
+    def add_xp(self, amount, source='manual', idempotency_key=None):
+        """
+        Award XP through the ledger with a single atomic ``UPDATE``, then
+        reload ``xp`` and ``level``. Returns ``False`` for a repeated key.
+        """
+        from .xp import award_xp
 
-    def level_up(self):
-        self.level += 1
-        # Trigger any level-up events here
+        applied = award_xp(self, amount, source, idempotency_key=idempotency_key)
+        self.refresh_from_db(fields=['xp', 'level'])
+        return applied
 
 class UserAchievement(models.Model):
     user_profile = models.ForeignKey(UserProfile, on_delete=models.CASCADE)
@@ -123,3 +126,28 @@ class UserBadge(models.Model):
 
     def __str__(self):
         return f"{self.user_profile.user.email} - {self.badge.name}"
+
+class XPEvent(models.Model):
+    """
+    Append-only ledger of XP awards. A profile's ``xp`` is the sum of its
+    events; ``idempotency_key`` makes a retried award to the same profile
+    a no-op.
+    """
+    user_profile = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='xp_events')
+    source = models.CharField(_('source'), max_length=50)
+    amount = models.IntegerField(_('amount'))
+    idempotency_key = models.CharField(_('idempotency key'), max_length=255, null=True, blank=True)
+    created_at = models.DateTimeField(_('created at'), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('XP event')
+        verbose_name_plural = _('XP events')
+        indexes = [
+            models.Index(fields=['user_profile', 'created_at']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['user_profile', 'idempotency_key'], name='rpg_xpevent_unique_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_profile_id} {self.amount:+d} XP ({self.source})"
@@ -52,4 +52,24 @@ class UserProfileSerializer(serializers.ModelSerializer):
     def get_progress_to_next_level(self, obj):
         if obj.level == 1:
             return obj.xp / 1000 * 100
-        return (obj.xp % 1000) / 1000 * 100 
\ No newline at end of file
+        return (obj.xp % 1000) / 1000 * 100 
+
+
+class XPAwardSerializer(serializers.Serializer):
+    user = serializers.PrimaryKeyRelatedField(queryset=User.objects.all())
+    amount = serializers.IntegerField(min_value=1)
+    source = serializers.CharField(max_length=50)
+    idempotency_key = serializers.CharField(max_length=255, required=False, allow_blank=True)
+
+
+class XPAwardBatchSerializer(serializers.Serializer):
+    awards = XPAwardSerializer(many=True)
+
+    def validate_awards(self, value):
+        from django.conf import settings
+
+        if not value:
+            raise serializers.ValidationError('At least one award is required.')
+        if len(value) > settings.XP_AWARD_BATCH_MAX:
+            raise serializers.ValidationError(f'At most {settings.XP_AWARD_BATCH_MAX} awards per request.')
+        return value
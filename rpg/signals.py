@@ -0,0 +1,18 @@
+from django.db.models.signals import post_delete, post_save
+from core.versioning import bump_version
+from .models import UserProfile, UserAchievement, UserBadge
+
+
+def bump_profile_version(sender, instance, **kwargs):
+    """Invalidate the user's profile ETags when anything shown on it changes."""
+    if sender is UserProfile:
+        user_id = instance.user_id
+    else:
+        user_id = UserProfile.objects.filter(pk=instance.user_profile_id).values_list('user_id', flat=True).first()
+    if user_id is not None:
+        bump_version(user_id, 'profiles')
+
+
+for model in (UserProfile, UserAchievement, UserBadge):
+    post_save.connect(bump_profile_version, sender=model, dispatch_uid=f'bump_profile_save_{model.__name__}')
+    post_delete.connect(bump_profile_version, sender=model, dispatch_uid=f'bump_profile_delete_{model.__name__}')
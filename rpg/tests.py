@@ -1,3 +1,119 @@
+from django.core.cache import cache
 from django.test import TestCase
+from django.contrib.auth import get_user_model
+from rest_framework import status
+from rest_framework.test import APIClient
+from .models import UserProfile, XPEvent
+from .xp import award_xp, award_xp_batch
 
-# Create your tests here.
+User = get_user_model()
+
+
+class XPLedgerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='hero', email='hero@example.com', password='testpass123')
+        self.profile = UserProfile.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_award_is_atomic_and_levels_in_sql(self):
+        """Test an award is one UPDATE that also recomputes the level."""
+        self.assertTrue(award_xp(self.profile, 2500, 'quest'))
+        # A stale in-memory copy must not matter: the increment happens in the database.
+        self.assertTrue(award_xp(self.profile, 600, 'quest'))
+        self.profile.refresh_from_db()
+        self.assertEqual((self.profile.xp, self.profile.level), (3100, 4))
+        self.assertEqual(sum(self.profile.xp_events.values_list('amount', flat=True)), 3100)
+
+    def test_idempotency_key(self):
+        """Test a retried award with the same key is applied once."""
+        self.assertTrue(award_xp(self.profile, 100, 'upload', idempotency_key='upload:1'))
+        self.assertFalse(award_xp(self.profile, 100, 'upload', idempotency_key='upload:1'))
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.xp, 100)
+        self.assertEqual(XPEvent.objects.count(), 1)
+
+    def test_idempotency_key_is_per_profile(self):
+        """Test one user's key cannot suppress another user's award."""
+        other = UserProfile.objects.create(
+            user=User.objects.create_user(username='sidekick', email='sidekick@example.com', password='testpass123')
+        )
+        self.assertTrue(award_xp(self.profile, 100, 'daily', idempotency_key='daily:1'))
+        self.assertTrue(award_xp(other, 100, 'daily', idempotency_key='daily:1'))
+        self.assertEqual(award_xp_batch([(self.profile.pk, 5, 'daily', 'daily:1'), (other.pk, 5, 'daily', 'daily:2')]), 1)
+        other.refresh_from_db()
+        self.assertEqual(other.xp, 105)
+
+    def test_debit_is_trimmed_at_zero(self):
+        """Test a debit larger than the balance records only what was taken."""
+        award_xp(self.profile, 30, 'quest')
+        self.assertTrue(award_xp(self.profile, -50, 'penalty'))
+        self.assertEqual(award_xp_batch([(self.profile.pk, 20, 'quest', None), (self.profile.pk, -40, 'penalty', None)]), 2)
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.xp, 0)
+        self.assertEqual(list(self.profile.xp_events.order_by('id').values_list('amount', flat=True)), [30, -30, 20, -20])
+
+    def test_add_xp_rejects_invalid_source(self):
+        """Test add_xp validates the source instead of failing on insert."""
+        for source in ('x' * 51, '', 7):
+            response = self.client.post('/api/rpg/profiles/add_xp/', {'amount': 10, 'source': source}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(XPEvent.objects.exists())
+
+    def test_batch_is_one_update_per_profile(self):
+        """Test a batch inserts the ledger once and updates each profile once."""
+        other = UserProfile.objects.create(
+            user=User.objects.create_user(username='sidekick', email='sidekick@example.com', password='testpass123')
+        )
+        awards = [(self.profile.pk, 10, 'like', f'like:{i}') for i in range(5)]
+        awards += [(other.pk, 1000, 'quest', None), (self.profile.pk, 10, 'like', 'like:0')]
+
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(award_xp_batch(awards), 6)
+        sql = [q['sql'] for q in context.captured_queries]
+        self.assertEqual(len([q for q in sql if q.startswith('INSERT')]), 1)
+        self.assertEqual(len([q for q in sql if q.startswith('UPDATE')]), 2)
+
+        self.profile.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(self.profile.xp, 50)
+        self.assertEqual((other.xp, other.level), (1000, 2))
+
+    def test_add_xp_endpoint_returns_fresh_profile(self):
+        """Test repeated add_xp calls are never served from a stale copy."""
+        self.client.get('/api/rpg/profiles/')
+        for _ in range(2):
+            response = self.client.post('/api/rpg/profiles/add_xp/', {'amount': 600}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['xp'], response.data['level']), (1200, 2))
+
+        response = self.client.post(
+            '/api/rpg/profiles/add_xp/', {'amount': 600}, format='json', HTTP_IDEMPOTENCY_KEY='daily:1'
+        )
+        response = self.client.post(
+            '/api/rpg/profiles/add_xp/', {'amount': 600}, format='json', HTTP_IDEMPOTENCY_KEY='daily:1'
+        )
+        self.assertEqual(response.data['xp'], 1800)
+
+    def test_batch_award_endpoint(self):
+        """Test staff can award many users at once; profiles are created as needed."""
+        newcomer = User.objects.create_user(username='newcomer', email='newcomer@example.com', password='testpass123')
+        payload = {'awards': [
+            {'user': self.user.id, 'amount': 50, 'source': 'event', 'idempotency_key': 'event:hero'},
+            {'user': newcomer.id, 'amount': 75, 'source': 'event', 'idempotency_key': 'event:newcomer'},
+        ]}
+        response = self.client.post('/api/rpg/profiles/award/', payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        staff = User.objects.create_user(
+            username='gm', email='gm@example.com', password='testpass123', is_staff=True
+        )
+        self.client.force_authenticate(user=staff)
+        response = self.client.post('/api/rpg/profiles/award/', payload, format='json')
+        self.assertEqual(response.data, {'applied': 2, 'skipped': 0})
+        response = self.client.post('/api/rpg/profiles/award/', payload, format='json')
+        self.assertEqual(response.data, {'applied': 0, 'skipped': 2})
+        self.assertEqual(UserProfile.objects.get(user=newcomer).xp, 75)
@@ -2,13 +2,14 @@ from django.shortcuts import render
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from django.core.cache import cache
 from django.contrib.auth import get_user_model
+from core.versioning import VersionedETagMixin
 from .models import Achievement, Badge, UserProfile, UserAchievement, UserBadge
 from .serializers import (
     AchievementSerializer, BadgeSerializer, UserProfileSerializer,
-    UserAchievementSerializer, UserBadgeSerializer
+    UserAchievementSerializer, UserBadgeSerializer, XPAwardBatchSerializer
 )
+from .xp import award_xp_batch
 from .permissions import IsOwnerOrReadOnly
 
 User = get_user_model()
@@ -23,27 +24,18 @@ class BadgeViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = BadgeSerializer
     permission_classes = [permissions.IsAuthenticated]
 
-class UserProfileViewSet(viewsets.ModelViewSet):
+class UserProfileViewSet(VersionedETagMixin, viewsets.ModelViewSet):
     serializer_class = UserProfileSerializer
+    etag_resources = ('profiles',)
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrReadOnly]
 
     def get_queryset(self):
         return UserProfile.objects.filter(user=self.request.user)
 
     def get_object(self):
-        # Try to get from cache first
-        cache_key = f'user_profile_{self.request.user.id}'
-        cached_profile = cache.get(cache_key)
-        
-        if cached_profile:
-            return cached_profile
-        
-        # If not in cache, get from database
+        # Unchanged profiles are answered with 304 from the version counters
+        # before this runs, so the row is always read fresh.
         profile, created = UserProfile.objects.get_or_create(user=self.request.user)
-        
-        # Cache the profile for 5 minutes
-        cache.set(cache_key, profile, 300)
-        
         return profile
 
     @action(detail=False, methods=['get'])
@@ -69,10 +61,37 @@ class UserProfileViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
+        source = request.data.get('source', 'manual')
+        if not isinstance(source, str) or not source or len(source) > 50:
+            return Response(
+                {'error': 'Invalid XP source'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        key = request.headers.get('Idempotency-Key') or request.data.get('idempotency_key')
+        if key is not None and (not isinstance(key, str) or len(key) > 255):
+            return Response(
+                {'error': 'Invalid idempotency key'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
         profile = self.get_object()
-        profile.add_xp(amount)
-        
-        # Invalidate cache
-        cache.delete(f'user_profile_{request.user.id}')
-        
+        profile.add_xp(amount, source=source, idempotency_key=key)
         return Response(self.get_serializer(profile).data)
+
+    @action(detail=False, methods=['post'], permission_classes=[permissions.IsAdminUser])
+    def award(self, request):
+        """Apply many XP awards at once: one ledger INSERT and one UPDATE per user."""
+        serializer = XPAwardBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        awards = serializer.validated_data['awards']
+
+        users = {award['user'].pk for award in awards}
+        UserProfile.objects.bulk_create(
+            [UserProfile(user_id=user_id) for user_id in users], ignore_conflicts=True
+        )
+        profiles = dict(UserProfile.objects.filter(user_id__in=users).values_list('user_id', 'pk'))
+        applied = award_xp_batch(
+            (profiles[award['user'].pk], award['amount'], award['source'], award.get('idempotency_key'))
+            for award in awards
+        )
+        return Response({'applied': applied, 'skipped': len(awards) - applied})
@@ -0,0 +1,114 @@
+from collections import defaultdict
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from core.versioning import bump_version
+from .models import UserProfile, XPEvent
+
+
+def _apply_totals(totals):
+    """
+    Add each profile's total in one ``UPDATE ... SET xp = xp + n`` with the
+    level derived from the new XP in the same statement. Profiles are
+    updated in id order so concurrent batches lock rows in the same order.
+    """
+    per_level = UserProfile.XP_PER_LEVEL
+    for profile_id in sorted(totals):
+        amount = totals[profile_id]
+        if amount:
+            UserProfile.objects.filter(pk=profile_id).update(
+                xp=F('xp') + amount,
+                level=Greatest(F('level'), (F('xp') + amount) / per_level + 1),
+            )
+
+
+def _trim_debits(events):
+    """
+    Shrink debits that would take a profile below zero XP to what it can
+    still lose, so the ledger keeps summing to ``xp``. Only profiles with a
+    debit are locked and read.
+    """
+    debited = {event.user_profile_id for event in events if event.amount < 0}
+    if not debited:
+        return
+    balances = dict(
+        UserProfile.objects.select_for_update().filter(pk__in=debited).order_by('pk').values_list('pk', 'xp')
+    )
+    trimmed = []
+    for event in events:
+        if event.user_profile_id not in balances:
+            continue
+        balance = balances[event.user_profile_id]
+        applied = max(balance + event.amount, 0) - balance
+        if applied != event.amount:
+            event.amount = applied
+            trimmed.append(event)
+        balances[event.user_profile_id] = balance + applied
+    XPEvent.objects.bulk_update(trimmed, ['amount'])
+
+
+def _record(events):
+    """
+    Insert ledger rows, skipping those whose idempotency key the profile
+    has already used. Returns the events actually recorded.
+    """
+    keyed = [event for event in events if event.idempotency_key]
+    seen = set(
+        XPEvent.objects.filter(
+            user_profile_id__in={event.user_profile_id for event in keyed},
+            idempotency_key__in={event.idempotency_key for event in keyed},
+        ).values_list('user_profile_id', 'idempotency_key')
+    )
+    fresh = []
+    for event in events:
+        if event.idempotency_key:
+            pair = (event.user_profile_id, event.idempotency_key)
+            if pair in seen:
+                continue
+            seen.add(pair)
+        fresh.append(event)
+
+    try:
+        with transaction.atomic():
+            XPEvent.objects.bulk_create(fresh)
+        return fresh
+    except IntegrityError:
+        # A concurrent award claimed one of the keys; settle row by row.
+        recorded = []
+        for event in fresh:
+            try:
+                with transaction.atomic():
+                    event.save()
+            except IntegrityError:
+                continue
+            recorded.append(event)
+        return recorded
+
+
+def award_xp_batch(awards):
+    """
+    Apply many ``(user_profile_id, amount, source, idempotency_key)``
+    awards: one INSERT for the ledger and one UPDATE per profile. Returns
+    the number of awards applied; repeated keys are skipped.
+    """
+    events = [
+        XPEvent(user_profile_id=profile_id, amount=amount, source=source, idempotency_key=key or None)
+        for profile_id, amount, source, key in awards
+    ]
+    with transaction.atomic():
+        recorded = _record(events)
+        _trim_debits(recorded)
+        totals = defaultdict(int)
+        for event in recorded:
+            totals[event.user_profile_id] += event.amount
+        _apply_totals(totals)
+
+    owners = UserProfile.objects.filter(pk__in=totals).values_list('user_id', flat=True)
+    for user_id in owners:
+        bump_version(user_id, 'profiles')
+    return len(recorded)
+
+
+def award_xp(profile, amount, source, idempotency_key=None):
+    """Award XP to one profile. Returns ``False`` if the key was already used."""
+    return bool(award_xp_batch([(profile.pk, amount, source, idempotency_key)]))
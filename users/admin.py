@@ -1,8 +1,9 @@
 from django.contrib import admin
 from axes.models import AccessAttempt, AccessLog
-from .models import User
+from .models import User, OutgoingEmail
 
 admin.site.register(User)
+admin.site.register(OutgoingEmail)
 
 try:
     admin.site.register(AccessAttempt)
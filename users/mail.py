@@ -0,0 +1,70 @@
+from functools import lru_cache
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.template.loader import get_template
+
+FLUSH_SCHEDULED_KEY = 'users:email_flush_scheduled'
+
+
+@lru_cache(maxsize=None)
+def get_email_template(name):
+    """Compiled template for ``name``, loaded and parsed once per process."""
+    return get_template(name)
+
+
+def render_email(template_name, context):
+    return get_email_template(template_name).render(context)
+
+
+def schedule_email_flush():
+    """
+    Queue one ``send_queued_emails`` run a few seconds out, unless one is
+    already pending, so emails queued close together share a connection.
+    """
+    from .tasks import send_queued_emails
+
+    delay = settings.EMAIL_QUEUE_FLUSH_DELAY
+    if cache.add(FLUSH_SCHEDULED_KEY, 1, delay):
+        send_queued_emails.apply_async(countdown=delay)
+
+
+def queue_email(to_email, subject, body, html_body='', user=None, dedup_key=None):
+    """
+    Write an email to the outbox in the current transaction; it is relayed
+    shortly after commit. With ``dedup_key``, an email already queued
+    under that key is returned instead of queuing another.
+    """
+    from .models import OutgoingEmail
+
+    fields = dict(user=user, to_email=to_email, subject=subject, body=body, html_body=html_body)
+    if dedup_key is None:
+        email = OutgoingEmail.objects.create(**fields)
+    else:
+        try:
+            with transaction.atomic():
+                email = OutgoingEmail.objects.create(dedup_key=dedup_key, **fields)
+        except IntegrityError:
+            return OutgoingEmail.objects.get(dedup_key=dedup_key)
+    transaction.on_commit(schedule_email_flush)
+    return email
+
+
+def retry_delay(attempts):
+    """Seconds to wait before attempt ``attempts + 1``: exponential, capped."""
+    return min(settings.EMAIL_OUTBOX_RETRY_BASE * 2 ** (attempts - 1), settings.EMAIL_OUTBOX_RETRY_MAX)
+
+
+def build_message(email, connection):
+    from django.core.mail import EmailMultiAlternatives
+
+    message = EmailMultiAlternatives(
+        subject=email.subject,
+        body=email.body,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[email.to_email],
+        connection=connection,
+    )
+    if email.html_body:
+        message.attach_alternative(email.html_body, 'text/html')
+    return message
@@ -1,9 +1,7 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.utils.translation import gettext_lazy as _
-from django.core.mail import send_mail
 from django.conf import settings
-from django.template.loader import render_to_string
 import uuid
 from django.utils import timezone
 
@@ -15,6 +13,10 @@ class User(AbstractUser):
     name = models.CharField(_('full name'), max_length=255)
     avatar = models.ImageField(_('avatar'), upload_to='avatars/', null=True, blank=True)
     bio = models.TextField(_('bio'), blank=True)
+    email_digest = models.BooleanField(
+        _('email digest'), default=False,
+        help_text=_('Receive one daily summary instead of an email per notification.')
+    )
     created_at = models.DateTimeField(_('created at'), default=timezone.now)
     updated_at = models.DateTimeField(_('updated at'), auto_now=True)
     
@@ -33,24 +35,73 @@ class User(AbstractUser):
     def __str__(self):
         return self.email
 
-    def send_verification_email(self):
-        from django.conf import settings
+    def queue_verification_email(self, rotate_token=False):
+        """
+        Write the verification email to the outbox in the caller's
+        transaction; the relay task delivers it after commit. Only the
+        token and timestamp columns are updated.
+        """
         from uuid import uuid4
+        from .mail import queue_email, render_email
 
-        self.email_verification_token = uuid4().hex
-        self.save()
+        fields = {'email_verification_sent_at': timezone.now()}
+        if rotate_token or not self.email_verification_token:
+            fields['email_verification_token'] = uuid4().hex
+        User.objects.filter(pk=self.pk).update(**fields)
+        for name, value in fields.items():
+            setattr(self, name, value)
 
         context = {
             'name': self.name,
             'token': self.email_verification_token
         }
-
-        message = render_to_string('email/verification.html', context)
-
-        send_mail(
+        return queue_email(
+            self.email,
             'Verify your email',
-            '',
-            settings.EMAIL_HOST_USER,
-            [self.email],
-            html_message=message
+            f'Verify your email with this token: {self.email_verification_token}',
+            html_body=render_email('email/verification.html', context),
+            user=self,
+            dedup_key=f'verify-email:{self.pk}:{self.email_verification_token}',
         )
+
+class OutgoingEmail(models.Model):
+    """
+    Transactional outbox: an email is a row written in the same database
+    transaction as the change that caused it, so requests never wait on
+    SMTP. ``users.tasks.send_queued_emails`` relays the rows in batches
+    over one connection, retrying failures with exponential backoff.
+    """
+    STATUS_CHOICES = (
+        ('pending', _('Pending')),
+        ('sending', _('Sending')),
+        ('sent', _('Sent')),
+        ('failed', _('Failed')),
+    )
+
+    user = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, related_name='outgoing_emails'
+    )
+    to_email = models.EmailField(_('to'))
+    subject = models.CharField(_('subject'), max_length=255)
+    body = models.TextField(_('body'))
+    html_body = models.TextField(_('HTML body'), blank=True)
+    status = models.CharField(_('status'), max_length=10, choices=STATUS_CHOICES, default='pending')
+    dedup_key = models.CharField(
+        _('deduplication key'), max_length=255, null=True, blank=True, unique=True,
+        help_text=_('Queuing a second email with the same key is a no-op.')
+    )
+    attempts = models.PositiveSmallIntegerField(_('attempts'), default=0)
+    next_attempt_at = models.DateTimeField(_('next attempt at'), default=timezone.now)
+    last_error = models.TextField(_('last error'), blank=True)
+    created_at = models.DateTimeField(_('created at'), auto_now_add=True)
+    sent_at = models.DateTimeField(_('sent at'), null=True, blank=True)
+
+    class Meta:
+        verbose_name = _('outgoing email')
+        verbose_name_plural = _('outgoing emails')
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f'{self.subject} -> {self.to_email}'
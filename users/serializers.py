@@ -41,5 +41,5 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
 class UserProfileSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
-        fields = ('email', 'username', 'name', 'avatar')
+        fields = ('email', 'username', 'name', 'avatar', 'email_digest')
         read_only_fields = ('email',)
\ No newline at end of file
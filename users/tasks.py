@@ -0,0 +1,102 @@
+import logging
+from datetime import timedelta
+from smtplib import SMTPException
+from celery import shared_task
+from django.conf import settings
+from django.core.mail import get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .mail import build_message, retry_delay
+from .models import OutgoingEmail
+
+logger = logging.getLogger(__name__)
+
+
+def _claim_batch(after_id, batch_size):
+    """
+    Lease the next due emails to this run. They are marked ``sending`` for
+    ``EMAIL_OUTBOX_LEASE`` seconds and the lock is released at once, so SMTP
+    round trips happen outside any transaction; concurrent runs skip leased
+    rows, and rows left behind by a run that died are retried once it lapses.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        batch = list(
+            OutgoingEmail.objects.select_for_update(skip_locked=True)
+            .filter(status__in=('pending', 'sending'), next_attempt_at__lte=now, id__gt=after_id)
+            .order_by('id')[:batch_size]
+        )
+        OutgoingEmail.objects.filter(id__in=[email.id for email in batch]).update(
+            status='sending', next_attempt_at=now + timedelta(seconds=settings.EMAIL_OUTBOX_LEASE)
+        )
+    return batch
+
+
+def _record_failure(email, error, permanent=False):
+    """Schedule the next attempt with backoff, or give up after ``EMAIL_OUTBOX_MAX_ATTEMPTS``."""
+    email.attempts += 1
+    email.last_error = str(error)[:1000]
+    if permanent or email.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+        email.status = 'failed'
+    else:
+        email.status = 'pending'
+        email.next_attempt_at = timezone.now() + timedelta(seconds=retry_delay(email.attempts))
+
+
+def _send_batch(connection, batch):
+    delivered, errors = [], []
+    for email in batch:
+        try:
+            connection.send_messages([build_message(email, connection)])
+        except ValueError as e:
+            # BadHeaderError or a malformed address: retrying cannot help.
+            logger.warning('Dropping unsendable email %s: %s', email.id, e)
+            _record_failure(email, e, permanent=True)
+            errors.append(email)
+        except (SMTPException, OSError) as e:
+            logger.warning('Could not send email %s to %s: %s', email.id, email.to_email, e)
+            _record_failure(email, e)
+            errors.append(email)
+        else:
+            delivered.append(email.id)
+    OutgoingEmail.objects.filter(id__in=delivered).update(
+        status='sent', sent_at=timezone.now(), attempts=F('attempts') + 1
+    )
+    OutgoingEmail.objects.bulk_update(errors, ['status', 'attempts', 'next_attempt_at', 'last_error'])
+    return len(delivered), len(errors)
+
+
+# Not retried by Celery: anything a failed run leaves behind is due again
+# for the next ``send-queued-emails`` beat run.
+@shared_task
+def send_queued_emails():
+    """
+    Relay the outbox in batches, sending every message of a run over one
+    SMTP connection instead of connecting once per email.
+    """
+    sent = failed = 0
+    batch = _claim_batch(0, settings.EMAIL_QUEUE_BATCH_SIZE)
+    if not batch:
+        return 'Sent 0 emails, 0 failed'
+
+    connection = get_connection()
+    try:
+        connection.open()
+    except (SMTPException, OSError):
+        # The server is unreachable: hand the batch straight back.
+        OutgoingEmail.objects.filter(id__in=[email.id for email in batch]).update(
+            status='pending', next_attempt_at=timezone.now()
+        )
+        raise
+    with connection:
+        for n in range(settings.EMAIL_QUEUE_MAX_BATCHES):
+            if n:
+                # Walking forward by id means a run attempts each email at most once.
+                batch = _claim_batch(batch[-1].id, settings.EMAIL_QUEUE_BATCH_SIZE)
+                if not batch:
+                    break
+            delivered, errors = _send_batch(connection, batch)
+            sent += delivered
+            failed += errors
+    return f'Sent {sent} emails, {failed} failed'
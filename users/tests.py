@@ -1,3 +1,173 @@
-from django.test import TestCase
+from datetime import timedelta
+from smtplib import SMTPException
+from unittest import mock
+from django.core import mail
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from .mail import get_email_template, queue_email
+from .models import OutgoingEmail, User
+from .tasks import send_queued_emails
 
-# Create your tests here.
+
+class OutgoingEmailTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='mailer', email='mailer@example.com', password='testpass123'
+        )
+
+    def test_queue_sends_over_one_connection(self):
+        """Test queued emails are sent together over a single connection."""
+        with mock.patch('users.tasks.send_queued_emails.apply_async') as flush:
+            with self.captureOnCommitCallbacks(execute=True):
+                for i in range(3):
+                    queue_email(f'user{i}@example.com', f'Subject {i}', 'body', html_body='<p>body</p>')
+        # Emails queued together schedule a single flush.
+        self.assertEqual(flush.call_count, 1)
+
+        with mock.patch('users.tasks.get_connection', wraps=mail.get_connection) as get_connection:
+            self.assertEqual(send_queued_emails(), 'Sent 3 emails, 0 failed')
+        get_connection.assert_called_once()
+        self.assertEqual([m.subject for m in mail.outbox], ['Subject 0', 'Subject 1', 'Subject 2'])
+        self.assertEqual(mail.outbox[0].alternatives[0][1], 'text/html')
+        self.assertFalse(OutgoingEmail.objects.filter(status='pending').exists())
+
+    @override_settings(EMAIL_QUEUE_BATCH_SIZE=2)
+    def test_failures_are_recorded(self):
+        """Test one failing message does not stop the rest of the run."""
+        for i in range(3):
+            OutgoingEmail.objects.create(to_email=f'user{i}@example.com', subject=f'Subject {i}', body='body')
+
+        connection = mock.MagicMock()
+        connection.__enter__.return_value = connection
+        connection.send_messages.side_effect = [1, SMTPException('mailbox unavailable'), 1]
+        with mock.patch('users.tasks.get_connection', return_value=connection):
+            self.assertEqual(send_queued_emails(), 'Sent 2 emails, 1 failed')
+
+        retry = OutgoingEmail.objects.get(status='pending')
+        self.assertEqual((retry.subject, retry.attempts), ('Subject 1', 1))
+        self.assertIn('mailbox unavailable', retry.last_error)
+        self.assertGreater(retry.next_attempt_at, timezone.now())
+
+    @override_settings(EMAIL_OUTBOX_MAX_ATTEMPTS=2, EMAIL_OUTBOX_RETRY_BASE=0)
+    def test_retries_back_off_then_give_up(self):
+        """Test a failing email is retried until it runs out of attempts."""
+        email = OutgoingEmail.objects.create(to_email='user@example.com', subject='Subject', body='body')
+        connection = mock.MagicMock()
+        connection.__enter__.return_value = connection
+        connection.send_messages.side_effect = SMTPException('try later')
+        with mock.patch('users.tasks.get_connection', return_value=connection):
+            send_queued_emails()
+            email.refresh_from_db()
+            self.assertEqual((email.status, email.attempts), ('pending', 1))
+            send_queued_emails()
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), ('failed', 2))
+
+    def test_idle_run_does_not_connect(self):
+        """Test a run with nothing due returns before opening an SMTP connection."""
+        OutgoingEmail.objects.create(
+            to_email='later@example.com', subject='Later', body='body',
+            next_attempt_at=timezone.now() + timedelta(minutes=5)
+        )
+        with mock.patch('users.tasks.get_connection') as get_connection:
+            self.assertEqual(send_queued_emails(), 'Sent 0 emails, 0 failed')
+        get_connection.assert_not_called()
+
+    def test_emails_are_leased_while_sending(self):
+        """Test claimed rows are marked as sending, and a lapsed lease is picked up again."""
+        email = OutgoingEmail.objects.create(to_email='a@example.com', subject='Subject', body='body')
+        statuses = []
+        connection = mock.MagicMock()
+        connection.__enter__.return_value = connection
+        connection.send_messages.side_effect = lambda messages: statuses.append(
+            OutgoingEmail.objects.values_list('status', flat=True).get(pk=email.pk)
+        )
+        with mock.patch('users.tasks.get_connection', return_value=connection):
+            send_queued_emails()
+        self.assertEqual(statuses, ['sending'])
+
+        leased = OutgoingEmail.objects.create(
+            to_email='b@example.com', subject='Leased', body='body', status='sending',
+            next_attempt_at=timezone.now() + timedelta(minutes=5)
+        )
+        self.assertEqual(send_queued_emails(), 'Sent 0 emails, 0 failed')
+        OutgoingEmail.objects.filter(pk=leased.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(send_queued_emails(), 'Sent 1 emails, 0 failed')
+
+    def test_unreachable_server_releases_the_batch(self):
+        """Test emails claimed by a run that cannot connect are due again for the next run."""
+        email = OutgoingEmail.objects.create(to_email='a@example.com', subject='Subject', body='body')
+        connection = mock.MagicMock()
+        connection.open.side_effect = OSError('connection refused')
+        with mock.patch('users.tasks.get_connection', return_value=connection):
+            with self.assertRaises(OSError):
+                send_queued_emails()
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), ('pending', 0))
+        self.assertLessEqual(email.next_attempt_at, timezone.now())
+
+    def test_unsendable_email_does_not_block_the_batch(self):
+        """Test a bad header fails its own row without rolling back delivered ones."""
+        OutgoingEmail.objects.create(to_email='a@example.com', subject='Fine', body='body')
+        poison = OutgoingEmail.objects.create(to_email='b@example.com', subject='Bad\nBcc: x@example.com', body='body')
+        OutgoingEmail.objects.create(to_email='c@example.com', subject='Also fine', body='body')
+
+        self.assertEqual(send_queued_emails(), 'Sent 2 emails, 1 failed')
+        self.assertEqual([m.subject for m in mail.outbox], ['Fine', 'Also fine'])
+        poison.refresh_from_db()
+        self.assertEqual((poison.status, poison.attempts), ('failed', 1))
+        self.assertEqual(OutgoingEmail.objects.filter(status='sent').count(), 2)
+
+    def test_send_email_view_is_staff_only_and_validated(self):
+        """Test the ad-hoc email endpoint rejects anonymous callers and header injection."""
+        url = '/api/send-email/'
+        payload = {'subject': 'Hello', 'message': 'Hi', 'recipient': 'someone@example.com'}
+        self.assertIn(self.client.post(url, payload).status_code, (401, 403))
+
+        staff = User.objects.create_user(
+            username='ops', email='ops@example.com', password='testpass123', is_staff=True
+        )
+        from rest_framework.test import APIClient
+        self.client = APIClient()
+        self.client.force_authenticate(user=staff)
+        bad = self.client.post(url, {**payload, 'subject': 'Hi\r\nBcc: x@example.com'})
+        self.assertEqual(bad.status_code, 400)
+        self.assertEqual(self.client.post(url, {**payload, 'recipient': 'not-an-address'}).status_code, 400)
+
+        with mock.patch('users.tasks.send_queued_emails.apply_async'):
+            response = self.client.post(url, payload)
+        self.assertEqual(response.status_code, 202)
+        self.assertTrue(OutgoingEmail.objects.filter(to_email='someone@example.com').exists())
+
+    def test_dedup_key(self):
+        """Test queuing twice under one key writes a single row."""
+        first = queue_email('a@example.com', 'Subject', 'body', dedup_key='welcome:1')
+        second = queue_email('a@example.com', 'Subject', 'body', dedup_key='welcome:1')
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(OutgoingEmail.objects.count(), 1)
+
+    def test_registration_does_not_wait_on_smtp(self):
+        """Test signup writes the verification email to the outbox and relays it after commit."""
+        data = {
+            'email': 'new@example.com', 'username': 'newbie', 'name': 'New User',
+            'password': 'Str0ng-passphrase!', 'password2': 'Str0ng-passphrase!'
+        }
+        with mock.patch('users.tasks.send_queued_emails.apply_async'):
+            with mock.patch('users.tasks.get_connection') as get_connection:
+                response = self.client.post('/api/users/register/', data, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        get_connection.assert_not_called()
+
+        user = User.objects.get(email='new@example.com')
+        email = OutgoingEmail.objects.get(user=user)
+        self.assertIn(user.email_verification_token, email.html_body)
+        self.assertIsNotNone(user.email_verification_sent_at)
+
+        send_queued_emails()
+        self.assertEqual(mail.outbox[0].to, ['new@example.com'])
+
+    def test_templates_are_compiled_once(self):
+        """Test repeated renders reuse the compiled template."""
+        self.assertIs(get_email_template('email/notification.html'), get_email_template('email/notification.html'))
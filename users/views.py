@@ -1,5 +1,6 @@
 import logging
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from django.utils import timezone
 from rest_framework import generics, status, viewsets, permissions
 from rest_framework.response import Response
@@ -58,8 +59,10 @@ class UserRegistrationView(generics.CreateAPIView):
     permission_classes = [AllowAny]
 
     def perform_create(self, serializer):
-        user = serializer.save()
-        user.send_verification_email()
+        # The user and its verification email commit together; SMTP happens later.
+        with transaction.atomic():
+            user = serializer.save()
+            user.queue_verification_email()
 
 
 class UserProfileView(generics.RetrieveUpdateAPIView):
@@ -108,5 +111,5 @@ class UserViewSet(viewsets.ModelViewSet):
             if time_since_last.total_seconds() < 300:
                 return Response({'error': 'Please wait before requesting another verification email'}, status=status.HTTP_429_TOO_MANY_REQUESTS)
 
-        user.send_verification_email()
+        user.queue_verification_email(rotate_token=True)
         return Response({'status': 'Verification email sent'})
\ No newline at end of file